@@ -0,0 +1,146 @@
+import contextlib
+import math
+import os
+import threading
+import time
+
+import database as db
+
+# 下單流量管制 (設定 ADMISSION_ENABLED=false 可關閉)
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+# 每個資料庫分片 (主辦者) 每秒可寫入的訂單數與可累積的突發量
+ADMISSION_GLOBAL_RATE = float(os.environ.get("ADMISSION_GLOBAL_RATE", "20"))
+ADMISSION_GLOBAL_BURST = float(os.environ.get("ADMISSION_GLOBAL_BURST", "40"))
+# 每個使用者 (session) 每秒可送出的次數與可累積的突發量
+ADMISSION_SESSION_RATE = float(os.environ.get("ADMISSION_SESSION_RATE", "0.5"))
+ADMISSION_SESSION_BURST = float(os.environ.get("ADMISSION_SESSION_BURST", "3"))
+# 每個分片同時寫入的上限，超過時排隊等候
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "4"))
+# 排隊人數上限與最長等候秒數，超過時請使用者稍後再試
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "50"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "5"))
+
+
+class AdmissionRejected(Exception):
+    """流量過高，請求未被受理"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"請於 {self.retry_after} 秒後再試")
+
+
+class TokenBucket:
+    """令牌桶：每秒補充 rate 個令牌，最多累積 burst 個"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> float:
+        """取得一個令牌，成功回傳 0，否則回傳還需等待的秒數"""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+_cond = threading.Condition()
+# 主辦者 -> {"bucket": 全域令牌桶, "active": 寫入中, "waiting": 排隊中}
+_shards = {}
+# (主辦者, session 識別) -> 令牌桶
+_session_buckets = {}
+_metrics = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+
+def _shard(tenant: str) -> dict:
+    if tenant not in _shards:
+        _shards[tenant] = {
+            "bucket": TokenBucket(ADMISSION_GLOBAL_RATE, ADMISSION_GLOBAL_BURST), "active": 0, "waiting": 0,
+        }
+    return _shards[tenant]
+
+
+def _session_bucket(key: tuple, now: float) -> TokenBucket:
+    bucket = _session_buckets.get(key)
+    if bucket is None:
+        # 清除已補滿的令牌桶，避免無限成長
+        if len(_session_buckets) > 1000:
+            for k, b in list(_session_buckets.items()):
+                b.refill(now)
+                if b.tokens >= b.burst:
+                    del _session_buckets[k]
+        bucket = _session_buckets[key] = TokenBucket(ADMISSION_SESSION_RATE, ADMISSION_SESSION_BURST)
+    return bucket
+
+
+def _reject(counter: str, retry_after: float):
+    _metrics[counter] += 1
+    raise AdmissionRejected(retry_after)
+
+
+@contextlib.contextmanager
+def admit(session_key: str = None, tenant: str = None):
+    """在寫入前取得許可：超過個人頻率立即拒絕；分片忙碌時排隊等候，
+    排隊已滿或等候逾時則拋出 AdmissionRejected (含建議的重試秒數)
+    """
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    tenant = tenant or db.get_tenant()
+    with _cond:
+        now = time.monotonic()
+        shard = _shard(tenant)
+        if session_key is not None:
+            wait = _session_bucket((tenant, session_key), now).try_take(now)
+            if wait:
+                _reject("rejected", wait)
+
+        deadline = now + ADMISSION_QUEUE_TIMEOUT
+        queued = False
+        try:
+            while True:
+                wait = None
+                if shard["active"] < ADMISSION_MAX_CONCURRENT:
+                    wait = shard["bucket"].try_take(now)
+                    if not wait:
+                        break
+                if not queued:
+                    if shard["waiting"] >= ADMISSION_MAX_QUEUE:
+                        _reject("rejected", (shard["waiting"] + 1) / ADMISSION_GLOBAL_RATE)
+                    shard["waiting"] += 1
+                    _metrics["queued"] += 1
+                    queued = True
+                remaining = deadline - now
+                if remaining <= 0:
+                    _reject("timed_out", (shard["waiting"] + 1) / ADMISSION_GLOBAL_RATE)
+                # 等候令牌補充或其他寫入完成
+                _cond.wait(min(remaining, wait) if wait else remaining)
+                now = time.monotonic()
+        finally:
+            if queued:
+                shard["waiting"] -= 1
+        shard["active"] += 1
+        _metrics["admitted"] += 1
+    try:
+        yield
+    finally:
+        with _cond:
+            shard["active"] -= 1
+            _cond.notify_all()
+
+
+def metrics() -> dict:
+    """流量管制統計：累計受理 / 排隊 / 拒絕 / 逾時次數，以及目前寫入中與排隊中的數量"""
+    with _cond:
+        return dict(
+            _metrics,
+            active=sum(s["active"] for s in _shards.values()),
+            waiting=sum(s["waiting"] for s in _shards.values()),
+        )
@@ -1,18 +1,65 @@
+import functools
+import os
+import uuid
 import streamlit as st
+import admission
+import backup
 import database as db
-import pandas as pd
+import tenants
 from datetime import datetime, timedelta
 
-# 老闆密碼
-BOSS_PASSWORD = "123456"
+# 即時儀表板更新間隔秒數
+LIVE_REFRESH_SECONDS = float(os.environ.get("LIVE_REFRESH_SECONDS", "5"))
 
-# 初始化資料庫
-db.init_db()
+
+@st.cache_resource
+def load_tenants():
+    """讀取主辦者設定 (每個程序只讀取一次)"""
+    return tenants.load_tenants()
+
+
+TENANTS = load_tenants()
+
+
+@st.cache_resource
+def bootstrap_database():
+    """初始化所有主辦者的資料庫 (每個程序只執行一次，結構已是最新時 init_db 會直接略過)"""
+    tenants.init_all(TENANTS)
+
+
+bootstrap_database()
+
+
+@st.cache_resource
+def start_backup_scheduler():
+    """設定 BACKUP_INTERVAL_MINUTES 時啟動定期備份 (每個程序只啟動一次)"""
+    interval = os.environ.get("BACKUP_INTERVAL_MINUTES")
+    if interval:
+        return backup.start_backup_scheduler(float(interval), tenants=list(TENANTS))
+    return None
+
+
+start_backup_scheduler()
+
+
+@st.cache_resource
+def start_purge_worker():
+    """啟動背景清除已刪除資料 (每個程序只啟動一次)"""
+    return db.start_purge_worker(tenants=list(TENANTS))
+
+
+start_purge_worker()
 
 # 頁面設定
 st.set_page_config(page_title="團購訂單系統", layout="wide")
 
-st.title("團購訂單系統")
+# 主辦者由網址參數 ?tenant=<代號> 決定，未指定時為預設主辦者
+tenant = st.query_params.get("tenant", db.DEFAULT_TENANT)
+if tenant not in TENANTS:
+    st.error("找不到此團購主辦者，請確認網址是否正確")
+    st.stop()
+
+st.title(TENANTS[tenant]["name"])
 
 # 初始化 session state
 if "boss_authenticated" not in st.session_state:
@@ -21,10 +68,468 @@ if "new_items" not in st.session_state:
     st.session_state.new_items = []
 if "editing_order_id" not in st.session_state:
     st.session_state.editing_order_id = None
+if "editing_order_version" not in st.session_state:
+    st.session_state.editing_order_version = None
+if "editing_order_details" not in st.session_state:
+    st.session_state.editing_order_details = []
+if "order_conflict_id" not in st.session_state:
+    st.session_state.order_conflict_id = None
 if "editing_group_order_id" not in st.session_state:
     st.session_state.editing_group_order_id = None
 if "edit_items" not in st.session_state:
     st.session_state.edit_items = []
+if "cloning_group_order_id" not in st.session_state:
+    st.session_state.cloning_group_order_id = None
+if "db_session_key" not in st.session_state:
+    st.session_state.db_session_key = uuid.uuid4().hex
+
+# 切換主辦者時需重新登入
+if st.session_state.get("tenant") != tenant:
+    st.session_state.tenant = tenant
+    st.session_state.boss_authenticated = False
+
+
+def bind_db_context():
+    """讓資料庫層知道目前的主辦者 (連線分片) 及 session (寫入後的讀取改走主資料庫)"""
+    db.set_tenant(st.session_state.tenant)
+    db.set_session(st.session_state.db_session_key)
+
+
+bind_db_context()
+
+
+def item_import_widget(key: str, existing_names):
+    """品項檔案匯入元件，按下匯入後回傳 (items, errors)，否則回傳 None"""
+    report = st.session_state.pop(f"import_report_{key}", None)
+    if report:
+        imported, errors = report
+        if imported:
+            st.success(f"已匯入 {imported} 個品項")
+        if errors:
+            with st.expander(f"{len(errors)} 列未匯入", expanded=not imported):
+                st.write("\n".join(f"- {e}" for e in errors[:200]))
+                if len(errors) > 200:
+                    st.write(f"...其餘 {len(errors) - 200} 列省略")
+    
+    uploaded = st.file_uploader(
+        "匯入品項檔案 (CSV / XLSX，需含「品項」、「價格」欄位)",
+        type=["csv", "xlsx"],
+        key=f"import_file_{key}"
+    )
+    if uploaded is not None and st.button("匯入品項", key=f"import_btn_{key}"):
+        import item_import
+        items, errors = item_import.parse_item_file(uploaded.name, uploaded.getvalue(), existing_names)
+        st.session_state[f"import_report_{key}"] = (len(items), errors)
+        return items, errors
+    return None
+
+
+def clone_group_order_form(order, key: str):
+    """複製團購單表單 (沿用原品項，可設定新日期與價格調整)"""
+    st.write("**複製團購單**")
+    clone_title = st.text_input("新團購單名稱", value=f"{order['title']} (複製)", key=f"clone_title_{key}")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        clone_start = st.date_input("開始日期", value=datetime.now().date(), key=f"clone_start_{key}")
+    with col2:
+        clone_end = st.date_input("結束日期", value=(datetime.now() + timedelta(days=7)).date(), key=f"clone_end_{key}")
+    with col3:
+        clone_pct = st.number_input("價格調整 (%)", min_value=-90.0, max_value=500.0, value=0.0, step=5.0,
+                                    key=f"clone_pct_{key}")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("確認複製", key=f"clone_confirm_{key}", type="primary"):
+            if not clone_title:
+                st.error("請輸入團購單名稱")
+            else:
+                db.clone_group_order(order['id'], clone_start.strftime("%Y-%m-%d"), clone_end.strftime("%Y-%m-%d"),
+                                     title=clone_title, price_adjust_pct=clone_pct)
+                st.session_state.cloning_group_order_id = None
+                st.rerun()
+    with col2:
+        if st.button("取消", key=f"clone_cancel_{key}"):
+            st.session_state.cloning_group_order_id = None
+            st.rerun()
+
+
+def db_fragment(func=None, *, run_every=None):
+    """st.fragment 包裝：片段重跑在新的執行緒執行，需重新設定資料庫主辦者及 session"""
+    if func is None:
+        return functools.partial(db_fragment, run_every=run_every)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bind_db_context()
+        return func(*args, **kwargs)
+    return st.fragment(wrapper, run_every=run_every)
+
+
+def set_paid_status(customer_order_id: int, key: str):
+    """已取貨付款勾選框的回呼"""
+    bind_db_context()
+    db.update_customer_order_paid_status(customer_order_id, 1 if st.session_state[key] else 0)
+
+
+def start_editing_order(customer_order_id: int):
+    """進入訂單編輯模式，記錄開始編輯時的版本及明細 (讀取主資料庫，不使用可能落後的副本)"""
+    bind_db_context()
+    loaded = db.get_customer_order_for_edit(customer_order_id)
+    if loaded is None:
+        return
+    order, details = loaded
+    st.session_state.editing_order_id = customer_order_id
+    st.session_state.editing_order_version = order['version']
+    st.session_state.editing_order_details = [dict(d) for d in details]
+
+
+def editing_order_lines() -> dict:
+    """編輯中訂單的原明細 {品項編號: (數量, 金額)}，金額以下單時的單價計算"""
+    lines = {}
+    for d in st.session_state.editing_order_details:
+        qty, amount = lines.get(d['item_id'], (0, 0))
+        lines[d['item_id']] = (qty + d['quantity'], amount + d['quantity'] * d['unit_price'])
+    return lines
+
+
+def edit_line_price(item: dict, qty: int, original: dict) -> tuple:
+    """編輯時品項的單價及小計 (與儲存結果一致)：數量未變沿用下單時的單價，新增或變更數量以目前價格計算"""
+    original_qty, original_amount = original.get(item['id'], (0, 0))
+    if qty > 0 and qty == original_qty:
+        return original_amount / original_qty, original_amount
+    return item['price'], qty * item['price']
+
+
+def stop_editing_order():
+    """離開訂單編輯模式"""
+    st.session_state.editing_order_id = None
+
+
+@st.cache_data(max_entries=64)
+def load_group_order_statistics(group_order_id: int, revision: tuple) -> dict:
+    """訂單統計 (單次讀取明細後以 pandas 計算；revision 相同時直接使用快取)"""
+    import stats
+    return stats.group_order_statistics(group_order_id)
+
+
+@st.cache_data(max_entries=64)
+def build_order_detail_csv(group_order_id: int, revision: tuple) -> bytes:
+    """產生訂單明細 CSV (revision 相同時直接使用快取)"""
+    detail_df = load_group_order_statistics(group_order_id, revision)["detail"]
+    # 使用 BOM 確保 Excel 正確顯示中文
+    csv_buffer = '\ufeff' + detail_df.to_csv(index=True, encoding='utf-8')
+    return csv_buffer.encode('utf-8')
+
+
+@st.cache_data(max_entries=16)
+def build_pick_list(group_order_id: int, revision: tuple, title: str, by: str, fmt: str) -> bytes:
+    """產生揀貨單 (revision 相同時直接使用快取)"""
+    import picklist
+    if fmt == "html":
+        chunks = picklist.iter_pick_list_html(group_order_id, title, by)
+    else:
+        chunks = picklist.iter_pick_list_csv(group_order_id, by)
+    return "".join(chunks).encode('utf-8')
+
+
+@db_fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_dashboard(group_order_id: int):
+    """即時儀表板 (片段：定時只讀取新的變更並套用到統計)"""
+    import live_stats
+    summary = st.session_state.get("live_summary")
+    if summary is None or summary["group_order_id"] != group_order_id or summary["tenant"] != db.get_tenant():
+        summary = live_stats.load_live_summary(group_order_id)
+    else:
+        summary = live_stats.apply_changes(summary)
+    st.session_state.live_summary = summary
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("訂單數", sum(summary["count"].values()))
+    col2.metric("總金額", f"${sum(summary['amount'].values()):,.0f}")
+    col3.metric(f"已付款 ({summary['count'][True]} 筆)", f"${summary['amount'][True]:,.0f}")
+    col4.metric(f"未付款 ({summary['count'][False]} 筆)", f"${summary['amount'][False]:,.0f}")
+    
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        st.dataframe(
+            [
+                {"品項": item["name"], "數量": summary["item_qty"][item_id],
+                 "金額": summary["item_amount"][item_id]}
+                for item_id, item in summary["items"].items()
+            ],
+            use_container_width=True, hide_index=True
+        )
+    with col2:
+        st.write("**最近動態**")
+        if summary["recent"]:
+            for e in summary["recent"][:10]:
+                st.caption(f"{e['created_at']}　{e['event']}　{e['customer_name']}")
+        else:
+            st.caption("開啟後尚無新的變更")
+    st.caption(f"每 {LIVE_REFRESH_SECONDS:g} 秒自動更新，最後更新 {datetime.now().strftime('%H:%M:%S')}")
+
+
+@db_fragment
+def item_buyers_section(statistics: dict):
+    """品項購買明細 (片段：篩選只重跑此區塊)"""
+    import pandas as pd
+    st.write("### 品項購買明細")
+    keyword = st.text_input("篩選品項", placeholder="輸入品項名稱", key="item_buyers_filter")
+    for s in statistics["summary"].itertuples(index=False):
+        if keyword and keyword not in s.item_name:
+            continue
+        with st.expander(f"{s.item_name} - 共 {int(s.total_qty)} 份"):
+            buyers_df = statistics["buyers"].get(s.item_id)
+            if buyers_df is not None:
+                buyers_df = buyers_df.copy()
+                buyers_df.columns = ['顧客姓名', '數量', '小計']
+                buyers_df.index = pd.RangeIndex(1, len(buyers_df) + 1)
+                st.dataframe(buyers_df, use_container_width=True)
+            else:
+                st.info("尚無人購買此品項")
+
+
+@db_fragment
+def admin_customer_order_block(customer_order_id: int, group_order_id: int, preloaded: dict = None):
+    """管理後台的單筆顧客訂單 (片段：勾選付款、編輯數量只重跑此區塊)
+    preloaded: 整頁執行時一次讀取的 {訂單編號: (訂單, 明細)}，只使用一次；片段自己重跑時重新讀取此筆訂單
+    """
+    import pandas as pd
+    loaded = preloaded.pop(customer_order_id, None) if preloaded else None
+    if loaded is not None:
+        co, details = loaded
+    else:
+        co = db.get_customer_order_by_id(customer_order_id)
+        if co is None:
+            return
+        details = db.get_order_details(co['id'])
+    
+    # 顯示付款狀態標記
+    paid_status = "✅ " if co['is_paid'] else ""
+    with st.expander(f"{paid_status}{co['customer_name']} - ${co['total_amount']:,.0f}"):
+        # 取貨付款勾選框
+        st.checkbox(
+            "已取貨付款",
+            value=bool(co['is_paid']),
+            key=f"paid_{co['id']}",
+            on_change=set_paid_status,
+            args=(co['id'], f"paid_{co['id']}")
+        )
+        
+        # 顯示備註
+        if co['note']:
+            st.info(f"備註：{co['note']}")
+        
+        # 檢查是否正在編輯此訂單
+        if st.session_state.editing_order_id == co['id']:
+            # 編輯模式
+            items = db.get_items_by_group_order(group_order_id)
+            original_lines = editing_order_lines()
+            
+            edit_quantities = {}
+            edit_total = 0
+            for item in items:
+                col1, col2, col3 = st.columns([3, 2, 2])
+                with col1:
+                    st.write(f"**{item['name']}**")
+                with col3:
+                    qty = st.number_input(
+                        "數量",
+                        min_value=0,
+                        max_value=99,
+                        value=original_lines.get(item['id'], (0, 0))[0],
+                        key=f"edit_qty_{co['id']}_{item['id']}",
+                        label_visibility="collapsed"
+                    )
+                    edit_quantities[item['id']] = qty
+                # 單價依數量是否變更而定，數量輸入後才顯示
+                price, subtotal = edit_line_price(item, qty, original_lines)
+                edit_total += subtotal
+                with col2:
+                    st.write(f"${price}")
+            
+            st.metric("訂單總計", f"${edit_total:,.0f}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("儲存修改", key=f"save_edit_{co['id']}", type="primary"):
+                    updated = db.update_customer_order(co['id'], edit_quantities, st.session_state.editing_order_version)
+                    st.session_state.editing_order_id = None
+                    if updated:
+                        st.success("訂單已更新！")
+                    else:
+                        # 訂單已被他人修改，回到顯示模式載入最新內容
+                        st.session_state.order_conflict_id = co['id']
+                    # 彙總金額會改變，重跑整頁
+                    st.rerun()
+            with col2:
+                st.button("取消", key=f"cancel_edit_{co['id']}", on_click=stop_editing_order)
+        else:
+            # 顯示模式
+            if st.session_state.order_conflict_id == co['id']:
+                st.warning("此訂單已被其他人修改，未儲存您的變更。以下為最新內容，請重新修改。")
+                st.session_state.order_conflict_id = None
+            if details:
+                details_df = pd.DataFrame([dict(d) for d in details])[['name', 'quantity', 'price', 'subtotal']]
+                details_df.columns = ['品項', '數量', '單價', '小計']
+                details_df.index = details_df.index + 1
+                st.dataframe(details_df, use_container_width=True)
+            
+            btn_col1, btn_col2, _ = st.columns([1, 1, 3])
+            with btn_col1:
+                st.button("修改訂單", key=f"edit_co_{co['id']}", on_click=start_editing_order,
+                          args=(co['id'],))
+            with btn_col2:
+                if st.button("刪除此訂單", key=f"del_co_{co['id']}"):
+                    db.delete_customer_order(co['id'])
+                    st.rerun()
+
+
+@db_fragment
+def order_form(group_order_id: int):
+    """下單表單 (片段：調整數量只重跑此區塊)"""
+    items = db.get_items_by_group_order(group_order_id)
+    
+    if not items:
+        st.warning("此團購單尚無品項")
+        return
+    
+    st.subheader("選擇商品")
+    
+    customer_name = st.text_input("您的姓名", placeholder="請輸入姓名", key="new_customer_name")
+    
+    st.divider()
+    
+    # 商品選擇
+    quantities = {}
+    total = 0
+    
+    for item in items:
+        col1, col2, col3 = st.columns([3, 2, 2])
+        with col1:
+            st.write(f"**{item['name']}**")
+        with col2:
+            st.write(f"${item['price']}")
+        with col3:
+            qty = st.number_input(
+                "數量",
+                min_value=0,
+                max_value=99,
+                value=0,
+                key=f"qty_{item['id']}",
+                label_visibility="collapsed"
+            )
+            quantities[item['id']] = qty
+            total += qty * item['price']
+    
+    st.divider()
+    
+    # 備註欄位
+    note = st.text_area("備註", placeholder="如有特殊需求請填寫", key="order_note")
+    
+    # 顯示總計
+    st.metric("訂單總計", f"${total:,.0f}")
+    
+    # 購物車內容不變時沿用同一個冪等鍵，重複送出 (連點、重跑) 不會建立重複訂單
+    cart = (group_order_id, customer_name, note, tuple(sorted(quantities.items())))
+    if st.session_state.get("order_cart") != cart:
+        st.session_state.order_cart = cart
+        st.session_state.order_idempotency_key = uuid.uuid4().hex
+    
+    # 送出訂單
+    if st.button("送出訂單", type="primary", use_container_width=True):
+        if not customer_name:
+            st.error("請輸入您的姓名")
+        elif total == 0:
+            st.error("請至少選擇一項商品")
+        else:
+            # 尖峰時段由流量管制排隊或請使用者稍後再試 (重試沿用同一個冪等鍵)
+            try:
+                with admission.admit(st.session_state.db_session_key):
+                    customer_order_id = db.create_customer_order(
+                        group_order_id, customer_name, quantities, note,
+                        idempotency_key=st.session_state.order_idempotency_key
+                    )
+            except admission.AdmissionRejected as e:
+                st.warning(f"目前下單人數較多，請於 {e.retry_after} 秒後再送出一次，購物車內容會保留")
+            else:
+                st.success(f"訂單送出成功！訂單編號 #{customer_order_id}")
+                st.balloons()
+
+
+@db_fragment
+def customer_order_edit_block(customer_order_id: int, group_order_id: int):
+    """顧客查詢到的單筆訂單 (片段：編輯數量只重跑此區塊)"""
+    import pandas as pd
+    order = db.get_customer_order_by_id(customer_order_id)
+    if order is None:
+        return
+    details = db.get_order_details(order['id'])
+    
+    with st.expander(f"訂單 #{order['id']} - ${order['total_amount']:,.0f}"):
+        if st.session_state.editing_order_id == order['id']:
+            # 編輯模式
+            items = db.get_items_by_group_order(group_order_id)
+            original_lines = editing_order_lines()
+            
+            edit_quantities = {}
+            edit_total = 0
+            for item in items:
+                col1, col2, col3 = st.columns([3, 2, 2])
+                with col1:
+                    st.write(f"**{item['name']}**")
+                with col3:
+                    qty = st.number_input(
+                        "數量",
+                        min_value=0,
+                        max_value=99,
+                        value=original_lines.get(item['id'], (0, 0))[0],
+                        key=f"cust_edit_qty_{order['id']}_{item['id']}",
+                        label_visibility="collapsed"
+                    )
+                    edit_quantities[item['id']] = qty
+                # 單價依數量是否變更而定，數量輸入後才顯示
+                price, subtotal = edit_line_price(item, qty, original_lines)
+                edit_total += subtotal
+                with col2:
+                    st.write(f"${price}")
+            
+            st.metric("訂單總計", f"${edit_total:,.0f}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("儲存修改", key=f"cust_save_{order['id']}", type="primary"):
+                    try:
+                        with admission.admit(st.session_state.db_session_key):
+                            updated = db.update_customer_order(
+                                order['id'], edit_quantities, st.session_state.editing_order_version
+                            )
+                    except admission.AdmissionRejected as e:
+                        st.warning(f"目前下單人數較多，請於 {e.retry_after} 秒後再按一次儲存")
+                    else:
+                        st.session_state.editing_order_id = None
+                        if updated:
+                            st.success("訂單已更新！")
+                        else:
+                            # 訂單已被他人修改，回到顯示模式載入最新內容
+                            st.session_state.order_conflict_id = order['id']
+                        st.rerun()
+            with col2:
+                st.button("取消", key=f"cust_cancel_{order['id']}", on_click=stop_editing_order)
+        else:
+            # 顯示模式
+            if st.session_state.order_conflict_id == order['id']:
+                st.warning("此訂單已被其他人修改，未儲存您的變更。以下為最新內容，請重新修改。")
+                st.session_state.order_conflict_id = None
+            if details:
+                details_df = pd.DataFrame([dict(d) for d in details])[['name', 'quantity', 'price', 'subtotal']]
+                details_df.columns = ['品項', '數量', '單價', '小計']
+                details_df.index = details_df.index + 1
+                st.dataframe(details_df, use_container_width=True)
+            
+            st.button("修改此訂單", key=f"cust_edit_{order['id']}", on_click=start_editing_order,
+                      args=(order['id'],))
+
 
 # 側邊欄 - 角色選擇
 role = st.sidebar.radio("選擇功能", ["商品訂購", "管理後台"])
@@ -34,6 +539,13 @@ if role == "管理後台" and st.session_state.boss_authenticated:
     if st.sidebar.button("登出"):
         st.session_state.boss_authenticated = False
         st.rerun()
+    
+    # 下單流量管制統計 (本程序)
+    with st.sidebar.expander("下單流量"):
+        admission_metrics = admission.metrics()
+        st.caption(f"已受理 {admission_metrics['admitted']}・曾排隊 {admission_metrics['queued']}")
+        st.caption(f"拒絕 {admission_metrics['rejected']}・逾時 {admission_metrics['timed_out']}")
+        st.caption(f"目前寫入中 {admission_metrics['active']}・排隊中 {admission_metrics['waiting']}")
 
 # ============================================
 # 老闆介面
@@ -48,7 +560,7 @@ if role == "管理後台":
         password = st.text_input("密碼", type="password", placeholder="請輸入密碼")
         
         if st.button("登入", type="primary"):
-            if password == BOSS_PASSWORD:
+            if password == TENANTS[tenant]["password"]:
                 st.session_state.boss_authenticated = True
                 st.success("登入成功！")
                 st.rerun()
@@ -57,7 +569,10 @@ if role == "管理後台":
         
         st.stop()
     
-    tab1, tab2, tab3 = st.tabs(["訂單統計", "建立團購單", "管理團購單"])
+    # 管理後台才需要 pandas，延後載入以加快顧客頁面的啟動
+    import pandas as pd
+    
+    tab1, tab2, tab3, tab4 = st.tabs(["訂單統計", "建立團購單", "管理團購單", "銷售分析"])
     
     # ---- 建立團購單 ----
     with tab2:
@@ -94,16 +609,32 @@ if role == "管理後台":
             else:
                 st.error("請填寫品項名稱和價格")
         
+        # 批次匯入品項
+        imported = item_import_widget("new", [i['name'] for i in st.session_state.new_items])
+        if imported is not None:
+            st.session_state.new_items.extend(imported[0])
+            st.rerun()
+        
         # 顯示已加入的品項
         if st.session_state.new_items:
-            st.write("**已加入的品項：**")
-            for idx, item in enumerate(st.session_state.new_items):
-                col1, col2, col3 = st.columns([3, 2, 1])
-                col1.write(item['name'])
-                col2.write(f"${item['price']}")
-                if col3.button("刪除", key=f"del_new_item_{idx}"):
-                    st.session_state.new_items.pop(idx)
+            st.write(f"**已加入的品項 ({len(st.session_state.new_items)})：**")
+            if len(st.session_state.new_items) > 20:
+                # 品項過多時以表格顯示，避免逐列產生元件
+                new_items_df = pd.DataFrame(st.session_state.new_items)[['name', 'price']]
+                new_items_df.columns = ['品項', '價格']
+                new_items_df.index = new_items_df.index + 1
+                st.dataframe(new_items_df, use_container_width=True)
+                if st.button("清除全部品項", key="clear_new_items"):
+                    st.session_state.new_items = []
                     st.rerun()
+            else:
+                for idx, item in enumerate(st.session_state.new_items):
+                    col1, col2, col3 = st.columns([3, 2, 1])
+                    col1.write(item['name'])
+                    col2.write(f"${item['price']}")
+                    if col3.button("刪除", key=f"del_new_item_{idx}"):
+                        st.session_state.new_items.pop(idx)
+                        st.rerun()
         
         st.divider()
         
@@ -117,8 +648,7 @@ if role == "管理後台":
                 start_datetime = start_date.strftime("%Y-%m-%d")
                 end_datetime = end_date.strftime("%Y-%m-%d")
                 order_id = db.create_group_order(title, description, start_datetime, end_datetime)
-                for item in st.session_state.new_items:
-                    db.add_item(order_id, item['name'], item['price'])
+                db.add_items_bulk(order_id, st.session_state.new_items)
                 st.session_state.new_items = []
                 st.success(f"團購單「{title}」建立成功！")
                 st.rerun()
@@ -158,10 +688,13 @@ if role == "管理後台":
                                 # 品項編輯
                                 st.write("**品項管理**")
                                 items = db.get_items_by_group_order(order['id'])
+                                edit_prices = {}
                                 for item in items:
                                     col1, col2, col3 = st.columns([3, 2, 1])
                                     col1.write(item['name'])
-                                    col2.write(f"${item['price']}")
+                                    edit_prices[item['id']] = col2.number_input(
+                                        "價格", value=float(item['price']), min_value=0.0, step=5.0,
+                                        key=f"edit_price_{order['id']}_{item['id']}", label_visibility="collapsed")
                                     if col3.button("刪除", key=f"del_item_{order['id']}_{item['id']}"):
                                         db.delete_item(item['id'])
                                         st.rerun()
@@ -180,11 +713,21 @@ if role == "管理後台":
                                         del st.session_state[f"new_item_price_{order['id']}"]
                                         st.rerun()
                                 
+                                # 批次匯入品項
+                                imported = item_import_widget(f"{order['id']}", [i['name'] for i in items])
+                                if imported is not None:
+                                    db.add_items_bulk(order['id'], imported[0])
+                                    st.rerun()
+                                
                                 col1, col2 = st.columns(2)
                                 with col1:
                                     if st.button("儲存修改", key=f"save_group_{order['id']}", type="primary"):
                                         db.update_group_order(order['id'], edit_title, edit_desc, 
                                             edit_start.strftime("%Y-%m-%d"), edit_end.strftime("%Y-%m-%d"))
+                                        # 價格變更只影響之後的訂單 (已下訂單保留下單時的單價)
+                                        for item in items:
+                                            if edit_prices[item['id']] != item['price']:
+                                                db.update_item_price(item['id'], edit_prices[item['id']])
                                         st.session_state.editing_group_order_id = None
                                         st.success("團購單已更新！")
                                         st.rerun()
@@ -206,7 +749,7 @@ if role == "管理後台":
                                     items_df.index = items_df.index + 1
                                     st.dataframe(items_df, use_container_width=True)
                                 
-                                col1, col2, col3 = st.columns(3)
+                                col1, col2, col3, col4 = st.columns(4)
                                 with col1:
                                     if st.button("編輯", key=f"edit_group_{order['id']}"):
                                         st.session_state.editing_group_order_id = order['id']
@@ -216,9 +759,16 @@ if role == "管理後台":
                                         db.update_group_order_status(order['id'], 'closed')
                                         st.rerun()
                                 with col3:
+                                    if st.button("複製", key=f"clone_{order['id']}"):
+                                        st.session_state.cloning_group_order_id = order['id']
+                                        st.rerun()
+                                with col4:
                                     if st.button("刪除", key=f"del_{order['id']}", type="secondary"):
                                         db.delete_group_order(order['id'])
                                         st.rerun()
+                                
+                                if st.session_state.cloning_group_order_id == order['id']:
+                                    clone_group_order_form(order, f"{order['id']}")
                 else:
                     st.info("目前沒有開放中的團購單")
             
@@ -246,10 +796,13 @@ if role == "管理後台":
                                 # 品項編輯
                                 st.write("**品項管理**")
                                 items = db.get_items_by_group_order(order['id'])
+                                edit_prices = {}
                                 for item in items:
                                     col1, col2, col3 = st.columns([3, 2, 1])
                                     col1.write(item['name'])
-                                    col2.write(f"${item['price']}")
+                                    edit_prices[item['id']] = col2.number_input(
+                                        "價格", value=float(item['price']), min_value=0.0, step=5.0,
+                                        key=f"edit_price_c_{order['id']}_{item['id']}", label_visibility="collapsed")
                                     if col3.button("刪除", key=f"del_item_c_{order['id']}_{item['id']}"):
                                         db.delete_item(item['id'])
                                         st.rerun()
@@ -268,11 +821,21 @@ if role == "管理後台":
                                         del st.session_state[f"new_item_price_c_{order['id']}"]
                                         st.rerun()
                                 
+                                # 批次匯入品項
+                                imported = item_import_widget(f"c_{order['id']}", [i['name'] for i in items])
+                                if imported is not None:
+                                    db.add_items_bulk(order['id'], imported[0])
+                                    st.rerun()
+                                
                                 col1, col2 = st.columns(2)
                                 with col1:
                                     if st.button("儲存修改", key=f"save_group_c_{order['id']}", type="primary"):
                                         db.update_group_order(order['id'], edit_title, edit_desc, 
                                             edit_start.strftime("%Y-%m-%d"), edit_end.strftime("%Y-%m-%d"))
+                                        # 價格變更只影響之後的訂單 (已下訂單保留下單時的單價)
+                                        for item in items:
+                                            if edit_prices[item['id']] != item['price']:
+                                                db.update_item_price(item['id'], edit_prices[item['id']])
                                         st.session_state.editing_group_order_id = None
                                         st.success("團購單已更新！")
                                         st.rerun()
@@ -294,7 +857,7 @@ if role == "管理後台":
                                     items_df.index = items_df.index + 1
                                     st.dataframe(items_df, use_container_width=True)
                                 
-                                col1, col2, col3 = st.columns(3)
+                                col1, col2, col3, col4 = st.columns(4)
                                 with col1:
                                     if st.button("編輯", key=f"edit_group_c_{order['id']}"):
                                         st.session_state.editing_group_order_id = order['id']
@@ -304,9 +867,16 @@ if role == "管理後台":
                                         db.update_group_order_status(order['id'], 'open')
                                         st.rerun()
                                 with col3:
+                                    if st.button("複製", key=f"clone_c_{order['id']}"):
+                                        st.session_state.cloning_group_order_id = order['id']
+                                        st.rerun()
+                                with col4:
                                     if st.button("刪除", key=f"del_closed_{order['id']}", type="secondary"):
                                         db.delete_group_order(order['id'])
                                         st.rerun()
+                                
+                                if st.session_state.cloning_group_order_id == order['id']:
+                                    clone_group_order_form(order, f"c_{order['id']}")
                 else:
                     st.info("目前沒有已關閉的團購單")
         else:
@@ -338,150 +908,169 @@ if role == "管理後台":
             if selected_order:
                 order_id = order_options[selected_order]
                 
+                # 即時儀表板：定時套用新的變更，不需重新整理整頁
+                if st.toggle("即時更新", key="live_dashboard"):
+                    live_dashboard(order_id)
+                    st.divider()
+                
+                # 資料版本：資料未變更時直接使用快取的彙總與明細
+                revision = db.get_group_order_revision(order_id)
+                
+                statistics = load_group_order_statistics(order_id, revision)
+                
                 # 品項彙總
                 st.write("### 品項彙總")
-                summary = db.get_group_order_summary(order_id)
-                if summary:
-                    summary_df = pd.DataFrame([dict(s) for s in summary])[['name', 'price', 'total_qty', 'total_amount']]
+                if not statistics["summary"].empty:
+                    summary_df = statistics["summary"][['item_name', 'price', 'total_qty', 'total_amount']].copy()
                     summary_df.columns = ['品項', '單價', '總數量', '總金額']
                     summary_df.index = summary_df.index + 1
                     st.dataframe(summary_df, use_container_width=True)
                     
-                    total = sum(s['total_amount'] for s in summary)
-                    st.metric("總金額", f"${total:,.0f}")
+                    paid = statistics["paid"]
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("總金額", f"${statistics['summary']['total_amount'].sum():,.0f}")
+                    col2.metric(f"已付款 ({paid.loc['已付款', 'orders']} 筆)", f"${paid.loc['已付款', 'total_amount']:,.0f}")
+                    col3.metric(f"未付款 ({paid.loc['未付款', 'orders']} 筆)", f"${paid.loc['未付款', 'total_amount']:,.0f}")
                     
-                    # 產生詳細明細 CSV
-                    detail_rows = []
-                    for s in summary:
-                        buyers = db.get_item_buyers(s['id'])
-                        if buyers:
-                            for b in buyers:
-                                detail_rows.append({
-                                    '品項': s['name'],
-                                    '單價': s['price'],
-                                    '顧客姓名': b['customer_name'],
-                                    '數量': b['quantity'],
-                                    '小計': b['subtotal']
-                                })
-                        else:
-                            detail_rows.append({
-                                '品項': s['name'],
-                                '單價': s['price'],
-                                '顧客姓名': '',
-                                '數量': 0,
-                                '小計': 0
-                            })
-                    
-                    detail_df = pd.DataFrame(detail_rows)
-                    detail_df.index = detail_df.index + 1
-                    # 使用 BOM 確保 Excel 正確顯示中文
-                    csv_buffer = '\ufeff' + detail_df.to_csv(index=True, encoding='utf-8')
                     st.download_button(
                         label="下載訂單明細 CSV",
-                        data=csv_buffer.encode('utf-8'),
+                        data=build_order_detail_csv(order_id, revision),
                         file_name=f"{selected_order}_訂單明細.csv",
                         mime="text/csv"
                     )
+                    
+                    # 取貨日揀貨單
+                    with st.expander("揀貨單"):
+                        import picklist
+                        col1, col2 = st.columns(2)
+                        pick_by = col1.radio(
+                            "種類", options=list(picklist.PICK_LIST_KINDS),
+                            format_func=picklist.PICK_LIST_KINDS.get, key="pick_list_by"
+                        )
+                        pick_fmt = col2.radio(
+                            "格式", options=["html", "csv"],
+                            format_func=lambda k: {"html": "可列印 HTML", "csv": "CSV"}[k],
+                            key="pick_list_fmt"
+                        )
+                        pick_title = next(o['title'] for o in group_orders if o['id'] == order_id)
+                        st.download_button(
+                            label="下載揀貨單",
+                            data=build_pick_list(order_id, revision, pick_title, pick_by, pick_fmt),
+                            file_name=f"{pick_title}_{'分裝單' if pick_by == 'customer' else '分貨單'}.{pick_fmt}",
+                            mime="text/html" if pick_fmt == "html" else "text/csv"
+                        )
+                    
+                    # 顧客 × 品項對照表
+                    if not statistics["pivot"].empty:
+                        with st.expander("顧客 × 品項數量對照表"):
+                            pivot_df = statistics["pivot"].copy()
+                            pivot_df.index.name = '顧客姓名'
+                            pivot_df.columns.name = None
+                            st.dataframe(pivot_df, use_container_width=True)
+                    
+                    # 顧客金額排行
+                    if not statistics["customers"].empty:
+                        with st.expander("顧客訂單金額"):
+                            customers_df = statistics["customers"][['customer_name', 'is_paid', 'total_qty', 'total_amount']].copy()
+                            customers_df.columns = ['顧客姓名', '已付款', '總數量', '總金額']
+                            customers_df.index = customers_df.index + 1
+                            st.dataframe(customers_df, use_container_width=True)
                 
                 # 按品項展開購買者
-                st.write("### 品項購買明細")
-                for s in summary:
-                    with st.expander(f"{s['name']} - 共 {int(s['total_qty'])} 份"):
-                        buyers = db.get_item_buyers(s['id'])
-                        if buyers:
-                            buyers_df = pd.DataFrame([dict(b) for b in buyers])
-                            buyers_df.columns = ['顧客姓名', '數量', '小計']
-                            buyers_df.index = buyers_df.index + 1
-                            st.dataframe(buyers_df, use_container_width=True)
-                        else:
-                            st.info("尚無人購買此品項")
+                item_buyers_section(statistics)
                 
                 # 顧客訂單列表
                 st.write("### 顧客訂單")
                 customer_orders = db.get_customer_orders_by_group(order_id)
                 
                 if customer_orders:
+                    # 明細一次讀取，各訂單區塊不需各自查詢
+                    details_by_order = db.get_order_details_by_group(order_id)
+                    preloaded = {co['id']: (co, details_by_order.get(co['id'], [])) for co in customer_orders}
                     for co in customer_orders:
-                        # 顯示付款狀態標記
-                        is_paid_val = co['is_paid'] if 'is_paid' in co.keys() else 0
-                        paid_status = "✅ " if is_paid_val else ""
-                        with st.expander(f"{paid_status}{co['customer_name']} - ${co['total_amount'] or 0:,.0f}"):
-                            # 取貨付款勾選框
-                            is_paid = st.checkbox(
-                                "已取貨付款",
-                                value=bool(is_paid_val),
-                                key=f"paid_{co['id']}"
-                            )
-                            if is_paid != bool(is_paid_val):
-                                db.update_customer_order_paid_status(co['id'], 1 if is_paid else 0)
-                                st.rerun()
-                            
-                            # 顯示備註
-                            note_val = co['note'] if 'note' in co.keys() else None
-                            if note_val:
-                                st.info(f"備註：{note_val}")
-                            
-                            # 檢查是否正在編輯此訂單
-                            if st.session_state.editing_order_id == co['id']:
-                                # 編輯模式
-                                items = db.get_items_by_group_order(order_id)
-                                current_details = db.get_order_details_as_dict(co['id'])
-                                
-                                edit_quantities = {}
-                                edit_total = 0
-                                for item in items:
-                                    col1, col2, col3 = st.columns([3, 2, 2])
-                                    with col1:
-                                        st.write(f"**{item['name']}**")
-                                    with col2:
-                                        st.write(f"${item['price']}")
-                                    with col3:
-                                        qty = st.number_input(
-                                            "數量",
-                                            min_value=0,
-                                            max_value=99,
-                                            value=current_details.get(item['id'], 0),
-                                            key=f"edit_qty_{co['id']}_{item['id']}",
-                                            label_visibility="collapsed"
-                                        )
-                                        edit_quantities[item['id']] = qty
-                                        edit_total += qty * item['price']
-                                
-                                st.metric("訂單總計", f"${edit_total:,.0f}")
-                                
-                                col1, col2 = st.columns(2)
-                                with col1:
-                                    if st.button("儲存修改", key=f"save_edit_{co['id']}", type="primary"):
-                                        db.update_customer_order(co['id'], edit_quantities)
-                                        st.session_state.editing_order_id = None
-                                        st.success("訂單已更新！")
-                                        st.rerun()
-                                with col2:
-                                    if st.button("取消", key=f"cancel_edit_{co['id']}"):
-                                        st.session_state.editing_order_id = None
-                                        st.rerun()
-                            else:
-                                # 顯示模式
-                                details = db.get_order_details(co['id'])
-                                if details:
-                                    details_df = pd.DataFrame([dict(d) for d in details])[['name', 'quantity', 'price', 'subtotal']]
-                                    details_df.columns = ['品項', '數量', '單價', '小計']
-                                    details_df.index = details_df.index + 1
-                                    st.dataframe(details_df, use_container_width=True)
-                                
-                                btn_col1, btn_col2, _ = st.columns([1, 1, 3])
-                                with btn_col1:
-                                    if st.button("修改訂單", key=f"edit_co_{co['id']}"):
-                                        st.session_state.editing_order_id = co['id']
-                                        st.rerun()
-                                with btn_col2:
-                                    if st.button("刪除此訂單", key=f"del_co_{co['id']}"):
-                                        db.delete_customer_order(co['id'])
-                                        st.rerun()
+                        admin_customer_order_block(co['id'], order_id, preloaded)
                 else:
                     st.info("尚無顧客訂單")
         else:
             st.info("尚無團購單")
+    
+    # ============ 銷售分析 (由銷售彙總表讀取) ============
+    with tab4:
+        st.subheader("銷售分析")
+        
+        months = db.get_rollup_periods("month")
+        if months:
+            col1, col2 = st.columns(2)
+            with col1:
+                year = st.selectbox("年度", sorted({m[:4] for m in months}, reverse=True), key="analytics_year")
+            with col2:
+                month = st.selectbox("月份", ["全年"] + sorted(m for m in months if m.startswith(year)),
+                                     key="analytics_month")
+            # 全年以月為單位，單月以日為單位
+            if month == "全年":
+                granularity, start, end = "month", f"{year}-01", f"{year}-12"
+            else:
+                granularity, start, end = "day", f"{month}-01", f"{month}-31"
+            
+            trend_df = pd.DataFrame([dict(r) for r in db.get_sales_trend(granularity, start, end)])
+            if trend_df.empty:
+                st.info("此期間沒有銷售資料")
+            else:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("營業額", f"${trend_df['amount'].sum():,.0f}")
+                col2.metric("訂單數", f"{trend_df['orders'].sum():,}")
+                col3.metric("商品件數", f"{trend_df['quantity'].sum():,}")
+                
+                st.write("### " + ("每月營業額" if granularity == "month" else "每日營業額"))
+                st.bar_chart(trend_df.set_index("period")["amount"], x_label="期間", y_label="營業額")
+                
+                group_titles = {str(o['id']): o['title'] for o in db.get_all_group_orders()}
+                rankings = [
+                    ("item", "熱銷品項 Top 20", "品項"),
+                    ("group_order", "團購單排行", "團購單"),
+                    ("customer", "顧客排行", "顧客姓名"),
+                ]
+                for dimension, heading, name_label in rankings:
+                    st.write(f"### {heading}")
+                    top_df = pd.DataFrame([dict(r) for r in db.get_top_sales(dimension, granularity, start, end)])
+                    # 期間內有訂單但品項都已刪除時排行為空 (沒有欄位可選取)
+                    if top_df.empty:
+                        st.info("此期間沒有可排行的資料")
+                        continue
+                    if dimension == "group_order":
+                        top_df["name"] = top_df["name"].map(lambda gid: group_titles.get(gid, f"#{gid}"))
+                    top_df = top_df[["name", "quantity", "orders", "amount"]]
+                    top_df.columns = [name_label, "件數", "訂單數", "營業額"]
+                    top_df.index = top_df.index + 1
+                    st.dataframe(top_df, use_container_width=True)
+        else:
+            st.info("目前沒有銷售資料")
+
+        st.write("### 回購顧客")
+        repeat_df = pd.DataFrame([dict(r) for r in db.get_repeat_customers()])
+        if repeat_df.empty:
+            st.info("尚無參加兩次以上團購的顧客")
+        else:
+            repeat_df = repeat_df[["name", "group_orders", "orders", "amount", "first_order_at", "last_order_at"]]
+            repeat_df.columns = ["顧客姓名", "參加團數", "訂單數", "消費金額", "首次下單", "最近下單"]
+            st.dataframe(repeat_df, use_container_width=True, hide_index=True)
+
+        st.write("### 顧客訂單紀錄")
+        history_name = st.text_input("顧客姓名", placeholder="請輸入姓名", key="history_customer_name")
+        if history_name:
+            customer = db.get_customer_by_name(history_name)
+            history = db.get_customer_order_history(customer['id']) if customer else []
+            if history:
+                history_df = pd.DataFrame([dict(r) for r in history])
+                history_df["is_paid"] = history_df["is_paid"].map(lambda p: "是" if p else "否")
+                history_df = history_df[["group_order_title", "customer_name", "item_count", "total_amount",
+                                         "is_paid", "created_at"]]
+                history_df.columns = ["團購單", "下單姓名", "件數", "金額", "已付款", "下單時間"]
+                st.write(f"{customer['name']}：共 {len(history)} 筆訂單，"
+                         f"合計 ${history_df['金額'].sum():,.0f}")
+                st.dataframe(history_df, use_container_width=True, hide_index=True)
+            else:
+                st.info("查無此顧客的訂單")
 
 # ============================================
 # 顧客介面
@@ -524,57 +1113,7 @@ else:
                 if order_info['end_time']:
                     st.write(f"**截止時間：{order_info['end_time']}**")
                 
-                items = db.get_items_by_group_order(order_id)
-                
-                if items:
-                    st.subheader("選擇商品")
-                    
-                    customer_name = st.text_input("您的姓名", placeholder="請輸入姓名", key="new_customer_name")
-                    
-                    st.divider()
-                    
-                    # 商品選擇
-                    quantities = {}
-                    total = 0
-                    
-                    for item in items:
-                        col1, col2, col3 = st.columns([3, 2, 2])
-                        with col1:
-                            st.write(f"**{item['name']}**")
-                        with col2:
-                            st.write(f"${item['price']}")
-                        with col3:
-                            qty = st.number_input(
-                                "數量",
-                                min_value=0,
-                                max_value=99,
-                                value=0,
-                                key=f"qty_{item['id']}",
-                                label_visibility="collapsed"
-                            )
-                            quantities[item['id']] = qty
-                            total += qty * item['price']
-                    
-                    st.divider()
-                    
-                    # 備註欄位
-                    note = st.text_area("備註", placeholder="如有特殊需求請填寫", key="order_note")
-                    
-                    # 顯示總計
-                    st.metric("訂單總計", f"${total:,.0f}")
-                    
-                    # 送出訂單
-                    if st.button("送出訂單", type="primary", use_container_width=True):
-                        if not customer_name:
-                            st.error("請輸入您的姓名")
-                        elif total == 0:
-                            st.error("請至少選擇一項商品")
-                        else:
-                            db.create_customer_order(order_id, customer_name, quantities, note)
-                            st.success("訂單送出成功！")
-                            st.balloons()
-                else:
-                    st.warning("此團購單尚無品項")
+                order_form(order_id)
         else:
             st.info("目前沒有開放中的團購單")
     
@@ -612,57 +1151,7 @@ else:
                         st.write(f"找到 {len(my_orders)} 筆訂單")
                         
                         for order in my_orders:
-                            with st.expander(f"訂單 #{order['id']} - ${order['total_amount'] or 0:,.0f}"):
-                                if st.session_state.editing_order_id == order['id']:
-                                    # 編輯模式
-                                    items = db.get_items_by_group_order(order_id)
-                                    current_details = db.get_order_details_as_dict(order['id'])
-                                    
-                                    edit_quantities = {}
-                                    edit_total = 0
-                                    for item in items:
-                                        col1, col2, col3 = st.columns([3, 2, 2])
-                                        with col1:
-                                            st.write(f"**{item['name']}**")
-                                        with col2:
-                                            st.write(f"${item['price']}")
-                                        with col3:
-                                            qty = st.number_input(
-                                                "數量",
-                                                min_value=0,
-                                                max_value=99,
-                                                value=current_details.get(item['id'], 0),
-                                                key=f"cust_edit_qty_{order['id']}_{item['id']}",
-                                                label_visibility="collapsed"
-                                            )
-                                            edit_quantities[item['id']] = qty
-                                            edit_total += qty * item['price']
-                                    
-                                    st.metric("訂單總計", f"${edit_total:,.0f}")
-                                    
-                                    col1, col2 = st.columns(2)
-                                    with col1:
-                                        if st.button("儲存修改", key=f"cust_save_{order['id']}", type="primary"):
-                                            db.update_customer_order(order['id'], edit_quantities)
-                                            st.session_state.editing_order_id = None
-                                            st.success("訂單已更新！")
-                                            st.rerun()
-                                    with col2:
-                                        if st.button("取消", key=f"cust_cancel_{order['id']}"):
-                                            st.session_state.editing_order_id = None
-                                            st.rerun()
-                                else:
-                                    # 顯示模式
-                                    details = db.get_order_details(order['id'])
-                                    if details:
-                                        details_df = pd.DataFrame([dict(d) for d in details])[['name', 'quantity', 'price', 'subtotal']]
-                                        details_df.columns = ['品項', '數量', '單價', '小計']
-                                        details_df.index = details_df.index + 1
-                                        st.dataframe(details_df, use_container_width=True)
-                                    
-                                    if st.button("修改此訂單", key=f"cust_edit_{order['id']}"):
-                                        st.session_state.editing_order_id = order['id']
-                                        st.rerun()
+                            customer_order_edit_block(order['id'], order_id)
                     else:
                         st.info("查無訂單，請確認姓名是否正確")
         else:
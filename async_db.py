@@ -0,0 +1,193 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+
+import database as db
+
+# 非同步資料存取 (供 bot、webhook、API 等 asyncio 服務使用，函式名稱與 database.py 相同)
+# 儲存後端支援時 (PostgreSQL) 讀取使用 asyncpg 連線池；其他後端的讀取及所有寫入交由有上限的執行緒池執行同步函式，
+# 寫入沿用 database.py 的交易 (訂單金額、銷售彙總、變更紀錄)，兩邊結果一致
+# asyncpg 讀取執行 database.py 的同一份查詢字串，且一律連到主資料庫 (不使用 DB_READ_REPLICAS 副本)
+
+# 執行緒池大小 (同時執行的 SQLite 查詢及寫入上限)
+ASYNC_DB_WORKERS = int(os.environ.get("ASYNC_DB_WORKERS", "8"))
+# 每個主辦者的 asyncpg 連線池大小
+ASYNC_PG_POOL_MIN = int(os.environ.get("ASYNC_PG_POOL_MIN", "1"))
+ASYNC_PG_POOL_MAX = int(os.environ.get("ASYNC_PG_POOL_MAX", "10"))
+
+_executor = None
+# 主辦者 -> asyncpg 連線池 (search_path 指向主辦者的 schema)
+_pools = {}
+_pool_lock = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ASYNC_DB_WORKERS, thread_name_prefix="async-db")
+    return _executor
+
+
+async def _run_sync(func, *args, **kwargs):
+    """在執行緒池執行同步的資料庫函式 (保留目前的主辦者及 session)"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(_get_executor(), call)
+
+
+async def _get_pool():
+    """取得目前主辦者的 asyncpg 連線池 (第一次使用時建立)"""
+    tenant = db.get_tenant()
+    pool = _pools.get(tenant)
+    if pool is not None:
+        return pool
+    global _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if tenant not in _pools:
+            _pools[tenant] = await db.backend.create_async_pool(tenant, ASYNC_PG_POOL_MIN, ASYNC_PG_POOL_MAX)
+        return _pools[tenant]
+
+
+def _pg(query: str) -> str:
+    """將 ? 佔位符轉換為 asyncpg 的 $1, $2, ..."""
+    parts = query.split("?")
+    return parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+
+
+async def _fetch_all(query: str, *params) -> list:
+    pool = await _get_pool()
+    rows = await pool.fetch(_pg(query), *params)
+    return [dict(row) for row in rows]
+
+
+async def _fetch_one(query: str, *params):
+    pool = await _get_pool()
+    row = await pool.fetchrow(_pg(query), *params)
+    return dict(row) if row is not None else None
+
+
+async def close():
+    """關閉連線池及執行緒池 (服務結束時呼叫)"""
+    global _executor, _pool_lock
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
+    _pool_lock = None
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+# ============ 團購單 / 品項 ============
+
+async def get_open_group_orders():
+    """取得開放中的團購單"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_open_group_orders)
+    # asyncpg 需以 datetime 比較 TIMESTAMP 欄位 (同步版以當天日期字串比較)
+    today = datetime.combine(date.today(), time())
+    return await _fetch_all(db._OPEN_GROUP_ORDERS_SQL, today, today)
+
+
+async def get_group_order_by_id(order_id: int):
+    """取得單一團購單"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_group_order_by_id, order_id)
+    return await _fetch_one(db._GROUP_ORDER_BY_ID_SQL, order_id)
+
+
+async def get_items_by_group_order(group_order_id: int):
+    """取得團購單的所有品項"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_items_by_group_order, group_order_id)
+    return await _fetch_all(db._ITEMS_BY_GROUP_ORDER_SQL, group_order_id)
+
+
+async def get_group_order_summary(group_order_id: int):
+    """取得團購單彙總統計"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_group_order_summary, group_order_id)
+    return await _fetch_all(db._GROUP_ORDER_SUMMARY_SQL, group_order_id, group_order_id)
+
+
+# ============ 顧客訂單 ============
+
+async def get_customer_orders_by_group(group_order_id: int):
+    """取得團購單的所有顧客訂單"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_customer_orders_by_group, group_order_id)
+    return await _fetch_all(db._CUSTOMER_ORDERS_BY_GROUP_SQL, group_order_id)
+
+
+async def get_customer_order_by_id(customer_order_id: int):
+    """取得單一顧客訂單"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_customer_order_by_id, customer_order_id)
+    return await _fetch_one(db._CUSTOMER_ORDER_BY_ID_SQL, customer_order_id)
+
+
+async def get_customer_orders_by_name(group_order_id: int, customer_name: str):
+    """根據姓名取得顧客訂單 (不分大小寫、全形半形及多餘空白)"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_customer_orders_by_name, group_order_id, customer_name)
+    return await _fetch_all(db._CUSTOMER_ORDERS_BY_NAME_SQL, db._customer_name_key(customer_name), group_order_id)
+
+
+async def get_order_details(customer_order_id: int):
+    """取得訂單明細"""
+    if not db.backend.async_reads:
+        return await _run_sync(db.get_order_details, customer_order_id)
+    return await _fetch_all(db._ORDER_DETAILS_SQL, customer_order_id)
+
+
+async def create_customer_order(group_order_id: int, customer_name: str, items_qty: dict, note: str = "",
+                                idempotency_key: str = None) -> int:
+    """建立顧客訂單 (參數同 database.create_customer_order)"""
+    return await _run_sync(db.create_customer_order, group_order_id, customer_name, items_qty, note, idempotency_key)
+
+
+async def update_customer_order(customer_order_id: int, items_qty: dict, expected_version: int = None) -> bool:
+    """更新顧客訂單，版本不符時回傳 False (參數同 database.update_customer_order)"""
+    return await _run_sync(db.update_customer_order, customer_order_id, items_qty, expected_version)
+
+
+async def update_customer_order_paid_status(customer_order_id: int, is_paid: int):
+    """更新顧客訂單的付款狀態"""
+    await _run_sync(db.update_customer_order_paid_status, customer_order_id, is_paid)
+
+
+async def delete_customer_order(customer_order_id: int):
+    """刪除顧客訂單"""
+    await _run_sync(db.delete_customer_order, customer_order_id)
+
+
+# ============ 同時讀取 ============
+
+async def get_group_order_overview(group_order_id: int) -> dict:
+    """同時讀取團購單、品項、彙總統計及顧客訂單 (各自使用連線，不互相等待)
+    回傳 {"group_order", "items", "summary", "customer_orders"}，團購單不存在時為 None
+    """
+    group_order, items, summary, customer_orders = await asyncio.gather(
+        get_group_order_by_id(group_order_id),
+        get_items_by_group_order(group_order_id),
+        get_group_order_summary(group_order_id),
+        get_customer_orders_by_group(group_order_id),
+    )
+    if group_order is None:
+        return None
+    return {"group_order": group_order, "items": items, "summary": summary, "customer_orders": customer_orders}
+
+
+async def get_customer_orders_with_details(customer_order_ids: list) -> list:
+    """同時讀取多筆顧客訂單及其明細，回傳 [{"order", "details"}] (已刪除的訂單略過)"""
+    results = await asyncio.gather(
+        *(get_customer_order_by_id(cid) for cid in customer_order_ids),
+        *(get_order_details(cid) for cid in customer_order_ids),
+    )
+    orders, details = results[:len(customer_order_ids)], results[len(customer_order_ids):]
+    return [{"order": o, "details": d} for o, d in zip(orders, details) if o is not None]
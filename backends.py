@@ -0,0 +1,420 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+
+# 儲存後端：連線方式、SQL 方言及各資料庫專用的查詢寫法
+# database.py 依 DB_BACKEND 設定選擇一個後端，其餘程式碼不需判斷資料庫種類
+
+
+class _BackupRestarted(Exception):
+    """線上備份重來次數過多"""
+
+
+class SQLiteBackend:
+    """SQLite 檔案資料庫 (每個主辦者一個檔案)"""
+
+    name = "sqlite"
+    # 自動編號主鍵 (AUTOINCREMENT 確保編號只增不減，刪除後也不會重複使用)
+    primary_key = "INTEGER PRIMARY KEY AUTOINCREMENT"
+    # 唯讀副本：只有預設主辦者使用 (副本檔案對應預設資料庫)
+    supports_replicas = True
+    tenant_replicas = False
+    # 非同步讀取：沒有原生驅動，由 async_db 交給執行緒池執行同步函式
+    async_reads = False
+    backup_suffix = ".db.gz"
+
+    def __init__(self, path_for):
+        # 主辦者 -> 資料庫檔案路徑
+        self.path_for = path_for
+
+    def connect(self, tenant: str, replica: str = None):
+        path = replica or self.path_for(tenant)
+        directory = os.path.dirname(path)
+        if directory and not replica:
+            os.makedirs(directory, exist_ok=True)
+        return self._open(path)
+
+    def _open(self, database: str, **kwargs):
+        conn = sqlite3.connect(database, **kwargs)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def sql(self, query: str) -> str:
+        return query
+
+    def fetch_all(self, cursor, rows):
+        return rows
+
+    def fetch_one(self, cursor, row):
+        return row
+
+    def last_id(self, cursor, table: str) -> int:
+        return cursor.lastrowid
+
+    def prepare_schema(self, conn, tenant: str):
+        """建立主辦者的 schema (SQLite 每個主辦者一個檔案，不需要)"""
+
+    def get_schema_version(self, cursor) -> int:
+        cursor.execute("PRAGMA user_version")
+        return cursor.fetchone()[0]
+
+    def set_schema_version(self, cursor, version: int):
+        cursor.execute(f"PRAGMA user_version = {int(version)}")
+
+    def add_column(self, cursor, table: str, column: str, definition: str):
+        """舊資料庫缺少欄位時新增"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [col[1] for col in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def ensure_cascade(self, conn, foreign_keys: list):
+        """舊資料庫的外鍵沒有 ON DELETE CASCADE 時重建表格 (SQLite 無法修改外鍵)
+        foreign_keys: [(表格, 欄位, 參照表格, 以 {table} 為表格名稱的 DDL)]
+        """
+        conn.commit()
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        for table, ddl in dict((fk[0], fk[3]) for fk in foreign_keys).items():
+            cursor.execute(f"PRAGMA foreign_key_list({table})")
+            # 顧客資料不會刪除，不需要串聯
+            if all(fk[6] == "CASCADE" for fk in cursor.fetchall() if fk[2] != "customers"):
+                continue
+            cursor.execute(f"PRAGMA table_info({table})")
+            old_columns = [col[1] for col in cursor.fetchall()]
+            cursor.execute(ddl.format(table=f"{table}_new"))
+            cursor.execute(f"PRAGMA table_info({table}_new)")
+            columns = ", ".join(col[1] for col in cursor.fetchall() if col[1] in old_columns)
+            cursor.execute(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}")
+            cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        conn.commit()
+        cursor.execute("PRAGMA foreign_keys = ON")
+
+    def period(self, column: str, granularity: str) -> str:
+        """時間欄位轉為期間字串的運算式 (day: YYYY-MM-DD、month: YYYY-MM)"""
+        if granularity == "day":
+            return f"date({column})"
+        return f"strftime('%Y-%m', {column})"
+
+    def older_than(self, column: str, days: int) -> str:
+        """時間欄位早於 days 天前的條件"""
+        return f"{column} < datetime('now', '-{int(days)} days')"
+
+    def stream(self, cursor, query: str, params, batch_size: int):
+        """逐批讀取查詢結果 (產生器，每次產生一批原始資料列)"""
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
+    def backup_prefix(self, tenant: str) -> str:
+        """備份檔名前綴 (資料庫檔名)"""
+        return os.path.splitext(os.path.basename(self.path_for(tenant)))[0]
+
+    def _copy(self, source, target, pages_per_step: int, step_sleep: float, max_restarts: int):
+        """以 SQLite online backup API 分段複製，步驟之間短暫暫停不阻擋寫入
+        複製期間來源被其他連線寫入時會從頭重來；持續有訂單寫入時可能一直重來，
+        超過 max_restarts 次後改為一次複製完成 (複製期間持有讀取鎖，寫入仍可進行)
+        """
+        last_remaining = None
+        restarts = 0
+
+        def progress(status, remaining, total):
+            nonlocal last_remaining, restarts
+            # 剩餘頁數沒有減少表示已從頭重來
+            if last_remaining is not None and remaining >= last_remaining:
+                restarts += 1
+                if restarts > max_restarts:
+                    raise _BackupRestarted
+            last_remaining = remaining
+            if remaining:
+                time.sleep(step_sleep)
+
+        try:
+            source.backup(target, pages=pages_per_step, progress=progress)
+        except _BackupRestarted:
+            source.backup(target, pages=-1)
+
+    def backup(self, tenant: str, path: str, pages_per_step: int, step_sleep: float, max_restarts: int):
+        """將主辦者的資料庫線上複製後壓縮為 path"""
+        fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        try:
+            source = self.connect(tenant)
+            target = sqlite3.connect(tmp_path)
+            try:
+                self._copy(source, target, pages_per_step, step_sleep, max_restarts)
+            finally:
+                target.close()
+                source.close()
+            with open(tmp_path, "rb") as src, gzip.open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        finally:
+            os.remove(tmp_path)
+
+    def restore(self, tenant: str, path: str, pages_per_step: int, step_sleep: float):
+        """檢查備份檔後寫回線上資料庫 (透過 backup API，其他連線不需中斷)"""
+        fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        try:
+            with gzip.open(path, "rb") as src, open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            source = sqlite3.connect(tmp_path)
+            try:
+                result = source.execute("PRAGMA integrity_check").fetchone()[0]
+                if result != "ok":
+                    raise ValueError(f"備份檔損毀：{result}")
+                target = self.connect(tenant)
+                try:
+                    # 來源是解壓縮的暫存檔，不會被寫入
+                    self._copy(source, target, pages_per_step, step_sleep, 0)
+                finally:
+                    target.close()
+            finally:
+                source.close()
+        finally:
+            os.remove(tmp_path)
+
+
+class _PooledConnection(sqlite3.Connection):
+    """記憶體資料庫的連線：close() 時回滾未提交的交易並放回連線池，保留已編譯的 SQL
+    已在連線池中的連線再次 close() 不做任何事 (避免同一條連線放回兩次，被兩個執行緒同時取用)
+    """
+
+    in_pool = False
+
+    def close(self):
+        with self.lock:
+            if self.in_pool:
+                return
+            self.rollback()
+            self.in_pool = True
+            self.pool.append(self)
+
+
+class MemoryBackend(SQLiteBackend):
+    """記憶體資料庫 (測試及效能量測用)：使用 SQLite 的 memdb，與檔案資料庫執行相同的 SQL，
+    不讀寫磁碟；同一程序內的連線共用資料，reset() 或程序結束後資料即消失
+    memdb 與檔案資料庫相同以資料庫層級上鎖，同時寫入時會等候 (共用快取模式的表格鎖會直接失敗)
+    不另外以 dict/list 實作：測試需驗證正式環境執行的 SQL，且每個查詢都要多維護一份；
+    目前 2000 個情境約 3 秒，已足夠測試及效能量測使用
+    """
+
+    name = "memory"
+    supports_replicas = False
+
+    def __init__(self, path_for):
+        # path_for 只用於備份檔名
+        super().__init__(path_for)
+        # 主辦者 -> 閒置連線 (至少保留一條，最後一條連線關閉時記憶體資料庫即被釋放)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _uri(self, tenant: str) -> str:
+        return f"file:/buying_system_{id(self)}_{tenant}?vfs=memdb"
+
+    def connect(self, tenant: str, replica: str = None):
+        with self._lock:
+            pool = self._pools.setdefault(tenant, [])
+            if pool:
+                conn = pool.pop()
+                conn.in_pool = False
+                return conn
+        conn = self._open(self._uri(tenant), uri=True, check_same_thread=False, factory=_PooledConnection)
+        conn.pool = pool
+        conn.lock = self._lock
+        return conn
+
+    def reset(self):
+        """清除所有主辦者的資料 (使用中的連線需先關閉)"""
+        with self._lock:
+            for pool in self._pools.values():
+                for conn in pool:
+                    sqlite3.Connection.close(conn)
+            self._pools.clear()
+
+
+class PostgresBackend:
+    """PostgreSQL (Cloud SQL)，每個主辦者一個 schema"""
+
+    name = "postgres"
+    primary_key = "SERIAL PRIMARY KEY"
+    supports_replicas = True
+    tenant_replicas = True
+    # 非同步讀取使用 asyncpg 連線池
+    async_reads = True
+    backup_suffix = ".dump"
+
+    def __init__(self, schema_for):
+        # 主辦者 -> schema 名稱
+        self.schema_for = schema_for
+
+    def _connect_params(self, replica: str = None) -> dict:
+        """連線設定 (DB_HOST 等環境變數)，replica 為 host[:port][/database]"""
+        host = os.environ.get("DB_HOST", "127.0.0.1")
+        port = int(os.environ.get("DB_PORT", "5432"))
+        database = os.environ.get("DB_NAME", "buying_system")
+        if replica:
+            host, _, database_part = replica.partition("/")
+            host, _, port_part = host.partition(":")
+            port = int(port_part) if port_part else port
+            database = database_part or database
+        return {
+            "host": host,
+            "port": port,
+            "database": database,
+            "user": os.environ.get("DB_USER", "postgres"),
+            "password": os.environ.get("DB_PASSWORD", ""),
+        }
+
+    def connect(self, tenant: str, replica: str = None):
+        # 用到時才載入驅動，加快啟動
+        import pg8000
+        conn = pg8000.connect(**self._connect_params(replica))
+        schema = self.schema_for(tenant)
+        if schema != "public":
+            # 立即提交，避免交易回滾時 search_path 一併還原
+            cursor = conn.cursor()
+            cursor.execute(f"SET search_path TO {schema}")
+            conn.commit()
+        return conn
+
+    def sql(self, query: str) -> str:
+        """將 ? 佔位符轉換為 %s"""
+        return query.replace("?", "%s")
+
+    def fetch_all(self, cursor, rows):
+        """將結果轉換為字典"""
+        if not rows:
+            return []
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def fetch_one(self, cursor, row):
+        if row is None:
+            return None
+        columns = [desc[0] for desc in cursor.description]
+        return dict(zip(columns, row))
+
+    def last_id(self, cursor, table: str) -> int:
+        cursor.execute(f"SELECT currval(pg_get_serial_sequence('{table}', 'id'))")
+        return cursor.fetchone()[0]
+
+    def prepare_schema(self, conn, tenant: str):
+        schema = self.schema_for(tenant)
+        if schema != "public":
+            conn.cursor().execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            conn.commit()
+
+    def get_schema_version(self, cursor) -> int:
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        return cursor.fetchone()[0] or 0
+
+    def set_schema_version(self, cursor, version: int):
+        cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        cursor.execute("DELETE FROM schema_version")
+        cursor.execute("INSERT INTO schema_version (version) VALUES (%s)", (version,))
+
+    def add_column(self, cursor, table: str, column: str, definition: str):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+
+    def ensure_cascade(self, conn, foreign_keys: list):
+        """外鍵缺少 ON DELETE CASCADE 時重新建立"""
+        cursor = conn.cursor()
+        for table, column, ref_table, _ in foreign_keys:
+            name = f"{table}_{column}_fkey"
+            # 以表格限定 (依 search_path)，避免查到其他主辦者 schema 的同名外鍵
+            cursor.execute(
+                "SELECT confdeltype FROM pg_constraint WHERE conname = %s AND conrelid = to_regclass(%s)", (name, table)
+            )
+            row = cursor.fetchone()
+            if row and row[0] == "c":
+                continue
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+            cursor.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name} "
+                f"FOREIGN KEY ({column}) REFERENCES {ref_table}(id) ON DELETE CASCADE"
+            )
+
+    def period(self, column: str, granularity: str) -> str:
+        return f"to_char({column}, '{'YYYY-MM-DD' if granularity == 'day' else 'YYYY-MM'}')"
+
+    def older_than(self, column: str, days: int) -> str:
+        return f"{column} < CURRENT_TIMESTAMP - INTERVAL '{int(days)} days'"
+
+    def stream(self, cursor, query: str, params, batch_size: int):
+        """pg8000 會一次讀入全部結果，改用伺服器端游標分批讀取 (需在交易中)"""
+        cursor.execute(f"DECLARE stream_rows NO SCROLL CURSOR FOR {query}", params)
+        while True:
+            cursor.execute(f"FETCH {int(batch_size)} FROM stream_rows")
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield rows
+
+    async def create_async_pool(self, tenant: str, min_size: int, max_size: int):
+        """建立主辦者的 asyncpg 連線池 (search_path 指向主辦者的 schema)"""
+        # 用到時才載入驅動 (選用套件，見 requirements-async.txt)
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("PostgreSQL 的非同步存取需要 asyncpg，請執行 pip install -r requirements-async.txt") from None
+        return await asyncpg.create_pool(
+            **self._connect_params(),
+            min_size=min_size,
+            max_size=max_size,
+            server_settings={"search_path": self.schema_for(tenant)},
+        )
+
+    def backup_prefix(self, tenant: str) -> str:
+        """備份檔名前綴 (資料庫名稱，非預設主辦者加上 schema)"""
+        prefix = os.environ.get("DB_NAME", "buying_system")
+        schema = self.schema_for(tenant)
+        return prefix if schema == "public" else f"{prefix}-{tenant}"
+
+    def _pg_env(self) -> dict:
+        """pg_dump / pg_restore 連線用的環境變數"""
+        params = self._connect_params()
+        return dict(
+            os.environ, PGHOST=params["host"], PGPORT=str(params["port"]), PGDATABASE=params["database"],
+            PGUSER=params["user"], PGPASSWORD=params["password"],
+        )
+
+    def backup(self, tenant: str, path: str, pages_per_step: int, step_sleep: float, max_restarts: int):
+        """PostgreSQL 邏輯備份 (custom 格式已內含壓縮)"""
+        subprocess.run(
+            ["pg_dump", "--format=custom", "--schema", self.schema_for(tenant), "--file", path],
+            env=self._pg_env(), check=True
+        )
+
+    def restore(self, tenant: str, path: str, pages_per_step: int, step_sleep: float):
+        env = self._pg_env()
+        subprocess.run(
+            ["pg_restore", "--clean", "--if-exists", "--no-owner", "--dbname", env["PGDATABASE"], path],
+            env=env, check=True
+        )
+
+
+BACKENDS = {"sqlite": SQLiteBackend, "memory": MemoryBackend, "postgres": PostgresBackend}
+
+
+def create_backend(name: str, path_for, schema_for):
+    """依名稱建立儲存後端"""
+    if name == "sqlite":
+        return SQLiteBackend(path_for)
+    if name == "memory":
+        return MemoryBackend(path_for)
+    if name == "postgres":
+        return PostgresBackend(schema_for)
+    raise ValueError(f"不支援的 DB_BACKEND：{name!r} (可用：{', '.join(BACKENDS)})")
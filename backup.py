@@ -0,0 +1,89 @@
+import glob
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import database as db
+
+# 備份目錄與保留份數
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "backups")
+BACKUP_RETENTION = int(os.environ.get("BACKUP_RETENTION", "14"))
+# 每一步複製的頁數與步驟間的暫停秒數，讓寫入可以在步驟之間取得鎖
+BACKUP_PAGES_PER_STEP = int(os.environ.get("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP = float(os.environ.get("BACKUP_STEP_SLEEP", "0.01"))
+# 複製期間資料庫被寫入會從頭重來，超過此次數後改為一次複製完成
+BACKUP_MAX_RESTARTS = int(os.environ.get("BACKUP_MAX_RESTARTS", "3"))
+
+logger = logging.getLogger(__name__)
+
+
+def _backup_prefix() -> str:
+    """備份檔名前綴 (目前主辦者)"""
+    return db.backend.backup_prefix(db.get_tenant())
+
+
+def _backup_suffix() -> str:
+    """備份檔副檔名"""
+    return db.backend.backup_suffix
+
+
+def create_backup(backup_dir: str = None) -> str:
+    """建立目前主辦者的壓縮備份，回傳備份檔路徑"""
+    backup_dir = backup_dir or BACKUP_DIR
+    os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(backup_dir, f"{_backup_prefix()}-{timestamp}{_backup_suffix()}")
+    # SQLite 以 online backup API 分段複製，步驟之間暫停不阻擋寫入；PostgreSQL 使用 pg_dump
+    db.backend.backup(db.get_tenant(), path, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP, BACKUP_MAX_RESTARTS)
+    return path
+
+
+def list_backups(backup_dir: str = None) -> list:
+    """列出備份檔 (新到舊)"""
+    backup_dir = backup_dir or BACKUP_DIR
+    pattern = os.path.join(backup_dir, f"{_backup_prefix()}-*{_backup_suffix()}")
+    return sorted(glob.glob(pattern), reverse=True)
+
+
+def prune_backups(backup_dir: str = None, keep: int = None) -> list:
+    """只保留最新的 keep 份備份，回傳被刪除的檔案"""
+    keep = BACKUP_RETENTION if keep is None else keep
+    removed = list_backups(backup_dir)[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def restore_backup(path: str):
+    """從備份檔還原目前主辦者的資料庫"""
+    db.backend.restore(db.get_tenant(), path, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP)
+
+
+def run_scheduled_backup(backup_dir: str = None) -> str:
+    """建立備份並依保留份數清除舊備份"""
+    path = create_backup(backup_dir)
+    prune_backups(backup_dir)
+    return path
+
+
+def start_backup_scheduler(interval_minutes: float, backup_dir: str = None, tenants: list = None) -> threading.Thread:
+    """在背景執行緒定期建立備份
+    tenants: 要備份的主辦者 (預設只有預設主辦者)
+    """
+    tenants = tenants or [db.DEFAULT_TENANT]
+
+    def loop():
+        while True:
+            time.sleep(interval_minutes * 60)
+            for tenant in tenants:
+                try:
+                    with db.using_tenant(tenant):
+                        run_scheduled_backup(backup_dir)
+                except Exception:
+                    logger.exception("備份失敗 (%s)", tenant)
+
+    thread = threading.Thread(target=loop, name="backup-scheduler", daemon=True)
+    thread.start()
+    return thread
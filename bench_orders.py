@@ -0,0 +1,82 @@
+"""訂單情境量測
+
+以隨機的團購情境 (建立團購單及品項、下單、修改、付款、刪除、查詢彙總) 量測資料存取層，
+每個情境結束後檢查訂單金額與銷售彙總是否一致。
+預設使用記憶體資料庫 (DB_BACKEND=memory)，不讀寫磁碟，數千個情境可在數秒內完成。
+
+用法：
+    python bench_orders.py [--scenarios 1000] [--backend memory|sqlite] [--seed 0]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+# 每個情境的品項數與顧客數
+ITEMS_PER_SCENARIO = 4
+CUSTOMERS_PER_SCENARIO = 6
+CUSTOMER_NAMES = ["王小明", "陳小美", "林大華", "張三", "李四", "Amy", "amy ", "ＢＯＢ"]
+
+
+def run_scenario(db, rng: random.Random, index: int):
+    """執行一個團購情境，金額不一致時拋出 AssertionError"""
+    order_id = db.create_group_order(f"情境 {index}", "量測")
+    item_ids = [db.add_item(order_id, f"品項 {n}", rng.choice([35, 50, 80, 120.5])) for n in range(ITEMS_PER_SCENARIO)]
+
+    customer_order_ids = []
+    for _ in range(CUSTOMERS_PER_SCENARIO):
+        items_qty = {item_id: rng.randint(1, 3) for item_id in rng.sample(item_ids, rng.randint(1, len(item_ids)))}
+        customer_order_ids.append(db.create_customer_order(order_id, rng.choice(CUSTOMER_NAMES), items_qty))
+
+    # 下單後調整價格，只影響之後的訂單
+    db.update_item_price(item_ids[0], rng.choice([40, 60]))
+    updated = rng.choice(customer_order_ids)
+    db.update_customer_order(updated, {item_ids[0]: rng.randint(1, 5)})
+    db.update_customer_order_paid_status(rng.choice(customer_order_ids), 1)
+    deleted = rng.choice(customer_order_ids)
+    db.delete_customer_order(deleted)
+
+    summary = db.get_group_order_summary(order_id)
+    expected = sum(o["total_amount"] for o in db.get_customer_orders_by_group(order_id))
+    actual = sum(row["total_amount"] for row in summary)
+    assert abs(expected - actual) < 0.01, f"情境 {index}：彙總金額 {actual} 與訂單金額 {expected} 不符"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量測訂單情境的執行速度")
+    parser.add_argument("--scenarios", type=int, default=1000, help="情境數 (預設 1000)")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory",
+                        help="儲存後端 (預設 memory；sqlite 使用暫存的全新資料庫檔案)")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子 (預設 0)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench_orders_")
+    os.environ["DB_BACKEND"] = args.backend
+    os.environ["SQLITE_DB"] = os.path.join(workdir, "bench.db")
+    # 需在設定儲存後端之後才載入
+    import database as db
+
+    try:
+        db.init_db()
+        rng = random.Random(args.seed)
+        start = time.perf_counter()
+        for index in range(args.scenarios):
+            run_scenario(db, rng, index)
+        elapsed = time.perf_counter() - start
+
+        # 增量維護的銷售彙總應與重新計算的結果相同
+        trend = db.get_sales_trend("day")
+        db.rebuild_rollups()
+        assert trend == db.get_sales_trend("day"), "銷售彙總與重新計算的結果不符"
+        assert db.check_order_totals() == [], "訂單金額與明細不符"
+
+        print(f"儲存後端：{db.DB_BACKEND}")
+        print(f"情境數：{args.scenarios}，耗時 {elapsed:.2f} 秒 ({args.scenarios / elapsed:.0f} 個情境/秒)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
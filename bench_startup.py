@@ -0,0 +1,91 @@
+"""啟動時間量測
+
+每次量測都在新的 Python 程序中執行，模擬 Cloud Run 新執行個體的冷啟動：
+- 各模組的載入時間
+- 第一次畫面產生 (含資料庫初始化) 的時間
+
+用法：
+    python bench_startup.py [--runs 5]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 依序載入，各自的時間不含前面已載入的相依模組
+IMPORT_MODULES = ["streamlit", "database", "backup", "pandas"]
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {app_dir!r})
+timings = []
+for name in {modules!r}:
+    start = time.perf_counter()
+    __import__(name)
+    timings.append(time.perf_counter() - start)
+print(*timings)
+"""
+
+RENDER_SNIPPET = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=60).run()
+assert not at.exception, at.exception
+first = time.perf_counter()
+at.run()
+second = time.perf_counter()
+print(imported - start, first - imported, second - first)
+"""
+
+
+def run_snippet(code: str, env: dict) -> list:
+    """在新的 Python 程序執行程式碼，回傳輸出的數值"""
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return [float(v) for v in output]
+
+
+def format_ms(values: list) -> str:
+    return f"{statistics.median(values) * 1000:8.1f} ms (min {min(values) * 1000:.1f}, max {max(values) * 1000:.1f})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量測冷啟動時間")
+    parser.add_argument("--runs", type=int, default=5, help="量測次數 (預設 5)")
+    parser.add_argument("--db", help="使用的 SQLite 資料庫 (預設使用暫存的全新資料庫)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    db_path = os.path.join(workdir, "bench.db")
+    if args.db:
+        shutil.copy(args.db, db_path)
+    env = dict(os.environ, SQLITE_DB=db_path)
+
+    try:
+        imports = [run_snippet(IMPORT_SNIPPET.format(app_dir=APP_DIR, modules=IMPORT_MODULES), env)
+                   for _ in range(args.runs)]
+        print("模組載入時間 (中位數)：")
+        for idx, name in enumerate(IMPORT_MODULES):
+            print(f"  {name:<12}{format_ms([r[idx] for r in imports])}")
+
+        # 第一次執行會建立資料庫結構，之後的程序應略過
+        renders = [run_snippet(RENDER_SNIPPET.format(app=os.path.join(APP_DIR, "app.py")), env)
+                   for _ in range(args.runs + 1)]
+        print("畫面產生時間：")
+        print(f"  首次啟動 (建立資料庫結構) {renders[0][1] * 1000:8.1f} ms")
+        print(f"  冷啟動首次畫面            {format_ms([r[1] for r in renders[1:]])}")
+        print(f"  同程序第二次畫面          {format_ms([r[2] for r in renders[1:]])}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
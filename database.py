@@ -1,33 +1,154 @@
+import contextlib
+import contextvars
+import itertools
+import logging
 import os
-import sqlite3
+import re
+import threading
+import time
+import unicodedata
 from datetime import datetime
 from typing import Optional
 
-# 檢查是否使用 Cloud SQL (透過環境變數)
-USE_CLOUD_SQL = os.environ.get("USE_CLOUD_SQL", "false").lower() == "true"
-DB_NAME = "group_buying.db"
+import backends
+
+# 儲存後端：sqlite (預設)、postgres (Cloud SQL) 或 memory (記憶體資料庫，測試及效能量測用)
+# 未設定 DB_BACKEND 時沿用舊設定 USE_CLOUD_SQL=true 選擇 postgres
+DB_BACKEND = os.environ.get("DB_BACKEND") or (
+    "postgres" if os.environ.get("USE_CLOUD_SQL", "false").lower() == "true" else "sqlite"
+)
+DB_NAME = os.environ.get("SQLITE_DB", "group_buying.db")
+
+# 資料庫結構版本，修改 init_db 的表格結構時需遞增
+SCHEMA_VERSION = 7
+
+# 唯讀副本 (逗號分隔)
+# SQLite: 資料庫檔案路徑，例如 replica1.db,replica2.db
+# PostgreSQL: host[:port][/database]，例如 10.0.0.5,10.0.0.6:5433/buying_system
+DB_READ_REPLICAS = [r.strip() for r in os.environ.get("DB_READ_REPLICAS", "").split(",") if r.strip()]
+# 寫入後在此秒數內，同一 session 的讀取改走主資料庫 (read-your-writes)
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "10"))
+# 背景清除已刪除資料：每批筆數與執行間隔
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "500"))
+PURGE_INTERVAL_SECONDS = float(os.environ.get("PURGE_INTERVAL_SECONDS", "600"))
+# 訂單變更紀錄保留天數 (即時儀表板只需要最近的紀錄)
+ORDER_EVENT_RETENTION_DAYS = int(os.environ.get("ORDER_EVENT_RETENTION_DAYS", "7"))
+
+logger = logging.getLogger(__name__)
+
+# 多主辦者分片：每個主辦者使用獨立的 SQLite 檔案 (PostgreSQL 為獨立 schema)
+# 預設主辦者沿用 DB_NAME / public schema，其他主辦者的 SQLite 檔案放在 TENANT_DB_DIR
+DEFAULT_TENANT = "default"
+TENANT_DB_DIR = os.environ.get("TENANT_DB_DIR", "tenants")
+_TENANT_ID_PATTERN = re.compile(r"^[a-z0-9_]{1,32}$")
+
+# 目前呼叫者的 session 識別 (由 app.py 每次執行時設定)
+_session_key = contextvars.ContextVar("db_session_key", default=None)
+# 目前呼叫者的主辦者 (決定連線到哪個分片)
+_tenant = contextvars.ContextVar("db_tenant", default=DEFAULT_TENANT)
+# session 識別 -> 最後寫入時間
+_last_write_at = {}
+_last_write_lock = threading.Lock()
+_replica_cycle = itertools.cycle(DB_READ_REPLICAS) if DB_READ_REPLICAS else None
+# 有資料被刪除時喚醒背景清除
+_purge_wakeup = threading.Event()
+
+
+def validate_tenant(tenant: str) -> str:
+    """檢查主辦者代號 (會用於檔名及 schema 名稱)"""
+    if not isinstance(tenant, str) or not _TENANT_ID_PATTERN.match(tenant):
+        raise ValueError(f"主辦者代號只能使用小寫英文、數字及底線 (最多 32 字)：{tenant!r}")
+    return tenant
+
+
+def set_tenant(tenant: Optional[str]):
+    """設定目前呼叫者的主辦者，之後的連線都會導向該主辦者的分片"""
+    _tenant.set(validate_tenant(tenant or DEFAULT_TENANT))
+
+
+def get_tenant() -> str:
+    """取得目前呼叫者的主辦者"""
+    return _tenant.get()
+
+
+@contextlib.contextmanager
+def using_tenant(tenant: str):
+    """在區塊內暫時切換主辦者 (背景工作逐一處理各分片時使用)"""
+    token = _tenant.set(validate_tenant(tenant))
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def tenant_db_path(tenant: str = None) -> str:
+    """主辦者的 SQLite 資料庫路徑"""
+    tenant = tenant or get_tenant()
+    if tenant == DEFAULT_TENANT:
+        return DB_NAME
+    return os.path.join(TENANT_DB_DIR, f"{tenant}.db")
+
+
+def tenant_schema(tenant: str = None) -> str:
+    """主辦者的 PostgreSQL schema"""
+    tenant = tenant or get_tenant()
+    return "public" if tenant == DEFAULT_TENANT else f"tenant_{tenant}"
+
+
+backend = backends.create_backend(DB_BACKEND, tenant_db_path, tenant_schema)
+
+
+def _connect(replica: str = None):
+    """建立連線 (目前主辦者的分片)，replica 為 None 時連到主資料庫"""
+    return backend.connect(get_tenant(), replica)
 
-if USE_CLOUD_SQL:
-    import pg8000
-    import pg8000.native
 
 def get_connection():
-    """取得資料庫連線"""
-    if USE_CLOUD_SQL:
-        # Cloud SQL PostgreSQL 連線
-        conn = pg8000.connect(
-            host=os.environ.get("DB_HOST", "127.0.0.1"),
-            port=int(os.environ.get("DB_PORT", "5432")),
-            database=os.environ.get("DB_NAME", "buying_system"),
-            user=os.environ.get("DB_USER", "postgres"),
-            password=os.environ.get("DB_PASSWORD", "")
-        )
-        return conn
-    else:
-        # 本地 SQLite 連線
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        return conn
+    """取得資料庫連線 (主資料庫，寫入用)"""
+    return _connect()
+
+
+def set_session(session_key: Optional[str]):
+    """設定目前呼叫者的 session，用於 read-your-writes 判斷"""
+    _session_key.set(session_key)
+
+
+def _recently_wrote() -> bool:
+    """目前 session 是否在 READ_YOUR_WRITES_SECONDS 內寫入過"""
+    key = _session_key.get()
+    if key is None:
+        return False
+    last = _last_write_at.get(key)
+    return last is not None and time.monotonic() - last < READ_YOUR_WRITES_SECONDS
+
+
+def get_read_connection():
+    """取得唯讀連線：有設定副本時輪流使用副本，剛寫入過的 session 仍使用主資料庫
+    SQLite 副本是單一檔案，只供預設主辦者使用；記憶體資料庫沒有副本
+    """
+    if _replica_cycle is None or not backend.supports_replicas or _recently_wrote():
+        return _connect()
+    if not backend.tenant_replicas and get_tenant() != DEFAULT_TENANT:
+        return _connect()
+    with _last_write_lock:
+        replica = next(_replica_cycle)
+    return _connect(replica)
+
+
+def _commit(conn):
+    """提交交易並記錄目前 session 的寫入時間"""
+    conn.commit()
+    key = _session_key.get()
+    if key is None:
+        return
+    now = time.monotonic()
+    with _last_write_lock:
+        _last_write_at[key] = now
+        # 清除已超過視窗的紀錄，避免無限成長
+        if len(_last_write_at) > 1000:
+            for k, t in list(_last_write_at.items()):
+                if now - t >= READ_YOUR_WRITES_SECONDS:
+                    del _last_write_at[k]
 
 
 def dict_row(cursor, row):
@@ -38,153 +159,406 @@ def dict_row(cursor, row):
     return dict(zip(columns, row))
 
 
+# 表格結構 ({pk} 為儲存後端的自動編號主鍵，{table} 讓 SQLite 重建表格時可使用暫時名稱)
+_TABLE_DDL = {
+    "group_orders": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {pk},
+            title TEXT NOT NULL,
+            description TEXT,
+            status TEXT DEFAULT 'open',
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            deleted_at TIMESTAMP
+        )
+    """,
+    "items": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {pk},
+            group_order_id INTEGER NOT NULL REFERENCES group_orders(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            deleted_at TIMESTAMP
+        )
+    """,
+    "customers": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {pk},
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    "customer_orders": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {pk},
+            group_order_id INTEGER NOT NULL REFERENCES group_orders(id) ON DELETE CASCADE,
+            customer_name TEXT NOT NULL,
+            customer_id INTEGER REFERENCES customers(id),
+            note TEXT,
+            is_paid INTEGER DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            idempotency_key TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            deleted_at TIMESTAMP
+        )
+    """,
+    "order_details": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {pk},
+            customer_order_id INTEGER NOT NULL REFERENCES customer_orders(id) ON DELETE CASCADE,
+            item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL DEFAULT 0
+        )
+    """,
+    # 編號只增不減，刪除後也不會重複使用 (變更紀錄的游標)
+    "order_events": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            id {pk},
+            group_order_id INTEGER NOT NULL,
+            customer_order_id INTEGER,
+            event TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+# 舊資料庫需補上的欄位 (表格, 欄位, 定義)
+_ADDED_COLUMNS = [
+    ("group_orders", "start_time", "TIMESTAMP"),
+    ("group_orders", "end_time", "TIMESTAMP"),
+    ("group_orders", "deleted_at", "TIMESTAMP"),
+    ("items", "deleted_at", "TIMESTAMP"),
+    ("customer_orders", "note", "TEXT"),
+    ("customer_orders", "is_paid", "INTEGER DEFAULT 0"),
+    ("customer_orders", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("customer_orders", "total_amount", "REAL NOT NULL DEFAULT 0"),
+    ("customer_orders", "item_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("customer_orders", "idempotency_key", "TEXT"),
+    ("customer_orders", "customer_id", "INTEGER REFERENCES customers(id)"),
+    ("customer_orders", "deleted_at", "TIMESTAMP"),
+    ("order_details", "unit_price", "REAL NOT NULL DEFAULT 0"),
+]
+
+# 需要 ON DELETE CASCADE 的外鍵 (表格, 欄位, 參照表格)，舊資料庫的外鍵沒有串聯刪除
+_CASCADE_FOREIGN_KEYS = [
+    ("items", "group_order_id", "group_orders"),
+    ("customer_orders", "group_order_id", "group_orders"),
+    ("order_details", "customer_order_id", "customer_orders"),
+    ("order_details", "item_id", "items"),
+]
+
+
+# 由訂單明細重新計算訂單金額及件數 (UPDATE customer_orders 的 SET 子句)
+# 金額以明細記錄的下單時單價計算；合併品項只為排除已刪除的品項
+_ORDER_TOTALS_SET = """
+    total_amount = (
+        SELECT COALESCE(SUM(od.quantity * od.unit_price), 0)
+        FROM order_details od JOIN items i ON od.item_id = i.id AND i.deleted_at IS NULL
+        WHERE od.customer_order_id = customer_orders.id),
+    item_count = (
+        SELECT COALESCE(SUM(od.quantity), 0)
+        FROM order_details od JOIN items i ON od.item_id = i.id AND i.deleted_at IS NULL
+        WHERE od.customer_order_id = customer_orders.id)
+"""
+
+
 def init_db():
-    """初始化資料庫表格"""
+    """初始化目前主辦者的資料庫表格 (結構版本已是最新時直接略過)"""
     conn = get_connection()
+    backend.prepare_schema(conn, get_tenant())
     cursor = conn.cursor()
     
-    if USE_CLOUD_SQL:
-        # PostgreSQL 語法
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS group_orders (
-                id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT,
-                status TEXT DEFAULT 'open',
-                start_time TIMESTAMP,
-                end_time TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS items (
-                id SERIAL PRIMARY KEY,
-                group_order_id INTEGER NOT NULL REFERENCES group_orders(id),
-                name TEXT NOT NULL,
-                price REAL NOT NULL
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS customer_orders (
-                id SERIAL PRIMARY KEY,
-                group_order_id INTEGER NOT NULL REFERENCES group_orders(id),
-                customer_name TEXT NOT NULL,
-                note TEXT,
-                is_paid INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS order_details (
-                id SERIAL PRIMARY KEY,
-                customer_order_id INTEGER NOT NULL REFERENCES customer_orders(id),
-                item_id INTEGER NOT NULL REFERENCES items(id),
-                quantity INTEGER NOT NULL
-            )
-        """)
-    else:
-        # SQLite 語法
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS group_orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT,
-                status TEXT DEFAULT 'open',
-                start_time TIMESTAMP,
-                end_time TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # 檢查是否需要新增欄位 (相容舊資料庫)
-        cursor.execute("PRAGMA table_info(group_orders)")
-        columns = [col[1] for col in cursor.fetchall()]
-        if 'start_time' not in columns:
-            cursor.execute("ALTER TABLE group_orders ADD COLUMN start_time TIMESTAMP")
-        if 'end_time' not in columns:
-            cursor.execute("ALTER TABLE group_orders ADD COLUMN end_time TIMESTAMP")
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_order_id INTEGER NOT NULL,
+    previous_version = backend.get_schema_version(cursor)
+    if previous_version >= SCHEMA_VERSION:
+        conn.close()
+        return
+    
+    for table, ddl in _TABLE_DDL.items():
+        cursor.execute(ddl.format(table=table, pk=backend.primary_key))
+    for table, column, definition in _ADDED_COLUMNS:
+        backend.add_column(cursor, table, column, definition)
+    backend.ensure_cascade(conn, [
+        (table, column, ref_table, _TABLE_DDL[table].replace("{pk}", backend.primary_key))
+        for table, column, ref_table in _CASCADE_FOREIGN_KEYS
+    ])
+    
+    # 外鍵索引 (查詢明細、串聯刪除都需要)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_group_order ON items (group_order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customer_orders_group_order ON customer_orders (group_order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_details_customer_order ON order_details (customer_order_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_details_item ON order_details (item_id)")
+    # 待清除資料的部分索引
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_deleted ON items (deleted_at) WHERE deleted_at IS NOT NULL")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_customer_orders_deleted ON customer_orders (deleted_at) WHERE deleted_at IS NOT NULL"
+    )
+    # 依顧客查詢訂單 (跨團購單或指定團購單)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customer_orders_customer ON customer_orders (customer_id, group_order_id)")
+    # 依團購單讀取新的變更紀錄
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_events_group_order ON order_events (group_order_id, id)")
+    # 重複送出的訂單以冪等鍵辨識
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_customer_orders_idempotency ON customer_orders (idempotency_key) "
+        "WHERE idempotency_key IS NOT NULL"
+    )
+    
+    # 銷售彙總表
+    for table in _ROLLUP_PERIODS:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                period TEXT NOT NULL,
+                dimension TEXT NOT NULL,
                 name TEXT NOT NULL,
-                price REAL NOT NULL,
-                FOREIGN KEY (group_order_id) REFERENCES group_orders(id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS customer_orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_order_id INTEGER NOT NULL,
-                customer_name TEXT NOT NULL,
-                note TEXT,
-                is_paid INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (group_order_id) REFERENCES group_orders(id)
-            )
-        """)
-        
-        # 檢查是否需要新增欄位 (相容舊資料庫)
-        cursor.execute("PRAGMA table_info(customer_orders)")
-        columns = [col[1] for col in cursor.fetchall()]
-        if 'note' not in columns:
-            cursor.execute("ALTER TABLE customer_orders ADD COLUMN note TEXT")
-        if 'is_paid' not in columns:
-            cursor.execute("ALTER TABLE customer_orders ADD COLUMN is_paid INTEGER DEFAULT 0")
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS order_details (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_order_id INTEGER NOT NULL,
-                item_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                FOREIGN KEY (customer_order_id) REFERENCES customer_orders(id),
-                FOREIGN KEY (item_id) REFERENCES items(id)
+                quantity INTEGER NOT NULL DEFAULT 0,
+                amount REAL NOT NULL DEFAULT 0,
+                orders INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (period, dimension, name)
             )
         """)
     
+    # 版本 7：訂單明細記錄下單時的單價，既有明細以目前價格回填
+    if previous_version < 7:
+        cursor.execute("UPDATE order_details SET unit_price = (SELECT price FROM items WHERE items.id = order_details.item_id)")
+    # 版本 2：訂單金額及件數改為寫入時儲存，回填既有訂單
+    if previous_version < 2:
+        cursor.execute(f"UPDATE customer_orders SET {_ORDER_TOTALS_SET}")
+    # 版本 6：由既有訂單的姓名建立顧客資料
+    if previous_version < 6:
+        _backfill_customers(cursor)
+    # 版本 5：由既有訂單建立銷售彙總；版本 6：顧客排行改依顧客編號合併
+    if previous_version < 6:
+        _rebuild_rollups(cursor)
+    
+    backend.set_schema_version(cursor, SCHEMA_VERSION)
     conn.commit()
     conn.close()
 
 
 def _sql(query: str) -> str:
-    """將 SQLite 的 ? 佔位符轉換為 PostgreSQL 的 %s"""
-    if USE_CLOUD_SQL:
-        return query.replace("?", "%s")
-    return query
+    """將 ? 佔位符轉換為儲存後端的寫法 (PostgreSQL 為 %s)"""
+    return backend.sql(query)
 
 
 def _fetch_all(cursor, rows):
-    """處理 fetchall 結果，PostgreSQL 需要轉換為字典"""
-    if USE_CLOUD_SQL:
-        if not rows:
-            return []
-        columns = [desc[0] for desc in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
-    return rows
+    """處理 fetchall 結果 (PostgreSQL 轉換為字典，SQLite 為 sqlite3.Row)"""
+    return backend.fetch_all(cursor, rows)
 
 
 def _fetch_one(cursor, row):
-    """處理 fetchone 結果，PostgreSQL 需要轉換為字典"""
-    if USE_CLOUD_SQL:
-        if row is None:
-            return None
-        columns = [desc[0] for desc in cursor.description]
-        return dict(zip(columns, row))
-    return row
+    """處理 fetchone 結果 (PostgreSQL 轉換為字典，SQLite 為 sqlite3.Row)"""
+    return backend.fetch_one(cursor, row)
 
 
-def _get_last_id(cursor, conn, table_name: str) -> int:
+def _get_last_id(cursor, table_name: str) -> int:
     """取得最後插入的 ID"""
-    if USE_CLOUD_SQL:
-        cursor.execute(f"SELECT currval(pg_get_serial_sequence('{table_name}', 'id'))")
-        return cursor.fetchone()[0]
-    return cursor.lastrowid
+    return backend.last_id(cursor, table_name)
+
+
+# ============ 變更紀錄 ============
+# event: created 新增訂單 / updated 修改訂單 / deleted 刪除訂單 / paid 付款狀態變更 / items 品項變更
+
+def _log_order_event(cursor, event: str, customer_order_id: int):
+    """在目前交易中記錄顧客訂單的變更"""
+    cursor.execute(_sql("""
+        INSERT INTO order_events (group_order_id, customer_order_id, event)
+        SELECT group_order_id, id, ? FROM customer_orders WHERE id = ?
+    """), (event, customer_order_id))
+
+
+def _log_items_event(cursor, group_order_id: int = None, item_id: int = None):
+    """在目前交易中記錄品項的變更 (依團購單或品項編號)"""
+    if group_order_id is not None:
+        cursor.execute(
+            _sql("INSERT INTO order_events (group_order_id, event) VALUES (?, 'items')"), (group_order_id,)
+        )
+    else:
+        cursor.execute(_sql("""
+            INSERT INTO order_events (group_order_id, event)
+            SELECT group_order_id, 'items' FROM items WHERE id = ?
+        """), (item_id,))
+
+
+def get_latest_order_event_id() -> int:
+    """取得目前最新的變更紀錄編號 (作為讀取變更的起始游標)"""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM order_events")
+    latest = cursor.fetchone()[0]
+    conn.close()
+    return latest
+
+
+def get_order_events(group_order_id: int, since_id: int, limit: int = 500) -> list:
+    """取得團購單在游標之後的變更紀錄 (依編號排序)"""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql("""
+        SELECT id, customer_order_id, event, created_at FROM order_events
+        WHERE group_order_id = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """), (group_order_id, since_id, limit))
+    events = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return events
+
+
+def get_order_lines(group_order_id: int, customer_order_ids: list = None) -> list:
+    """取得顧客訂單目前的明細 (未指定訂單時為整張團購單)
+    每筆訂單至少一列，沒有明細時品項欄位為空；已刪除的訂單不會出現
+    """
+    query = """
+        SELECT co.id AS customer_order_id, co.customer_name, co.is_paid, od.item_id, od.quantity, od.unit_price
+        FROM customer_orders co
+        LEFT JOIN order_details od ON od.customer_order_id = co.id
+        WHERE co.group_order_id = ? AND co.deleted_at IS NULL
+    """
+    params = [group_order_id]
+    if customer_order_ids is not None:
+        if not customer_order_ids:
+            return []
+        query += f" AND co.id IN ({', '.join('?' for _ in customer_order_ids)})"
+        params += list(customer_order_ids)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql(query), params)
+    lines = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return lines
+
+
+# ============ 銷售彙總 ============
+# 依下單日期累計的銷售彙總，訂單寫入時在同一交易中增減，報表不需掃描全部明細
+
+# 彙總表 -> 期間 (運算式由目前的儲存後端產生)
+_ROLLUP_PERIODS = {"sales_daily": "day", "sales_monthly": "month"}
+ROLLUP_TABLES = {"day": "sales_daily", "month": "sales_monthly"}
+# 維度 -> (名稱, 數量, 金額, 訂單數, 額外 JOIN)
+_ROLLUP_DIMENSIONS = {
+    "item": (
+        "i.name", "SUM(od.quantity)", "SUM(od.quantity * od.unit_price)", "COUNT(DISTINCT co.id)",
+        "JOIN order_details od ON od.customer_order_id = co.id "
+        "JOIN items i ON od.item_id = i.id AND i.deleted_at IS NULL",
+    ),
+    "group_order": ("CAST(co.group_order_id AS TEXT)", "SUM(co.item_count)", "SUM(co.total_amount)", "COUNT(*)", ""),
+    "customer": (
+        "c.name", "SUM(co.item_count)", "SUM(co.total_amount)", "COUNT(*)",
+        "JOIN customers c ON co.customer_id = c.id",
+    ),
+}
+
+
+def _apply_rollups(cursor, where: str, params: tuple, sign: int):
+    """將符合條件的顧客訂單加入 (sign=1) 或扣除 (sign=-1) 銷售彙總
+    修改訂單時先扣除舊內容、寫入後再加入新內容
+    """
+    for table, granularity in _ROLLUP_PERIODS.items():
+        period = backend.period("co.created_at", granularity)
+        for dimension, (name, quantity, amount, orders, joins) in _ROLLUP_DIMENSIONS.items():
+            cursor.execute(_sql(f"""
+                INSERT INTO {table} (period, dimension, name, quantity, amount, orders)
+                SELECT {period}, '{dimension}', {name}, {quantity} * ?, {amount} * ?, {orders} * ?
+                FROM customer_orders co
+                JOIN group_orders g ON co.group_order_id = g.id AND g.deleted_at IS NULL
+                {joins}
+                WHERE co.deleted_at IS NULL AND {where}
+                GROUP BY 1, 3
+                ON CONFLICT (period, dimension, name) DO UPDATE SET
+                    quantity = {table}.quantity + excluded.quantity,
+                    amount = {table}.amount + excluded.amount,
+                    orders = {table}.orders + excluded.orders
+            """), (sign, sign, sign) + tuple(params))
+
+
+def _rebuild_rollups(cursor):
+    """清空並由全部訂單重新計算銷售彙總"""
+    for table in _ROLLUP_PERIODS:
+        cursor.execute(f"DELETE FROM {table}")
+    _apply_rollups(cursor, "1 = 1", (), 1)
+
+
+def rebuild_rollups() -> int:
+    """重建銷售彙總表 (單一交易)，回傳每日彙總的列數"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    _rebuild_rollups(cursor)
+    cursor.execute("SELECT COUNT(*) FROM sales_daily")
+    count = cursor.fetchone()[0]
+    _commit(conn)
+    conn.close()
+    return count
+
+
+def _period_filter(start: str = None, end: str = None) -> tuple:
+    """期間範圍條件 (含起訖)"""
+    conditions, params = [], []
+    if start:
+        conditions.append("period >= ?")
+        params.append(start)
+    if end:
+        conditions.append("period <= ?")
+        params.append(end)
+    return "".join(f" AND {c}" for c in conditions), params
+
+
+def get_rollup_periods(granularity: str = "month") -> list:
+    """取得有銷售紀錄的期間 (新到舊)"""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT DISTINCT period FROM {ROLLUP_TABLES[granularity]} WHERE dimension = 'group_order' AND orders > 0 "
+        "ORDER BY period DESC"
+    )
+    periods = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return periods
+
+
+def get_sales_trend(granularity: str = "month", start: str = None, end: str = None) -> list:
+    """各期間的營業額、件數及訂單數
+    granularity: day / month；start、end 為期間字串 (含)，例如 2026-01、2026-12
+    """
+    where, params = _period_filter(start, end)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql(f"""
+        SELECT period, SUM(amount) AS amount, SUM(quantity) AS quantity, SUM(orders) AS orders
+        FROM {ROLLUP_TABLES[granularity]}
+        WHERE dimension = 'group_order'{where}
+        GROUP BY period
+        HAVING SUM(orders) > 0
+        ORDER BY period
+    """), params)
+    trend = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return trend
+
+
+def get_top_sales(dimension: str, granularity: str = "month", start: str = None, end: str = None,
+                  limit: int = 20) -> list:
+    """期間內營業額最高的品項 / 團購單 / 顧客
+    dimension: item (品項名稱) / group_order (團購單編號) / customer (顧客姓名，同一顧客的不同寫法已合併)
+    """
+    where, params = _period_filter(start, end)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql(f"""
+        SELECT name, SUM(amount) AS amount, SUM(quantity) AS quantity, SUM(orders) AS orders
+        FROM {ROLLUP_TABLES[granularity]}
+        WHERE dimension = ?{where}
+        GROUP BY name
+        HAVING SUM(orders) > 0
+        ORDER BY SUM(amount) DESC
+        LIMIT ?
+    """), [dimension] + params + [limit])
+    top = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return top
 
 
 # ============ 團購單相關 ============
@@ -197,34 +571,39 @@ def create_group_order(title: str, description: str = "", start_time: str = None
         _sql("INSERT INTO group_orders (title, description, start_time, end_time) VALUES (?, ?, ?, ?)"),
         (title, description, start_time, end_time)
     )
-    order_id = _get_last_id(cursor, conn, "group_orders")
-    conn.commit()
+    order_id = _get_last_id(cursor, "group_orders")
+    _commit(conn)
     conn.close()
     return order_id
 
 
 def get_all_group_orders():
     """取得所有團購單"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM group_orders ORDER BY created_at DESC")
+    cursor.execute("SELECT * FROM group_orders WHERE deleted_at IS NULL ORDER BY created_at DESC")
     orders = _fetch_all(cursor, cursor.fetchall())
     conn.close()
     return orders
 
 
+# 以下查詢字串與 async_db.py 共用 (asyncpg 讀取時轉換佔位符)
+_OPEN_GROUP_ORDERS_SQL = """
+    SELECT * FROM group_orders
+    WHERE status = 'open' AND deleted_at IS NULL
+    AND (start_time IS NULL OR start_time <= ?)
+    AND (end_time IS NULL OR end_time >= ?)
+    ORDER BY created_at DESC
+"""
+_GROUP_ORDER_BY_ID_SQL = "SELECT * FROM group_orders WHERE id = ? AND deleted_at IS NULL"
+
+
 def get_open_group_orders():
     """取得開放中的團購單 (根據時間和狀態)"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     now = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute(_sql("""
-        SELECT * FROM group_orders 
-        WHERE status = 'open' 
-        AND (start_time IS NULL OR start_time <= ?)
-        AND (end_time IS NULL OR end_time >= ?)
-        ORDER BY created_at DESC
-    """), (now, now))
+    cursor.execute(_sql(_OPEN_GROUP_ORDERS_SQL), (now, now))
     orders = _fetch_all(cursor, cursor.fetchall())
     conn.close()
     return orders
@@ -235,20 +614,35 @@ def update_group_order_status(order_id: int, status: str):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(_sql("UPDATE group_orders SET status = ? WHERE id = ?"), (status, order_id))
-    conn.commit()
+    _commit(conn)
     conn.close()
 
 
 def get_group_order_by_id(order_id: int):
     """取得單一團購單"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("SELECT * FROM group_orders WHERE id = ?"), (order_id,))
+    cursor.execute(_sql(_GROUP_ORDER_BY_ID_SQL), (order_id,))
     order = _fetch_one(cursor, cursor.fetchone())
     conn.close()
     return order
 
 
+def get_group_order_revision(group_order_id: int) -> tuple:
+    """取得團購單的資料版本 (主辦者、最新變更紀錄編號及變更紀錄筆數)
+    品項或訂單的每次寫入都會在同一交易中新增變更紀錄，編號只增不減，供畫面快取判斷是否需重新計算
+    PostgreSQL 較小的編號可能較晚提交，此時最大編號不變但筆數增加
+    """
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        _sql("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM order_events WHERE group_order_id = ?"), (group_order_id,)
+    )
+    revision = tuple(cursor.fetchone())
+    conn.close()
+    return (get_tenant(),) + revision
+
+
 def update_group_order(order_id: int, title: str, description: str, start_time: str, end_time: str):
     """更新團購單資訊"""
     conn = get_connection()
@@ -258,27 +652,49 @@ def update_group_order(order_id: int, title: str, description: str, start_time:
         SET title = ?, description = ?, start_time = ?, end_time = ?
         WHERE id = ?
     """), (title, description, start_time, end_time, order_id))
-    conn.commit()
+    _commit(conn)
     conn.close()
 
 
-def delete_group_order(order_id: int):
-    """刪除團購單及相關資料"""
+def clone_group_order(order_id: int, start_time: str, end_time: str, title: str = None,
+                      price_adjust_pct: float = 0) -> Optional[int]:
+    """複製團購單及其所有品項 (單一交易)，原團購單不存在時回傳 None
+    start_time / end_time: 新團購單的期間 (必填，不沿用原日期，也不會建立不限期間的團購單)
+    price_adjust_pct: 價格調整百分比，例如 10 表示漲價 10%
+    """
     conn = get_connection()
     cursor = conn.cursor()
-    # 刪除訂單明細
     cursor.execute(_sql("""
-        DELETE FROM order_details WHERE customer_order_id IN 
-        (SELECT id FROM customer_orders WHERE group_order_id = ?)
-    """), (order_id,))
-    # 刪除顧客訂單
-    cursor.execute(_sql("DELETE FROM customer_orders WHERE group_order_id = ?"), (order_id,))
-    # 刪除品項
-    cursor.execute(_sql("DELETE FROM items WHERE group_order_id = ?"), (order_id,))
-    # 刪除團購單
-    cursor.execute(_sql("DELETE FROM group_orders WHERE id = ?"), (order_id,))
-    conn.commit()
+        INSERT INTO group_orders (title, description, status, start_time, end_time)
+        SELECT COALESCE(?, title), description, 'open', ?, ?
+        FROM group_orders WHERE id = ? AND deleted_at IS NULL
+    """), (title, start_time, end_time, order_id))
+    if cursor.rowcount == 0:
+        conn.close()
+        return None
+    new_order_id = _get_last_id(cursor, "group_orders")
+    cursor.execute(_sql("""
+        INSERT INTO items (group_order_id, name, price)
+        SELECT ?, name, ROUND(CAST(price * ? AS NUMERIC), 2)
+        FROM items WHERE group_order_id = ? AND deleted_at IS NULL
+        ORDER BY id
+    """), (new_order_id, 1 + price_adjust_pct / 100, order_id))
+    _log_items_event(cursor, group_order_id=new_order_id)
+    _commit(conn)
+    conn.close()
+    return new_order_id
+
+
+def delete_group_order(order_id: int):
+    """刪除團購單 (標記刪除，相關資料由背景清除)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    _apply_rollups(cursor, "co.group_order_id = ?", (order_id,), -1)
+    cursor.execute(_sql("UPDATE group_orders SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?"), (order_id,))
+    cursor.execute(_sql("UPDATE customer_orders SET idempotency_key = NULL WHERE group_order_id = ?"), (order_id,))
+    _commit(conn)
     conn.close()
+    _purge_wakeup.set()
 
 
 # ============ 品項相關 ============
@@ -291,106 +707,276 @@ def add_item(group_order_id: int, name: str, price: float) -> int:
         _sql("INSERT INTO items (group_order_id, name, price) VALUES (?, ?, ?)"),
         (group_order_id, name, price)
     )
-    item_id = _get_last_id(cursor, conn, "items")
-    conn.commit()
+    item_id = _get_last_id(cursor, "items")
+    _log_items_event(cursor, group_order_id=group_order_id)
+    _commit(conn)
     conn.close()
     return item_id
 
 
+def add_items_bulk(group_order_id: int, items: list) -> int:
+    """批次新增品項 (單一交易寫入)
+    items: [{"name": ..., "price": ...}]
+    """
+    if not items:
+        return 0
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        _sql("INSERT INTO items (group_order_id, name, price) VALUES (?, ?, ?)"),
+        [(group_order_id, item['name'], item['price']) for item in items]
+    )
+    _log_items_event(cursor, group_order_id=group_order_id)
+    _commit(conn)
+    conn.close()
+    return len(items)
+
+
+_ITEMS_BY_GROUP_ORDER_SQL = "SELECT * FROM items WHERE group_order_id = ? AND deleted_at IS NULL"
+
+
 def get_items_by_group_order(group_order_id: int):
     """取得團購單的所有品項"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("SELECT * FROM items WHERE group_order_id = ?"), (group_order_id,))
+    cursor.execute(_sql(_ITEMS_BY_GROUP_ORDER_SQL), (group_order_id,))
     items = _fetch_all(cursor, cursor.fetchall())
     conn.close()
     return items
 
 
+# 購買某品項的顧客訂單 (銷售彙總增減的條件)
+_ORDERS_WITH_ITEM = "co.id IN (SELECT customer_order_id FROM order_details WHERE item_id = ?)"
+
+
+def update_item_price(item_id: int, price: float):
+    """更新品項價格 (只影響之後的訂單，已下訂單保留下單時的單價)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql("UPDATE items SET price = ? WHERE id = ?"), (price, item_id))
+    _log_items_event(cursor, item_id=item_id)
+    _commit(conn)
+    conn.close()
+
+
 def delete_item(item_id: int):
-    """刪除品項"""
+    """刪除品項 (標記刪除，訂單明細由背景清除)"""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("DELETE FROM order_details WHERE item_id = ?"), (item_id,))
-    cursor.execute(_sql("DELETE FROM items WHERE id = ?"), (item_id,))
-    conn.commit()
+    _apply_rollups(cursor, _ORDERS_WITH_ITEM, (item_id,), -1)
+    cursor.execute(_sql("UPDATE items SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?"), (item_id,))
+    # 重新計算購買此品項的訂單金額
+    cursor.execute(_sql(f"""
+        UPDATE customer_orders SET {_ORDER_TOTALS_SET}
+        WHERE id IN (SELECT customer_order_id FROM order_details WHERE item_id = ?)
+    """), (item_id,))
+    _apply_rollups(cursor, _ORDERS_WITH_ITEM, (item_id,), 1)
+    _log_items_event(cursor, item_id=item_id)
+    _commit(conn)
     conn.close()
+    _purge_wakeup.set()
+
+
+# ============ 顧客相關 ============
+# 顧客以姓名的比對鍵辨識，訂單以顧客編號關聯 (customer_orders.customer_name 保留下單時輸入的姓名)
+
+def _customer_name_key(name: str) -> str:
+    """顧客姓名的比對鍵：統一全形半形、忽略大小寫及多餘空白"""
+    return " ".join(unicodedata.normalize("NFKC", name).split()).casefold()
+
+
+def _get_customer_id(cursor, name: str) -> int:
+    """取得姓名對應的顧客編號，不存在時建立 (在目前交易中)"""
+    key = _customer_name_key(name)
+    cursor.execute(
+        _sql("INSERT INTO customers (name, name_key) VALUES (?, ?) ON CONFLICT (name_key) DO NOTHING"),
+        (" ".join(name.split()), key)
+    )
+    cursor.execute(_sql("SELECT id FROM customers WHERE name_key = ?"), (key,))
+    return cursor.fetchone()[0]
+
+
+def _backfill_customers(cursor):
+    """為尚未關聯顧客的訂單建立顧客資料 (同一姓名的不同寫法合併為一位顧客)"""
+    cursor.execute("SELECT DISTINCT customer_name FROM customer_orders WHERE customer_id IS NULL")
+    for name in [row[0] for row in cursor.fetchall()]:
+        cursor.execute(
+            _sql("UPDATE customer_orders SET customer_id = ? WHERE customer_id IS NULL AND customer_name = ?"),
+            (_get_customer_id(cursor, name), name)
+        )
+
+
+def get_customer_by_name(name: str):
+    """根據姓名取得顧客 (不分大小寫、全形半形及多餘空白)"""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql("SELECT * FROM customers WHERE name_key = ?"), (_customer_name_key(name),))
+    customer = _fetch_one(cursor, cursor.fetchone())
+    conn.close()
+    return customer
+
+
+def get_customer_order_history(customer_id: int):
+    """取得顧客在所有團購單的訂單 (新到舊，含團購單名稱)"""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql("""
+        SELECT co.*, g.title AS group_order_title
+        FROM customer_orders co
+        JOIN group_orders g ON co.group_order_id = g.id AND g.deleted_at IS NULL
+        WHERE co.customer_id = ? AND co.deleted_at IS NULL
+        ORDER BY co.created_at DESC
+    """), (customer_id,))
+    orders = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return orders
+
+
+def get_repeat_customers(min_group_orders: int = 2, limit: int = 50):
+    """回購顧客統計：參加至少 min_group_orders 張團購單的顧客，依消費金額排序"""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql("""
+        SELECT c.id, c.name,
+               COUNT(DISTINCT co.group_order_id) AS group_orders,
+               COUNT(*) AS orders,
+               SUM(co.total_amount) AS amount,
+               MIN(co.created_at) AS first_order_at,
+               MAX(co.created_at) AS last_order_at
+        FROM customers c
+        JOIN customer_orders co ON co.customer_id = c.id AND co.deleted_at IS NULL
+        JOIN group_orders g ON co.group_order_id = g.id AND g.deleted_at IS NULL
+        GROUP BY c.id, c.name
+        HAVING COUNT(DISTINCT co.group_order_id) >= ?
+        ORDER BY SUM(co.total_amount) DESC
+        LIMIT ?
+    """), (min_group_orders, limit))
+    customers = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return customers
 
 
 # ============ 顧客訂單相關 ============
 
-def create_customer_order(group_order_id: int, customer_name: str, items_qty: dict, note: str = "") -> int:
+def _insert_order_lines(cursor, customer_order_id: int, items_qty: dict):
+    """寫入訂單明細並記錄目前的品項價格 (之後修改價格不影響此訂單)"""
+    for item_id, qty in items_qty.items():
+        if qty > 0:
+            cursor.execute(_sql("""
+                INSERT INTO order_details (customer_order_id, item_id, quantity, unit_price)
+                SELECT ?, id, ?, price FROM items WHERE id = ?
+            """), (customer_order_id, qty, item_id))
+
+
+def create_customer_order(group_order_id: int, customer_name: str, items_qty: dict, note: str = "",
+                          idempotency_key: str = None) -> int:
     """建立顧客訂單
     items_qty: {item_id: quantity}
+    idempotency_key: 同一購物車的識別，重複送出時直接回傳原訂單編號，不再寫入
     """
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute(
-        _sql("INSERT INTO customer_orders (group_order_id, customer_name, note) VALUES (?, ?, ?)"),
-        (group_order_id, customer_name, note)
-    )
-    customer_order_id = _get_last_id(cursor, conn, "customer_orders")
+    customer_id = _get_customer_id(cursor, customer_name)
+    cursor.execute(_sql("""
+        INSERT INTO customer_orders (group_order_id, customer_name, customer_id, note, idempotency_key)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+    """), (group_order_id, customer_name, customer_id, note, idempotency_key))
+    if cursor.rowcount == 0:
+        # 已送出過的購物車
+        conn.rollback()
+        cursor.execute(_sql("SELECT id FROM customer_orders WHERE idempotency_key = ?"), (idempotency_key,))
+        customer_order_id = cursor.fetchone()[0]
+        conn.close()
+        return customer_order_id
+    customer_order_id = _get_last_id(cursor, "customer_orders")
     
-    for item_id, qty in items_qty.items():
-        if qty > 0:
-            cursor.execute(
-                _sql("INSERT INTO order_details (customer_order_id, item_id, quantity) VALUES (?, ?, ?)"),
-                (customer_order_id, item_id, qty)
-            )
+    _insert_order_lines(cursor, customer_order_id, items_qty)
     
-    conn.commit()
+    cursor.execute(_sql(f"UPDATE customer_orders SET {_ORDER_TOTALS_SET} WHERE id = ?"), (customer_order_id,))
+    _apply_rollups(cursor, "co.id = ?", (customer_order_id,), 1)
+    _log_order_event(cursor, "created", customer_order_id)
+    
+    _commit(conn)
     conn.close()
     return customer_order_id
 
 
+_CUSTOMER_ORDERS_BY_GROUP_SQL = """
+    SELECT * FROM customer_orders
+    WHERE group_order_id = ? AND deleted_at IS NULL
+    ORDER BY created_at DESC
+"""
+
+
 def get_customer_orders_by_group(group_order_id: int):
     """取得團購單的所有顧客訂單"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("""
-        SELECT co.*, 
-               SUM(od.quantity * i.price) as total_amount
-        FROM customer_orders co
-        LEFT JOIN order_details od ON co.id = od.customer_order_id
-        LEFT JOIN items i ON od.item_id = i.id
-        WHERE co.group_order_id = ?
-        GROUP BY co.id, co.group_order_id, co.customer_name, co.created_at
-        ORDER BY co.created_at DESC
-    """), (group_order_id,))
+    cursor.execute(_sql(_CUSTOMER_ORDERS_BY_GROUP_SQL), (group_order_id,))
     orders = _fetch_all(cursor, cursor.fetchall())
     conn.close()
     return orders
 
 
+# 訂單明細 (單價為下單時的單價，已刪除的品項不列出)
+_ORDER_DETAILS_SQL = """
+    SELECT od.*, i.name, od.unit_price AS price, (od.quantity * od.unit_price) as subtotal
+    FROM order_details od
+    JOIN items i ON od.item_id = i.id
+    WHERE od.customer_order_id = ? AND i.deleted_at IS NULL
+"""
+
+
 def get_order_details(customer_order_id: int):
     """取得訂單明細"""
-    conn = get_connection()
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql(_ORDER_DETAILS_SQL), (customer_order_id,))
+    details = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return details
+
+
+def get_order_details_by_group(group_order_id: int) -> dict:
+    """一次取得團購單所有訂單的明細 (欄位同 get_order_details)，回傳 {顧客訂單編號: [明細]}"""
+    conn = get_read_connection()
     cursor = conn.cursor()
     cursor.execute(_sql("""
-        SELECT od.*, i.name, i.price, (od.quantity * i.price) as subtotal
+        SELECT od.*, i.name, od.unit_price AS price, (od.quantity * od.unit_price) as subtotal
         FROM order_details od
+        JOIN customer_orders co ON od.customer_order_id = co.id
         JOIN items i ON od.item_id = i.id
-        WHERE od.customer_order_id = ?
-    """), (customer_order_id,))
-    details = _fetch_all(cursor, cursor.fetchall())
+        WHERE co.group_order_id = ? AND co.deleted_at IS NULL AND i.deleted_at IS NULL
+        ORDER BY od.id
+    """), (group_order_id,))
+    details = {}
+    for row in _fetch_all(cursor, cursor.fetchall()):
+        details.setdefault(row['customer_order_id'], []).append(row)
     conn.close()
     return details
 
 
+_GROUP_ORDER_SUMMARY_SQL = """
+    SELECT i.id, i.name, i.price,
+           COALESCE(SUM(od.quantity), 0) as total_qty,
+           COALESCE(SUM(od.quantity * od.unit_price), 0) as total_amount
+    FROM items i
+    LEFT JOIN (order_details od
+               JOIN customer_orders co ON od.customer_order_id = co.id AND co.deleted_at IS NULL
+               AND co.group_order_id = ?)
+        ON i.id = od.item_id
+    WHERE i.group_order_id = ? AND i.deleted_at IS NULL
+    GROUP BY i.id, i.name, i.price
+"""
+
+
 def get_group_order_summary(group_order_id: int):
     """取得團購單彙總統計"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("""
-        SELECT i.id, i.name, i.price, 
-               COALESCE(SUM(od.quantity), 0) as total_qty,
-               COALESCE(SUM(od.quantity * i.price), 0) as total_amount
-        FROM items i
-        LEFT JOIN order_details od ON i.id = od.item_id
-        WHERE i.group_order_id = ?
-        GROUP BY i.id, i.name, i.price
-    """), (group_order_id,))
+    cursor.execute(_sql(_GROUP_ORDER_SUMMARY_SQL), (group_order_id, group_order_id))
     summary = _fetch_all(cursor, cursor.fetchall())
     conn.close()
     return summary
@@ -398,14 +984,13 @@ def get_group_order_summary(group_order_id: int):
 
 def get_item_buyers(item_id: int):
     """取得購買某品項的顧客列表"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     cursor.execute(_sql("""
-        SELECT co.customer_name, od.quantity, (od.quantity * i.price) as subtotal
+        SELECT co.customer_name, od.quantity, (od.quantity * od.unit_price) as subtotal
         FROM order_details od
         JOIN customer_orders co ON od.customer_order_id = co.id
-        JOIN items i ON od.item_id = i.id
-        WHERE od.item_id = ? AND od.quantity > 0
+        WHERE od.item_id = ? AND od.quantity > 0 AND co.deleted_at IS NULL
         ORDER BY co.customer_name
     """), (item_id,))
     buyers = _fetch_all(cursor, cursor.fetchall())
@@ -413,73 +998,178 @@ def get_item_buyers(item_id: int):
     return buyers
 
 
+def read_group_order_lines(group_order_id: int):
+    """讀取團購單所有訂單明細為 DataFrame (單一查詢)
+    每列為一筆明細，沒有人購買的品項也保留一列 (顧客欄位為空)
+    price 為品項目前價格，unit_price 為下單時的單價
+    """
+    import pandas as pd
+    conn = get_read_connection()
+    try:
+        return pd.read_sql_query(_sql("""
+            SELECT i.id AS item_id, i.name AS item_name, i.price,
+                   co.id AS customer_order_id, co.customer_name, co.is_paid,
+                   od.quantity, COALESCE(od.unit_price, i.price) AS unit_price
+            FROM items i
+            LEFT JOIN (order_details od
+                       JOIN customer_orders co ON od.customer_order_id = co.id AND co.deleted_at IS NULL
+                       AND co.group_order_id = ?)
+                ON i.id = od.item_id
+            WHERE i.group_order_id = ? AND i.deleted_at IS NULL
+            ORDER BY i.id, co.customer_name
+        """), conn, params=(group_order_id, group_order_id))
+    finally:
+        conn.close()
+
+
+# 揀貨單排序：分裝單依顧客、分貨單依品項，同一組內依品項建立順序 / 顧客姓名
+_PICK_LINE_ORDER = {
+    "customer": "co.customer_name, co.id, i.id",
+    "item": "i.id, co.customer_name, co.id",
+}
+
+
+def iter_pick_lines(group_order_id: int, by: str = "customer", batch_size: int = 500):
+    """依揀貨順序逐批讀取團購單的訂單明細 (產生器，記憶體只保留一批)
+    by: customer 依顧客排序 / item 依品項排序
+    """
+    query = _sql(f"""
+        SELECT co.id AS customer_order_id, co.customer_name, co.note, co.is_paid,
+               i.id AS item_id, i.name AS item_name, od.unit_price AS price, od.quantity
+        FROM order_details od
+        JOIN customer_orders co ON od.customer_order_id = co.id AND co.deleted_at IS NULL
+        JOIN items i ON od.item_id = i.id AND i.deleted_at IS NULL
+        WHERE co.group_order_id = ? AND od.quantity > 0
+        ORDER BY {_PICK_LINE_ORDER[by]}
+    """)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        for rows in backend.stream(cursor, query, (group_order_id,), batch_size):
+            yield from _fetch_all(cursor, rows)
+    finally:
+        conn.close()
+
+
 def delete_customer_order(customer_order_id: int):
-    """刪除顧客訂單"""
+    """刪除顧客訂單 (標記刪除，訂單明細由背景清除)"""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("DELETE FROM order_details WHERE customer_order_id = ?"), (customer_order_id,))
-    cursor.execute(_sql("DELETE FROM customer_orders WHERE id = ?"), (customer_order_id,))
-    conn.commit()
+    _apply_rollups(cursor, "co.id = ?", (customer_order_id,), -1)
+    # 清除冪等鍵，同一購物車再次送出時建立新訂單，不會回傳已刪除的訂單
+    cursor.execute(_sql("""
+        UPDATE customer_orders SET deleted_at = CURRENT_TIMESTAMP, idempotency_key = NULL WHERE id = ?
+    """), (customer_order_id,))
+    _log_order_event(cursor, "deleted", customer_order_id)
+    _commit(conn)
     conn.close()
+    _purge_wakeup.set()
+
+
+_CUSTOMER_ORDER_BY_ID_SQL = "SELECT * FROM customer_orders WHERE id = ? AND deleted_at IS NULL"
 
 
 def get_customer_order_by_id(customer_order_id: int):
     """取得單一顧客訂單"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("SELECT * FROM customer_orders WHERE id = ?"), (customer_order_id,))
+    cursor.execute(_sql(_CUSTOMER_ORDER_BY_ID_SQL), (customer_order_id,))
     order = _fetch_one(cursor, cursor.fetchone())
     conn.close()
     return order
 
 
-def get_customer_orders_by_name(group_order_id: int, customer_name: str):
-    """根據姓名取得顧客訂單"""
+def get_customer_order_for_edit(customer_order_id: int):
+    """取得要編輯的顧客訂單及明細，回傳 (訂單, 明細)，訂單不存在時回傳 None
+    一律讀取主資料庫：副本可能落後，讀到舊的版本號會在儲存時誤判為衝突
+    """
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute(_sql("""
-        SELECT co.*, SUM(od.quantity * i.price) as total_amount
-        FROM customer_orders co
-        LEFT JOIN order_details od ON co.id = od.customer_order_id
-        LEFT JOIN items i ON od.item_id = i.id
-        WHERE co.group_order_id = ? AND co.customer_name = ?
-        GROUP BY co.id, co.group_order_id, co.customer_name, co.created_at
-        ORDER BY co.created_at DESC
-    """), (group_order_id, customer_name))
+    cursor.execute(_sql(_CUSTOMER_ORDER_BY_ID_SQL), (customer_order_id,))
+    order = _fetch_one(cursor, cursor.fetchone())
+    if order is None:
+        conn.close()
+        return None
+    cursor.execute(_sql(_ORDER_DETAILS_SQL), (customer_order_id,))
+    details = _fetch_all(cursor, cursor.fetchall())
+    conn.close()
+    return order, details
+
+
+_CUSTOMER_ORDERS_BY_NAME_SQL = """
+    SELECT * FROM customer_orders
+    WHERE customer_id = (SELECT id FROM customers WHERE name_key = ?)
+    AND group_order_id = ? AND deleted_at IS NULL
+    ORDER BY created_at DESC
+"""
+
+
+def get_customer_orders_by_name(group_order_id: int, customer_name: str):
+    """根據姓名取得顧客訂單 (不分大小寫、全形半形及多餘空白)"""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(_sql(_CUSTOMER_ORDERS_BY_NAME_SQL), (_customer_name_key(customer_name), group_order_id))
     orders = _fetch_all(cursor, cursor.fetchall())
     conn.close()
     return orders
 
 
-def update_customer_order(customer_order_id: int, items_qty: dict):
-    """更新顧客訂單"""
+def update_customer_order(customer_order_id: int, items_qty: dict, expected_version: int = None) -> bool:
+    """更新顧客訂單
+    expected_version: 編輯開始時讀到的版本號，若訂單已被他人修改則不寫入並回傳 False
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    # 刪除舊的明細
-    cursor.execute(_sql("DELETE FROM order_details WHERE customer_order_id = ?"), (customer_order_id,))
+    # 比對版本並遞增 (compare-and-swap)
+    if expected_version is None:
+        cursor.execute(
+            _sql("UPDATE customer_orders SET version = version + 1 WHERE id = ? AND deleted_at IS NULL"),
+            (customer_order_id,)
+        )
+    else:
+        cursor.execute(
+            _sql("UPDATE customer_orders SET version = version + 1 WHERE id = ? AND version = ? AND deleted_at IS NULL"),
+            (customer_order_id, expected_version)
+        )
+    if cursor.rowcount == 0:
+        conn.rollback()
+        conn.close()
+        return False
     
-    # 新增新的明細
-    for item_id, qty in items_qty.items():
-        if qty > 0:
+    _apply_rollups(cursor, "co.id = ?", (customer_order_id,), -1)
+    
+    # 數量未變的明細保留下單時的單價；移除或數量變更的明細刪除，新增及變更的以目前價格寫入
+    cursor.execute(_sql("""
+        SELECT item_id, SUM(quantity) FROM order_details WHERE customer_order_id = ? GROUP BY item_id
+    """), (customer_order_id,))
+    current = {row[0]: row[1] for row in cursor.fetchall()}
+    wanted = {item_id: qty for item_id, qty in items_qty.items() if qty > 0}
+    for item_id, qty in current.items():
+        if wanted.get(item_id) != qty:
             cursor.execute(
-                _sql("INSERT INTO order_details (customer_order_id, item_id, quantity) VALUES (?, ?, ?)"),
-                (customer_order_id, item_id, qty)
+                _sql("DELETE FROM order_details WHERE customer_order_id = ? AND item_id = ?"), (customer_order_id, item_id)
             )
+    _insert_order_lines(
+        cursor, customer_order_id, {item_id: qty for item_id, qty in wanted.items() if current.get(item_id) != qty}
+    )
     
-    conn.commit()
+    cursor.execute(_sql(f"UPDATE customer_orders SET {_ORDER_TOTALS_SET} WHERE id = ?"), (customer_order_id,))
+    _apply_rollups(cursor, "co.id = ?", (customer_order_id,), 1)
+    _log_order_event(cursor, "updated", customer_order_id)
+    
+    _commit(conn)
     conn.close()
+    return True
 
 
 def get_order_details_as_dict(customer_order_id: int):
     """取得訂單明細為字典格式 {item_id: quantity}"""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     cursor.execute(_sql("SELECT item_id, quantity FROM order_details WHERE customer_order_id = ?"), (customer_order_id,))
     details = _fetch_all(cursor, cursor.fetchall())
     conn.close()
-    if USE_CLOUD_SQL:
-        return {d['item_id']: d['quantity'] for d in details}
     return {d['item_id']: d['quantity'] for d in details}
 
 
@@ -488,5 +1178,127 @@ def update_customer_order_paid_status(customer_order_id: int, is_paid: int):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(_sql("UPDATE customer_orders SET is_paid = ? WHERE id = ?"), (is_paid, customer_order_id))
-    conn.commit()
+    _log_order_event(cursor, "paid", customer_order_id)
+    _commit(conn)
+    conn.close()
+
+
+def check_order_totals(group_order_id: int = None, fix: bool = False) -> list:
+    """比對儲存的訂單金額及件數與明細重新計算的結果，回傳不一致的訂單
+    fix: 是否以重新計算的結果修正
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    query = """
+        SELECT co.id, co.group_order_id, co.customer_name, co.total_amount, co.item_count,
+               COALESCE(SUM(od.quantity * od.unit_price), 0) AS actual_amount,
+               COALESCE(SUM(od.quantity), 0) AS actual_count
+        FROM customer_orders co
+        LEFT JOIN (order_details od
+                   JOIN items i ON od.item_id = i.id AND i.deleted_at IS NULL)
+            ON od.customer_order_id = co.id
+        WHERE co.deleted_at IS NULL
+    """
+    params = ()
+    if group_order_id is not None:
+        query += " AND co.group_order_id = ?"
+        params = (group_order_id,)
+    query += " GROUP BY co.id, co.group_order_id, co.customer_name, co.total_amount, co.item_count"
+    cursor.execute(_sql(query), params)
+    mismatches = [
+        dict(row) for row in _fetch_all(cursor, cursor.fetchall())
+        if abs(row['total_amount'] - row['actual_amount']) > 0.005 or row['item_count'] != row['actual_count']
+    ]
+    if fix and mismatches:
+        for row in mismatches:
+            _apply_rollups(cursor, "co.id = ?", (row['id'],), -1)
+            cursor.execute(_sql(f"UPDATE customer_orders SET {_ORDER_TOTALS_SET} WHERE id = ?"), (row['id'],))
+            _apply_rollups(cursor, "co.id = ?", (row['id'],), 1)
+            _log_order_event(cursor, "updated", row['id'])
+        _commit(conn)
     conn.close()
+    return mismatches
+
+
+# ============ 清除已刪除資料 ============
+
+# (表格, 查詢待清除 id 的 SQL)，依序執行：先刪明細再刪上層資料，最後清除過期的變更紀錄
+# {event_cutoff} 為儲存後端的保留天數條件
+_PURGE_STAGES = [
+    ("order_details", """
+        SELECT id FROM order_details WHERE customer_order_id IN (
+            SELECT id FROM customer_orders WHERE group_order_id IN (
+                SELECT id FROM group_orders WHERE deleted_at IS NOT NULL))
+    """),
+    ("order_details", """
+        SELECT id FROM order_details WHERE customer_order_id IN (
+            SELECT id FROM customer_orders WHERE deleted_at IS NOT NULL)
+    """),
+    ("order_details", """
+        SELECT id FROM order_details WHERE item_id IN (
+            SELECT id FROM items WHERE deleted_at IS NOT NULL)
+    """),
+    ("customer_orders", """
+        SELECT id FROM customer_orders WHERE group_order_id IN (
+            SELECT id FROM group_orders WHERE deleted_at IS NOT NULL)
+    """),
+    ("customer_orders", "SELECT id FROM customer_orders WHERE deleted_at IS NOT NULL"),
+    ("items", """
+        SELECT id FROM items WHERE group_order_id IN (
+            SELECT id FROM group_orders WHERE deleted_at IS NOT NULL)
+    """),
+    ("items", "SELECT id FROM items WHERE deleted_at IS NOT NULL"),
+    ("group_orders", "SELECT id FROM group_orders WHERE deleted_at IS NOT NULL"),
+    # 保留每張團購單最新的一筆，資料版本 (get_group_order_revision) 的編號才不會變小
+    ("order_events", """
+        SELECT id FROM order_events WHERE {event_cutoff}
+        AND id NOT IN (SELECT MAX(id) FROM order_events GROUP BY group_order_id)
+    """),
+]
+
+
+def purge_deleted(batch_size: int = None) -> int:
+    """分批實際刪除已標記刪除的資料，每批為獨立的短交易，回傳刪除筆數"""
+    batch_size = batch_size or PURGE_BATCH_SIZE
+    conn = get_connection()
+    cursor = conn.cursor()
+    total = 0
+    try:
+        event_cutoff = backend.older_than("created_at", ORDER_EVENT_RETENTION_DAYS)
+        for table, select_ids in _PURGE_STAGES:
+            select_ids = select_ids.replace("{event_cutoff}", event_cutoff)
+            while True:
+                cursor.execute(_sql(select_ids + " LIMIT ?"), (batch_size,))
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    break
+                placeholders = ", ".join("?" for _ in ids)
+                cursor.execute(_sql(f"DELETE FROM {table} WHERE id IN ({placeholders})"), ids)
+                conn.commit()
+                total += len(ids)
+    finally:
+        conn.close()
+    return total
+
+
+def start_purge_worker(interval_seconds: float = None, tenants: list = None) -> threading.Thread:
+    """啟動背景清除執行緒：定期執行，或在有資料被刪除時立即執行
+    tenants: 要清除的主辦者 (預設只有預設主辦者)
+    """
+    interval_seconds = interval_seconds or PURGE_INTERVAL_SECONDS
+    tenants = tenants or [DEFAULT_TENANT]
+
+    def loop():
+        while True:
+            _purge_wakeup.wait(interval_seconds)
+            _purge_wakeup.clear()
+            for tenant in tenants:
+                try:
+                    with using_tenant(tenant):
+                        purge_deleted()
+                except Exception:
+                    logger.exception("清除已刪除資料失敗 (%s)", tenant)
+
+    thread = threading.Thread(target=loop, name="purge-worker", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,70 @@
+import io
+
+import pandas as pd
+
+# 可接受的欄位名稱 (不分大小寫)
+NAME_COLUMNS = ["品項", "品項名稱", "名稱", "name", "item"]
+PRICE_COLUMNS = ["價格", "單價", "price"]
+
+
+def _find_column(columns, candidates):
+    """從檔案欄位中找出符合的欄位名稱"""
+    normalized = {str(c).strip().lower(): c for c in columns}
+    for candidate in candidates:
+        if candidate.lower() in normalized:
+            return normalized[candidate.lower()]
+    return None
+
+
+def read_item_file(file_name: str, data: bytes) -> pd.DataFrame:
+    """讀取 CSV / XLSX 品項檔案"""
+    if file_name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(io.BytesIO(data), dtype=str)
+    # utf-8-sig 可同時處理 Excel 匯出的 BOM；保留空白列 (之後略過) 使錯誤訊息的列號與檔案一致
+    return pd.read_csv(io.BytesIO(data), dtype=str, encoding="utf-8-sig", skip_blank_lines=False)
+
+
+def parse_item_file(file_name: str, data: bytes, existing_names=()):
+    """解析並驗證品項檔案，一次處理整份檔案
+    回傳 (items, errors)
+    items: [{"name": ..., "price": ...}] 可直接寫入的品項
+    errors: 錯誤訊息列表 (重複品項、無效價格等)
+    """
+    try:
+        df = read_item_file(file_name, data)
+    except Exception as e:
+        return [], [f"無法讀取檔案：{e}"]
+
+    name_col = _find_column(df.columns, NAME_COLUMNS)
+    price_col = _find_column(df.columns, PRICE_COLUMNS)
+    if name_col is None or price_col is None:
+        return [], ["找不到「品項」及「價格」欄位"]
+
+    df = pd.DataFrame({
+        "name": df[name_col].fillna("").astype(str).str.strip(),
+        "price": pd.to_numeric(df[price_col], errors="coerce"),
+    })
+    # 檔案列號 (標題列為第 1 列)
+    df["row"] = df.index + 2
+    df = df[df["name"] != ""]
+
+    errors = []
+
+    invalid = df["price"].isna() | (df["price"] <= 0)
+    for row in df.loc[invalid, "row"]:
+        errors.append(f"第 {row} 列：價格無效")
+    df = df[~invalid]
+
+    existing = {str(n).strip() for n in existing_names}
+    in_existing = df["name"].isin(existing)
+    for row, name in df.loc[in_existing, ["row", "name"]].itertuples(index=False):
+        errors.append(f"第 {row} 列：品項「{name}」已存在")
+    df = df[~in_existing]
+
+    duplicated = df["name"].duplicated(keep="first")
+    for row, name in df.loc[duplicated, ["row", "name"]].itertuples(index=False):
+        errors.append(f"第 {row} 列：品項「{name}」重複")
+    df = df[~duplicated]
+
+    items = [{"name": name, "price": float(price)} for name, price in df[["name", "price"]].itertuples(index=False)]
+    return items, errors
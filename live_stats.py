@@ -0,0 +1,134 @@
+import os
+
+import database as db
+
+# 最近動態保留筆數
+RECENT_EVENT_COUNT = 20
+# 變更紀錄的編號在寫入時取得、提交後才看得到 (PostgreSQL)，較小的編號可能較晚出現
+# 每次讀取都重新讀取游標之前此範圍內的編號，以已套用的編號略過重複
+LIVE_EVENT_WINDOW = int(os.environ.get("LIVE_EVENT_WINDOW", "1000"))
+# 每次查詢讀取的變更紀錄筆數
+EVENT_BATCH_SIZE = 500
+
+EVENT_LABELS = {
+    "created": "新增訂單",
+    "updated": "修改訂單",
+    "deleted": "刪除訂單",
+    "paid": "付款狀態變更",
+    "items": "品項變更",
+}
+
+
+def _new_summary(group_order_id: int, cursor: int, seen: set) -> dict:
+    """空白的即時統計"""
+    items = {i['id']: {"name": i['name'], "price": i['price']} for i in db.get_items_by_group_order(group_order_id)}
+    return {
+        "tenant": db.get_tenant(),
+        "group_order_id": group_order_id,
+        "cursor": cursor,
+        # 游標之前 LIVE_EVENT_WINDOW 範圍內已套用的變更紀錄編號
+        "seen": seen,
+        "items": items,
+        # 顧客訂單編號 -> {"customer_name", "is_paid", "lines": {item_id: quantity}, "amounts": {item_id: 金額}, "amount"}
+        "orders": {},
+        "item_qty": {item_id: 0 for item_id in items},
+        "item_amount": {item_id: 0.0 for item_id in items},
+        "amount": {True: 0.0, False: 0.0},
+        "count": {True: 0, False: 0},
+        "recent": [],
+    }
+
+
+def _add_lines(summary: dict, lines: list):
+    """將訂單明細加入統計 (lines 需包含每筆訂單的全部明細)"""
+    orders = {}
+    for line in lines:
+        order = orders.setdefault(line['customer_order_id'], {
+            "customer_name": line['customer_name'], "is_paid": bool(line['is_paid']), "lines": {}, "amounts": {},
+        })
+        # 已刪除的品項不列入；金額以下單時的單價計算
+        if line['item_id'] in summary["items"] and line['quantity']:
+            order["lines"][line['item_id']] = order["lines"].get(line['item_id'], 0) + line['quantity']
+            order["amounts"][line['item_id']] = (
+                order["amounts"].get(line['item_id'], 0) + line['quantity'] * line['unit_price']
+            )
+    for customer_order_id, order in orders.items():
+        order["amount"] = sum(order["amounts"].values())
+        for item_id, qty in order["lines"].items():
+            summary["item_qty"][item_id] += qty
+            summary["item_amount"][item_id] += order["amounts"][item_id]
+        summary["amount"][order["is_paid"]] += order["amount"]
+        summary["count"][order["is_paid"]] += 1
+        summary["orders"][customer_order_id] = order
+
+
+def _remove_order(summary: dict, customer_order_id: int):
+    """從統計中扣除一筆訂單"""
+    order = summary["orders"].pop(customer_order_id, None)
+    if order is None:
+        return
+    for item_id, qty in order["lines"].items():
+        summary["item_qty"][item_id] -= qty
+        summary["item_amount"][item_id] -= order["amounts"][item_id]
+    summary["amount"][order["is_paid"]] -= order["amount"]
+    summary["count"][order["is_paid"]] -= 1
+
+
+def _read_events(group_order_id: int, cursor: int, seen: set) -> list:
+    """讀取 (游標 - LIVE_EVENT_WINDOW) 之後尚未套用的變更紀錄 (依編號排序)"""
+    since_id = max(cursor - LIVE_EVENT_WINDOW, 0)
+    events = []
+    while True:
+        batch = db.get_order_events(group_order_id, since_id, EVENT_BATCH_SIZE)
+        events += [e for e in batch if e['id'] not in seen]
+        if len(batch) < EVENT_BATCH_SIZE:
+            return events
+        since_id = batch[-1]['id']
+
+
+def load_live_summary(group_order_id: int) -> dict:
+    """讀取整張團購單建立即時統計 (開啟儀表板或品項變更時才執行)"""
+    # 先取游標及已提交的變更再讀資料；較晚提交或讀取期間的變更會在下次更新時重新套用
+    cursor = db.get_latest_order_event_id()
+    seen = {e['id'] for e in _read_events(group_order_id, cursor, set()) if e['id'] <= cursor}
+    summary = _new_summary(group_order_id, cursor, seen)
+    _add_lines(summary, db.get_order_lines(group_order_id))
+    return summary
+
+
+def apply_changes(summary: dict) -> dict:
+    """讀取尚未套用的變更並套用到統計，只重新讀取有變更的訂單
+    品項有變更時重新讀取整張團購單，回傳更新後的統計
+    編號不一定依提交順序出現，游標之前範圍內較晚提交的變更也會套用 (重新讀取訂單，重複套用結果相同)
+    """
+    group_order_id = summary["group_order_id"]
+    events = _read_events(group_order_id, summary["cursor"], summary["seen"])
+    if not events:
+        return summary
+    changed = list(dict.fromkeys(e['customer_order_id'] for e in events if e['customer_order_id'] is not None))
+    # 刪除的訂單在套用後就查不到姓名，先保留
+    names = {cid: summary["orders"][cid]["customer_name"] for cid in changed if cid in summary["orders"]}
+    if any(e['event'] == "items" for e in events):
+        reloaded = load_live_summary(group_order_id)
+        reloaded["recent"] = summary["recent"]
+        summary = reloaded
+    else:
+        for customer_order_id in changed:
+            _remove_order(summary, customer_order_id)
+        _add_lines(summary, db.get_order_lines(group_order_id, changed))
+        summary["cursor"] = max(summary["cursor"], events[-1]['id'])
+        summary["seen"] = {
+            event_id for event_id in summary["seen"] | {e['id'] for e in events}
+            if event_id > summary["cursor"] - LIVE_EVENT_WINDOW
+        }
+    names.update({cid: summary["orders"][cid]["customer_name"] for cid in changed if cid in summary["orders"]})
+    recent = [
+        {
+            "event": EVENT_LABELS.get(e['event'], e['event']),
+            "customer_name": names.get(e['customer_order_id'], ""),
+            "created_at": e['created_at'],
+        }
+        for e in reversed(events)
+    ]
+    summary["recent"] = (recent + summary["recent"])[:RECENT_EVENT_COUNT]
+    return summary
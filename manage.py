@@ -0,0 +1,172 @@
+"""團購訂單系統管理指令
+
+用法：
+    python manage.py backup              建立備份
+    python manage.py list-backups        列出備份
+    python manage.py restore <檔案>      從備份還原
+    python manage.py schedule-backups    依間隔持續建立備份
+    python manage.py purge               清除已標記刪除的資料
+    python manage.py check-totals        檢查訂單金額是否與明細一致
+    python manage.py pick-list <團購單編號> 產生揀貨單
+    python manage.py init-tenants        建立 / 升級所有主辦者的資料庫
+    python manage.py rebuild-rollups     重建銷售彙總表
+    python manage.py migrate-to-postgres 將 SQLite 資料複製到 PostgreSQL (需設定 DB_BACKEND=postgres)
+
+所有指令皆可加上 --tenant <代號> 指定主辦者 (預設為預設主辦者)
+"""
+import argparse
+import time
+
+import backup
+import database as db
+import tenants
+
+
+def cmd_backup(args):
+    path = backup.run_scheduled_backup(args.dir)
+    print(f"已建立備份：{path}")
+
+
+def cmd_list_backups(args):
+    for path in backup.list_backups(args.dir):
+        print(path)
+
+
+def cmd_restore(args):
+    backup.restore_backup(args.path)
+    print(f"已從 {args.path} 還原")
+
+
+def cmd_schedule_backups(args):
+    print(f"每 {args.interval} 分鐘建立一次備份，保留 {backup.BACKUP_RETENTION} 份")
+    while True:
+        print(f"已建立備份：{backup.run_scheduled_backup(args.dir)}")
+        time.sleep(args.interval * 60)
+
+
+def cmd_purge(args):
+    count = db.purge_deleted(args.batch_size)
+    print(f"已清除 {count} 筆資料")
+
+
+def cmd_check_totals(args):
+    mismatches = db.check_order_totals(args.group_order_id, fix=args.fix)
+    for row in mismatches:
+        print(f"訂單 #{row['id']} {row['customer_name']}：儲存 ${row['total_amount']:,.2f} / {row['item_count']} 件，"
+              f"明細 ${row['actual_amount']:,.2f} / {row['actual_count']} 件")
+    if not mismatches:
+        print("訂單金額皆一致")
+    elif args.fix:
+        print(f"已修正 {len(mismatches)} 筆訂單")
+
+
+def cmd_pick_list(args):
+    import picklist
+    order = db.get_group_order_by_id(args.group_order_id)
+    if order is None:
+        raise SystemExit(f"找不到團購單 #{args.group_order_id}")
+    if args.format == "html":
+        chunks = picklist.iter_pick_list_html(order['id'], order['title'], args.by)
+    else:
+        chunks = picklist.iter_pick_list_csv(order['id'], args.by)
+    # 逐段寫入檔案，不需一次載入整份揀貨單
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    print(f"已產生揀貨單：{args.output}")
+
+
+def cmd_init_tenants(args):
+    configured = tenants.load_tenants()
+    tenants.init_all(configured)
+    for tenant, config in configured.items():
+        if db.DB_BACKEND == "postgres":
+            location = db.tenant_schema(tenant)
+        elif db.DB_BACKEND == "memory":
+            location = "記憶體資料庫"
+        else:
+            location = db.tenant_db_path(tenant)
+        print(f"{tenant} ({config['name']})：{location}")
+
+
+def cmd_rebuild_rollups(args):
+    count = db.rebuild_rollups()
+    print(f"已重建銷售彙總 (每日彙總 {count} 列)")
+
+
+def cmd_migrate_to_postgres(args):
+    import migrate
+    result = migrate.migrate_from_sqlite(args.sqlite, args.batch_size, progress=print if args.verbose else lambda _: None)
+    for table, counts in result.items():
+        print(f"{table}：新增 {counts['copied']}、重新同步 {counts['synced']}、"
+              f"未變更 {counts['unchanged']}、刪除 {counts['deleted']}")
+    if args.no_verify:
+        return
+    mismatched = False
+    for row in migrate.verify_migration(args.sqlite, args.batch_size):
+        status = "一致" if row['match'] else "不一致"
+        mismatched = mismatched or not row['match']
+        print(f"驗證 {row['table']}：SQLite {row['source_rows']} 筆 / PostgreSQL {row['target_rows']} 筆，{status}")
+    if mismatched:
+        raise SystemExit("驗證失敗，請重新執行 (SQLite 在複製期間可能仍有寫入)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="團購訂單系統管理指令")
+    parser.add_argument("--tenant", default=db.DEFAULT_TENANT, help="主辦者代號 (預設 default)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("backup", help="建立備份")
+    p.add_argument("--dir", help="備份目錄 (預設 BACKUP_DIR)")
+    p.set_defaults(func=cmd_backup)
+
+    p = subparsers.add_parser("list-backups", help="列出備份")
+    p.add_argument("--dir", help="備份目錄 (預設 BACKUP_DIR)")
+    p.set_defaults(func=cmd_list_backups)
+
+    p = subparsers.add_parser("restore", help="從備份還原")
+    p.add_argument("path", help="備份檔路徑")
+    p.set_defaults(func=cmd_restore)
+
+    p = subparsers.add_parser("schedule-backups", help="依間隔持續建立備份")
+    p.add_argument("--interval", type=float, default=60, help="間隔分鐘數 (預設 60)")
+    p.add_argument("--dir", help="備份目錄 (預設 BACKUP_DIR)")
+    p.set_defaults(func=cmd_schedule_backups)
+
+    p = subparsers.add_parser("purge", help="清除已標記刪除的資料")
+    p.add_argument("--batch-size", type=int, help="每批刪除筆數 (預設 PURGE_BATCH_SIZE)")
+    p.set_defaults(func=cmd_purge)
+
+    p = subparsers.add_parser("check-totals", help="檢查訂單金額是否與明細一致")
+    p.add_argument("--group-order-id", type=int, help="只檢查指定團購單")
+    p.add_argument("--fix", action="store_true", help="以明細重新計算並修正")
+    p.set_defaults(func=cmd_check_totals)
+
+    p = subparsers.add_parser("pick-list", help="產生揀貨單")
+    p.add_argument("group_order_id", type=int, help="團購單編號")
+    p.add_argument("--by", choices=["customer", "item"], default="customer",
+                   help="customer 每位顧客一張分裝單 / item 每個品項一張分貨單 (預設 customer)")
+    p.add_argument("--format", choices=["html", "csv"], default="html", help="輸出格式 (預設 html)")
+    p.add_argument("-o", "--output", required=True, help="輸出檔案路徑")
+    p.set_defaults(func=cmd_pick_list)
+
+    p = subparsers.add_parser("init-tenants", help="建立 / 升級所有主辦者的資料庫")
+    p.set_defaults(func=cmd_init_tenants)
+
+    p = subparsers.add_parser("rebuild-rollups", help="重建銷售彙總表")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = subparsers.add_parser("migrate-to-postgres", help="將 SQLite 資料複製到 PostgreSQL (可重複執行)")
+    p.add_argument("--sqlite", help="來源 SQLite 檔案 (預設為目前主辦者的資料庫)")
+    p.add_argument("--batch-size", type=int, help="每批筆數 (預設 MIGRATE_BATCH_SIZE)")
+    p.add_argument("--no-verify", action="store_true", help="略過複製後的筆數及 checksum 驗證")
+    p.add_argument("-v", "--verbose", action="store_true", help="顯示每批進度")
+    p.set_defaults(func=cmd_migrate_to_postgres)
+
+    args = parser.parse_args(argv)
+    db.set_tenant(args.tenant)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
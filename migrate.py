@@ -0,0 +1,245 @@
+import hashlib
+import io
+import os
+import sqlite3
+from datetime import datetime
+
+import backends
+import database as db
+
+# 依外鍵順序複製 (上層資料表先)；銷售彙總表在複製完成後重建
+MIGRATE_TABLES = ["group_orders", "items", "customers", "customer_orders", "order_details", "order_events"]
+# 每批複製的筆數 (每批為一個交易，中斷後重新執行會從已完成的部分繼續)
+MIGRATE_BATCH_SIZE = int(os.environ.get("MIGRATE_BATCH_SIZE", "5000"))
+
+
+def _target_columns(cursor, table: str) -> dict:
+    """PostgreSQL 表格的欄位 -> 型別 (依欄位順序，id 在最前面)"""
+    cursor.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    return dict(cursor.fetchall())
+
+
+def _canonical(value, data_type: str) -> str:
+    """比對用的標準化字串 (兩種資料庫回傳的型別不同)"""
+    if value is None:
+        return "\\N"
+    if data_type.startswith("timestamp"):
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                return value
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if data_type in ("real", "double precision", "numeric"):
+        # PostgreSQL REAL 為單精度，只比對到小數第二位
+        return f"{float(value):.2f}"
+    return str(value)
+
+
+def _update_digest(digest, rows, types: list):
+    for row in rows:
+        digest.update("\t".join(_canonical(v, t) for v, t in zip(row, types)).encode("utf-8"))
+        digest.update(b"\n")
+
+
+def _checksum(rows, types: list) -> str:
+    digest = hashlib.sha256()
+    _update_digest(digest, rows, types)
+    return digest.hexdigest()
+
+
+def _copy_text(value) -> str:
+    """COPY text 格式的欄位值"""
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_rows(cursor, table: str, columns: list, rows):
+    """以 COPY FROM STDIN 一次寫入整批資料"""
+    data = "".join("\t".join(_copy_text(v) for v in row) + "\n" for row in rows)
+    cursor.execute(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream=io.BytesIO(data.encode("utf-8")))
+
+
+def _source_batches(source: sqlite3.Connection, table: str, columns: list, batch_size: int):
+    """依 id 順序分批讀取 SQLite 資料，產生 (low, high, rows)
+    範圍 (low, high] 包含兩批之間的空號，供比對目標資料庫中已被刪除的資料
+    """
+    low = 0
+    while True:
+        rows = source.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (low, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        yield low, rows[-1][0], rows
+        low = rows[-1][0]
+
+
+def _sync_range(cursor, table: str, columns: list, rows):
+    """以來源資料覆寫目標資料庫的同編號資料：先 COPY 到暫存表再 upsert
+    來源已不存在的資料在全部表格同步後才刪除 (_delete_stale)
+    """
+    column_list = ", ".join(columns)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c != "id")
+    cursor.execute(f"CREATE TEMP TABLE migrate_stage (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    _copy_rows(cursor, "migrate_stage", columns, rows)
+    cursor.execute(f"""
+        INSERT INTO {table} ({column_list}) SELECT {column_list} FROM migrate_stage
+        ON CONFLICT (id) DO UPDATE SET {updates}
+    """)
+
+
+def _migrate_table(source, conn, table: str, batch_size: int, progress) -> tuple:
+    """複製單一表格：目標沒有的範圍直接 COPY，已有的範圍比對 checksum，不同時才重新同步
+    回傳 (筆數統計, 可能有多餘資料的 id 範圍)
+    """
+    cursor = conn.cursor()
+    types = _target_columns(cursor, table)
+    source_columns = {row[1] for row in source.execute(f"PRAGMA table_info({table})")}
+    columns = [c for c in types if c in source_columns]
+    column_types = [types[c] for c in columns]
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    target_max = cursor.fetchone()[0]
+
+    counts = {"copied": 0, "synced": 0, "unchanged": 0, "deleted": 0}
+    stale = []
+    last_id = 0
+    for low, high, rows in _source_batches(source, table, columns, batch_size):
+        if low >= target_max:
+            _copy_rows(cursor, table, columns, rows)
+            counts["copied"] += len(rows)
+        else:
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE id > %s AND id <= %s ORDER BY id", (low, high)
+            )
+            if _checksum(cursor.fetchall(), column_types) == _checksum(rows, column_types):
+                counts["unchanged"] += len(rows)
+            else:
+                _sync_range(cursor, table, columns, rows)
+                counts["synced"] += len(rows)
+                stale.append((low, high))
+        conn.commit()
+        last_id = high
+        progress(f"{table}：已處理至 id {high}")
+
+    # 來源最後一筆之後的資料已被刪除
+    stale.append((last_id, None))
+    return counts, stale
+
+
+def _delete_stale(source, conn, table: str, ranges: list) -> int:
+    """刪除目標資料庫中來源已不存在的資料，回傳筆數
+    依外鍵反向順序呼叫 (先刪子表格)，顧客資料沒有串聯刪除，需等訂單同步後才能刪除
+    """
+    cursor = conn.cursor()
+    deleted = 0
+    for low, high in ranges:
+        ids = [] if high is None else [
+            row[0] for row in source.execute(f"SELECT id FROM {table} WHERE id > ? AND id <= ?", (low, high))
+        ]
+        if ids:
+            cursor.execute(f"DELETE FROM {table} WHERE id > %s AND id <= %s AND id <> ALL(%s)", (low, high, ids))
+        elif high is None:
+            cursor.execute(f"DELETE FROM {table} WHERE id > %s", (low,))
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE id > %s AND id <= %s", (low, high))
+        deleted += cursor.rowcount
+        conn.commit()
+    return deleted
+
+
+def _open_source(sqlite_path: str = None) -> sqlite3.Connection:
+    """開啟來源 SQLite 資料庫並確認結構版本與程式一致"""
+    if not isinstance(db.backend, backends.PostgresBackend):
+        raise RuntimeError("請設定 DB_BACKEND=postgres 及 PostgreSQL 連線 (DB_HOST 等) 後再執行")
+    sqlite_path = sqlite_path or db.tenant_db_path()
+    if not os.path.exists(sqlite_path):
+        raise FileNotFoundError(f"找不到 SQLite 資料庫：{sqlite_path}")
+    source = sqlite3.connect(sqlite_path)
+    version = source.execute("PRAGMA user_version").fetchone()[0]
+    if version != db.SCHEMA_VERSION:
+        source.close()
+        raise RuntimeError(f"SQLite 資料庫結構版本為 {version}，請先以目前版本的程式開啟一次 (版本 {db.SCHEMA_VERSION})")
+    return source
+
+
+def migrate_from_sqlite(sqlite_path: str = None, batch_size: int = None, progress=print) -> dict:
+    """將 SQLite 資料庫複製到 PostgreSQL (目前主辦者的 schema)，保留原本的 id
+    可重複執行：只 COPY 新資料，並重新同步 checksum 不同的範圍
+    回傳 {表格: {"copied", "synced", "unchanged", "deleted"}}
+    """
+    batch_size = batch_size or MIGRATE_BATCH_SIZE
+    source = _open_source(sqlite_path)
+    try:
+        db.init_db()
+        conn = db.get_connection()
+        try:
+            result, stale = {}, {}
+            for table in MIGRATE_TABLES:
+                result[table], stale[table] = _migrate_table(source, conn, table, batch_size, progress)
+            for table in reversed(MIGRATE_TABLES):
+                result[table]["deleted"] = _delete_stale(source, conn, table, stale[table])
+            # 保留 id 後需將序號設到目前最大值之後
+            cursor = conn.cursor()
+            for table in MIGRATE_TABLES:
+                cursor.execute(f"""
+                    SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+                    FROM {table}
+                """)
+            conn.commit()
+        finally:
+            conn.close()
+    finally:
+        source.close()
+    db.rebuild_rollups()
+    return result
+
+
+def verify_migration(sqlite_path: str = None, batch_size: int = None) -> list:
+    """比對兩邊每個表格的筆數及 checksum
+    回傳 [{"table", "source_rows", "target_rows", "match"}]
+    """
+    batch_size = batch_size or MIGRATE_BATCH_SIZE
+    source = _open_source(sqlite_path)
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    results = []
+    try:
+        for table in MIGRATE_TABLES:
+            types = _target_columns(cursor, table)
+            source_columns = {row[1] for row in source.execute(f"PRAGMA table_info({table})")}
+            columns = [c for c in types if c in source_columns]
+            column_types = [types[c] for c in columns]
+
+            source_digest, source_rows = hashlib.sha256(), 0
+            for _, _, rows in _source_batches(source, table, columns, batch_size):
+                _update_digest(source_digest, rows, column_types)
+                source_rows += len(rows)
+
+            target_digest, target_rows, last_id = hashlib.sha256(), 0, 0
+            while True:
+                cursor.execute(
+                    f"SELECT {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s", (last_id, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                _update_digest(target_digest, rows, column_types)
+                target_rows += len(rows)
+                last_id = rows[-1][0]
+
+            results.append({
+                "table": table,
+                "source_rows": source_rows,
+                "target_rows": target_rows,
+                "match": source_rows == target_rows and source_digest.digest() == target_digest.digest(),
+            })
+    finally:
+        conn.close()
+        source.close()
+    return results
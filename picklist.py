@@ -0,0 +1,113 @@
+import csv
+import html
+import io
+from itertools import groupby
+from operator import itemgetter
+
+import database as db
+
+# 揀貨單種類：分裝單每位顧客一張、分貨單每個品項一張
+PICK_LIST_KINDS = {"customer": "分裝單 (依顧客)", "item": "分貨單 (依品項)"}
+
+CSV_HEADERS = {
+    "customer": ["顧客姓名", "訂單編號", "品項", "單價", "數量", "小計", "已付款", "備註"],
+    "item": ["品項", "單價", "顧客姓名", "訂單編號", "數量"],
+}
+
+HTML_STYLE = """
+body { font-family: sans-serif; margin: 1.5em; }
+.sheet { margin-bottom: 2em; page-break-after: always; break-after: page; }
+.sheet:last-child { page-break-after: auto; break-after: auto; }
+h1 { font-size: 1.2em; color: #555; }
+h2 { margin-bottom: 0.2em; }
+.meta { color: #555; margin: 0 0 0.5em; }
+table { border-collapse: collapse; width: 100%; }
+th, td { border: 1px solid #999; padding: 4px 8px; text-align: left; }
+td.num, th.num { text-align: right; }
+td.check { width: 2em; text-align: center; }
+tfoot td { font-weight: bold; }
+"""
+
+
+def _group_key(by: str):
+    """每張揀貨單的分組欄位"""
+    return itemgetter("customer_order_id" if by == "customer" else "item_id")
+
+
+def iter_pick_list_csv(group_order_id: int, by: str = "customer"):
+    """逐段產生揀貨單 CSV 文字 (每位顧客 / 每個品項輸出一次)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # 使用 BOM 確保 Excel 正確顯示中文
+    buffer.write("\ufeff")
+    writer.writerow(CSV_HEADERS[by])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for _, lines in groupby(db.iter_pick_lines(group_order_id, by), key=_group_key(by)):
+        for line in lines:
+            if by == "customer":
+                writer.writerow([
+                    line["customer_name"], line["customer_order_id"], line["item_name"], line["price"],
+                    line["quantity"], line["quantity"] * line["price"],
+                    "是" if line["is_paid"] else "否", line["note"] or "",
+                ])
+            else:
+                writer.writerow([
+                    line["item_name"], line["price"], line["customer_name"],
+                    line["customer_order_id"], line["quantity"],
+                ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _customer_sheet(lines: list) -> str:
+    """單一顧客的分裝單"""
+    first = lines[0]
+    rows = "".join(
+        f"<tr><td class='check'>☐</td><td>{html.escape(line['item_name'])}</td>"
+        f"<td class='num'>{line['quantity']}</td><td class='num'>${line['quantity'] * line['price']:,.0f}</td></tr>"
+        for line in lines
+    )
+    total_qty = sum(line["quantity"] for line in lines)
+    total_amount = sum(line["quantity"] * line["price"] for line in lines)
+    note = f"<p class='meta'>備註：{html.escape(first['note'])}</p>" if first["note"] else ""
+    return (
+        f"<section class='sheet'><h2>{html.escape(first['customer_name'])}</h2>"
+        f"<p class='meta'>訂單 #{first['customer_order_id']}・{'已付款' if first['is_paid'] else '未付款'}</p>{note}"
+        "<table><thead><tr><th></th><th>品項</th><th class='num'>數量</th><th class='num'>小計</th></tr></thead>"
+        f"<tbody>{rows}</tbody><tfoot><tr><td></td><td>合計</td>"
+        f"<td class='num'>{total_qty}</td><td class='num'>${total_amount:,.0f}</td></tr></tfoot></table></section>"
+    )
+
+
+def _item_sheet(lines: list) -> str:
+    """單一品項的分貨單"""
+    first = lines[0]
+    rows = "".join(
+        f"<tr><td class='check'>☐</td><td>{html.escape(line['customer_name'])}</td>"
+        f"<td>#{line['customer_order_id']}</td><td class='num'>{line['quantity']}</td></tr>"
+        for line in lines
+    )
+    total_qty = sum(line["quantity"] for line in lines)
+    return (
+        f"<section class='sheet'><h2>{html.escape(first['item_name'])}</h2>"
+        f"<p class='meta'>單價 ${first['price']:,.0f}・共 {len(lines)} 筆訂單</p>"
+        "<table><thead><tr><th></th><th>顧客姓名</th><th>訂單</th><th class='num'>數量</th></tr></thead>"
+        f"<tbody>{rows}</tbody><tfoot><tr><td></td><td>合計</td><td></td>"
+        f"<td class='num'>{total_qty}</td></tr></tfoot></table></section>"
+    )
+
+
+def iter_pick_list_html(group_order_id: int, title: str, by: str = "customer"):
+    """逐段產生可列印的揀貨單 HTML (每張單獨立分頁)"""
+    heading = html.escape(f"{title} - {PICK_LIST_KINDS[by]}")
+    yield (
+        f"<!DOCTYPE html><html lang='zh-Hant'><head><meta charset='utf-8'><title>{heading}</title>"
+        f"<style>{HTML_STYLE}</style></head><body><h1>{heading}</h1>\n"
+    )
+    sheet = _customer_sheet if by == "customer" else _item_sheet
+    for _, lines in groupby(db.iter_pick_lines(group_order_id, by), key=_group_key(by)):
+        yield sheet(list(lines)) + "\n"
+    yield "</body></html>\n"
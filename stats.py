@@ -0,0 +1,108 @@
+import pandas as pd
+
+import database as db
+
+# 明細欄位型別
+LINE_DTYPES = {
+    "item_id": "int64",
+    "item_name": "string",
+    "price": "float64",
+    "customer_order_id": "Int64",
+    "customer_name": "string",
+    "is_paid": "bool",
+    "quantity": "int64",
+    "unit_price": "float64",
+}
+
+# 顧客訂單欄位型別
+ORDER_DTYPES = {
+    "customer_order_id": "Int64",
+    "customer_name": "string",
+    "is_paid": "bool",
+}
+
+
+def load_lines(group_order_id: int) -> pd.DataFrame:
+    """一次讀取團購單的所有明細並轉為固定型別 (沒有人購買的品項保留一列，數量為 0)"""
+    lines = db.read_group_order_lines(group_order_id)
+    lines["customer_name"] = lines["customer_name"].fillna("")
+    lines["is_paid"] = lines["is_paid"].fillna(0)
+    lines["quantity"] = lines["quantity"].fillna(0)
+    lines = lines.astype(LINE_DTYPES)
+    # 小計以下單時的單價計算
+    lines["subtotal"] = lines["quantity"] * lines["unit_price"]
+    return lines
+
+
+def item_summary(lines: pd.DataFrame) -> pd.DataFrame:
+    """品項彙總：每個品項的總數量及總金額"""
+    return (
+        lines.groupby(["item_id", "item_name", "price"], sort=False, as_index=False)
+        .agg(total_qty=("quantity", "sum"), total_amount=("subtotal", "sum"))
+    )
+
+
+def load_orders(group_order_id: int) -> pd.DataFrame:
+    """團購單的所有顧客訂單，與即時儀表板相同 (品項都已刪除、沒有有效明細的訂單也列入)"""
+    orders = db.get_customer_orders_by_group(group_order_id)
+    return pd.DataFrame(
+        [(o['id'], o['customer_name'], o['is_paid']) for o in orders], columns=list(ORDER_DTYPES)
+    ).astype(ORDER_DTYPES)
+
+
+def customer_totals(lines: pd.DataFrame, orders: pd.DataFrame) -> pd.DataFrame:
+    """每筆顧客訂單的數量及金額 (金額由高到低，沒有有效明細的訂單為 0)"""
+    ordered = lines[lines["customer_order_id"].notna()]
+    totals = (
+        ordered.groupby("customer_order_id", sort=False, as_index=False)
+        .agg(total_qty=("quantity", "sum"), total_amount=("subtotal", "sum"))
+    )
+    customers = orders.merge(totals, on="customer_order_id", how="left")
+    customers["total_qty"] = customers["total_qty"].fillna(0).astype("int64")
+    customers["total_amount"] = customers["total_amount"].fillna(0.0)
+    return customers.sort_values("total_amount", ascending=False, ignore_index=True)
+
+
+def paid_breakdown(customers: pd.DataFrame) -> pd.DataFrame:
+    """已付款 / 未付款的訂單數及金額"""
+    breakdown = (
+        customers.groupby("is_paid")
+        .agg(orders=("customer_order_id", "size"), total_amount=("total_amount", "sum"))
+        .reindex([True, False], fill_value=0)
+    )
+    breakdown.index = ["已付款", "未付款"]
+    return breakdown
+
+
+def item_customer_pivot(lines: pd.DataFrame) -> pd.DataFrame:
+    """顧客 × 品項數量對照表 (品項依建立順序排列)"""
+    ordered = lines[lines["customer_order_id"].notna()]
+    pivot = ordered.pivot_table(
+        index="customer_name", columns="item_name", values="quantity", aggfunc="sum", fill_value=0
+    )
+    item_order = lines["item_name"].drop_duplicates()
+    return pivot.reindex(columns=item_order[item_order.isin(pivot.columns)])
+
+
+def detail_export(lines: pd.DataFrame) -> pd.DataFrame:
+    """訂單明細匯出用表格 (依品項、顧客姓名排序)"""
+    detail = lines[["item_name", "unit_price", "customer_name", "quantity", "subtotal"]].copy()
+    detail.columns = ["品項", "單價", "顧客姓名", "數量", "小計"]
+    detail.index = pd.RangeIndex(1, len(detail) + 1)
+    return detail
+
+
+def group_order_statistics(group_order_id: int) -> dict:
+    """由單次讀取的明細 (及顧客訂單列表) 計算所有統計表"""
+    lines = load_lines(group_order_id)
+    customers = customer_totals(lines, load_orders(group_order_id))
+    buyers = lines[lines["quantity"] > 0][["item_id", "customer_name", "quantity", "subtotal"]]
+    return {
+        "lines": lines,
+        "summary": item_summary(lines),
+        "customers": customers,
+        "paid": paid_breakdown(customers),
+        "pivot": item_customer_pivot(lines),
+        "detail": detail_export(lines),
+        "buyers": {item_id: group.drop(columns="item_id") for item_id, group in buyers.groupby("item_id", sort=False)},
+    }
@@ -0,0 +1,31 @@
+import json
+import os
+
+import database as db
+
+# 主辦者設定檔：{"<代號>": {"name": "顯示名稱", "password": "管理密碼"}}
+TENANTS_FILE = os.environ.get("TENANTS_FILE", "tenants.json")
+# 沒有設定檔時只有預設主辦者 (沿用原本的資料庫)
+DEFAULT_PASSWORD = os.environ.get("BOSS_PASSWORD", "123456")
+DEFAULT_NAME = "團購訂單系統"
+
+
+def load_tenants() -> dict:
+    """讀取主辦者設定，回傳 {代號: {"name": ..., "password": ...}}"""
+    if not os.path.exists(TENANTS_FILE):
+        return {db.DEFAULT_TENANT: {"name": DEFAULT_NAME, "password": DEFAULT_PASSWORD}}
+    with open(TENANTS_FILE, encoding="utf-8") as f:
+        tenants = json.load(f)
+    for tenant, config in tenants.items():
+        db.validate_tenant(tenant)
+        if not config.get("password"):
+            raise ValueError(f"主辦者 {tenant} 未設定管理密碼")
+        config.setdefault("name", tenant)
+    return tenants
+
+
+def init_all(tenants: dict):
+    """初始化所有主辦者的資料庫分片"""
+    for tenant in tenants:
+        with db.using_tenant(tenant):
+            db.init_db()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# 預設使用記憶體資料庫；設定 DB_BACKEND=postgres (及 DB_HOST 等連線設定) 可對 PostgreSQL 執行相同的測試
+os.environ.setdefault("DB_BACKEND", "memory")
+# 主辦者的 SQLite 檔案放在暫存目錄 (DB_BACKEND=sqlite 時)
+_TENANT_DIR = tempfile.mkdtemp(prefix="buying_system_tests_")
+os.environ["TENANT_DB_DIR"] = _TENANT_DIR
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _REPO_DIR)
+
+import database as db  # noqa: E402
+
+requires_postgres = pytest.mark.skipif(db.DB_BACKEND != "postgres", reason="需設定 DB_BACKEND=postgres 及 PostgreSQL 連線")
+
+
+def drop_tenant(tenant: str):
+    """刪除主辦者的 PostgreSQL schema (SQLite 檔案在測試結束時隨暫存目錄刪除)"""
+    if db.DB_BACKEND == "postgres":
+        with db.using_tenant(tenant):
+            conn = db.get_connection()
+            conn.cursor().execute(f"DROP SCHEMA IF EXISTS {db.tenant_schema(tenant)} CASCADE")
+            conn.commit()
+            conn.close()
+
+
+@pytest.fixture
+def tenant():
+    """每個測試使用新的主辦者 (獨立的資料庫分片)，結束後刪除"""
+    tenant = f"test_{uuid.uuid4().hex[:16]}"
+    db.set_tenant(tenant)
+    db.init_db()
+    yield tenant
+    drop_tenant(tenant)
+    db.set_tenant(None)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TENANT_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def app_test(tenant, monkeypatch):
+    """以測試主辦者執行 app.py 的 AppTest (網址參數 ?tenant=<代號>，管理密碼 test)，不啟動背景清除"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import tenants
+    monkeypatch.setattr(tenants, "load_tenants", lambda: {tenant: {"name": "測試主辦者", "password": "test"}})
+    monkeypatch.setattr(db, "start_purge_worker", lambda tenants=None: None)
+    st.cache_resource.clear()
+    at = AppTest.from_file(os.path.join(_REPO_DIR, "app.py"), default_timeout=30)
+    at.query_params["tenant"] = tenant
+    yield at
+    st.cache_resource.clear()
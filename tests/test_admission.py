@@ -0,0 +1,173 @@
+import contextlib
+
+import pytest
+
+import admission
+import database as db
+
+
+class FakeClock:
+    """假時鐘：等候時直接推進時間，不實際睡眠"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class FakeCondition:
+    """單執行緒測試用：wait() 推進假時鐘"""
+
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.waits = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def wait(self, timeout: float):
+        self.waits.append(timeout)
+        self.clock.advance(timeout)
+
+    def notify_all(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission, "time", clock)
+    monkeypatch.setattr(admission, "_cond", FakeCondition(clock))
+    monkeypatch.setattr(admission, "_shards", {})
+    monkeypatch.setattr(admission, "_session_buckets", {})
+    monkeypatch.setattr(admission, "_metrics", {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0})
+    settings = {
+        "ADMISSION_ENABLED": True, "ADMISSION_GLOBAL_RATE": 1.0, "ADMISSION_GLOBAL_BURST": 3.0,
+        "ADMISSION_SESSION_RATE": 0.5, "ADMISSION_SESSION_BURST": 2.0, "ADMISSION_MAX_CONCURRENT": 4,
+        "ADMISSION_MAX_QUEUE": 0, "ADMISSION_QUEUE_TIMEOUT": 5.0,
+    }
+    for name, value in settings.items():
+        monkeypatch.setattr(admission, name, value)
+    return clock
+
+
+def admitted(session_key: str = None, tenant: str = "shop") -> bool:
+    try:
+        with admission.admit(session_key, tenant):
+            return True
+    except admission.AdmissionRejected:
+        return False
+
+
+def test_global_burst_then_refill(clock):
+    assert [admitted() for _ in range(4)] == [True, True, True, False]
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        admission.admit(tenant="shop").__enter__()
+    assert rejected.value.retry_after == 1
+    # 每秒補充 1 個令牌
+    clock.advance(0.5)
+    assert not admitted()
+    clock.advance(0.5)
+    assert admitted()
+    assert not admitted()
+    clock.advance(10)
+    # 最多累積 burst 個
+    assert [admitted() for _ in range(4)] == [True, True, True, False]
+
+
+def test_session_rate_limit(clock):
+    assert [admitted("amy") for _ in range(3)] == [True, True, False]
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        admission.admit("amy", "shop").__enter__()
+    assert rejected.value.retry_after == 2
+    # 其他使用者不受影響
+    assert admitted("bob")
+    clock.advance(2)
+    assert admitted("amy")
+    assert admission.metrics()["rejected"] == 2
+
+
+def test_queue_waits_for_refill(clock, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUE", 1)
+    monkeypatch.setattr(admission, "ADMISSION_GLOBAL_BURST", 1.0)
+    assert admitted()
+    start = clock.now
+    assert admitted()
+    assert clock.now - start == pytest.approx(1.0)
+    assert admission.metrics() == dict(admitted=2, queued=1, rejected=0, timed_out=0, active=0, waiting=0)
+
+
+def test_queue_times_out(clock, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUE", 1)
+    monkeypatch.setattr(admission, "ADMISSION_GLOBAL_RATE", 0.1)
+    monkeypatch.setattr(admission, "ADMISSION_GLOBAL_BURST", 1.0)
+    assert admitted()
+    start = clock.now
+    assert not admitted()
+    assert clock.now - start == pytest.approx(5.0)
+    metrics = admission.metrics()
+    assert (metrics["timed_out"], metrics["queued"], metrics["waiting"]) == (1, 1, 0)
+
+
+def test_full_queue_is_rejected_immediately(clock, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_CONCURRENT", 1)
+    with admission.admit(tenant="shop"):
+        assert admission.metrics()["active"] == 1
+        start = clock.now
+        # 同時寫入已達上限且排隊人數已滿 (上限 0)
+        assert not admitted()
+        assert clock.now == start
+    assert admission.metrics()["rejected"] == 1
+    assert admitted()
+
+
+def test_tenants_have_separate_buckets(clock):
+    assert [admitted("amy", "shop") for _ in range(3)] == [True, True, False]
+    assert [admitted(None, "shop") for _ in range(2)] == [True, False]
+    # 另一個分片的全域及個人令牌桶都不受影響
+    assert [admitted("amy", "other") for _ in range(2)] == [True, True]
+    assert admitted(None, "other")
+
+
+def test_disabled_admission_always_admits(clock, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", False)
+    assert all(admitted("amy") for _ in range(20))
+
+
+def test_order_form_shows_busy_message_instead_of_writing(app_test, monkeypatch):
+    group_order_id = db.create_group_order("測試團", "", "2000-01-01", "2999-12-31")
+    db.add_item(group_order_id, "豬肉", 100)
+
+    refusing = [True]
+    admit = admission.admit
+
+    @contextlib.contextmanager
+    def refuse(session_key=None, tenant=None):
+        if refusing[0]:
+            raise admission.AdmissionRejected(6.2)
+        with admit(session_key, tenant):
+            yield
+
+    monkeypatch.setattr(admission, "admit", refuse)
+    at = app_test.run()
+    at.selectbox(key="new_order_select").set_value(at.selectbox(key="new_order_select").options[0]).run()
+    at.text_input(key="new_customer_name").input("Amy")
+    next(n for n in at.number_input if n.key.startswith("qty_")).set_value(2).run()
+    next(b for b in at.button if b.label == "送出訂單").click().run()
+    assert not at.exception
+    assert [w.value for w in at.warning] == ["目前下單人數較多，請於 7 秒後再送出一次，購物車內容會保留"]
+    assert not at.success
+    assert db.get_customer_orders_by_group(group_order_id) == []
+
+    # 重試時已受理：寫入一筆
+    refusing[0] = False
+    next(b for b in at.button if b.label == "送出訂單").click().run()
+    assert at.success
+    assert len(db.get_customer_orders_by_group(group_order_id)) == 1
@@ -0,0 +1,172 @@
+import asyncio
+import sys
+import uuid
+
+import pytest
+
+import async_db
+import backends
+import database as db
+from conftest import requires_postgres
+
+if db.DB_BACKEND == "postgres":
+    pytest.importorskip("asyncpg")
+
+
+def run(coro_fn, *args):
+    """在新的事件迴圈執行，結束時關閉連線池 (連線池不能跨事件迴圈使用)"""
+    async def main():
+        try:
+            return await coro_fn(*args)
+        finally:
+            await async_db.close()
+    return asyncio.run(main())
+
+
+def normalize(value):
+    """比對用：資料列轉為字典，金額四捨五入 (PostgreSQL REAL 為單精度)"""
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if hasattr(value, "keys"):
+        return {k: normalize(value[k]) for k in value.keys()}
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def by_id(rows: list) -> list:
+    return sorted(normalize(rows), key=lambda row: row['id'])
+
+
+@pytest.fixture
+def group_order(tenant):
+    """含已刪除品項、已刪除訂單、下單後調價及同一顧客不同寫法的團購單"""
+    group_order_id = db.create_group_order("測試團", "說明", "2000-01-01", "2999-12-31")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    removed = db.add_item(group_order_id, "停售", 30)
+    amy = db.create_customer_order(group_order_id, "Amy", {pork: 2, removed: 1}, "備註")
+    db.create_customer_order(group_order_id, "  ａｍｙ ", {beef: 1})
+    bob = db.create_customer_order(group_order_id, "Bob", {pork: 1, beef: 3})
+    deleted = db.create_customer_order(group_order_id, "Carol", {pork: 5})
+    db.update_item_price(pork, 120)
+    db.delete_item(removed)
+    db.delete_customer_order(deleted)
+    db.update_customer_order_paid_status(bob, 1)
+    return {"id": group_order_id, "items": [pork, beef], "orders": [amy, bob], "deleted_order": deleted}
+
+
+def test_group_order_reads_match(group_order):
+    gid = group_order["id"]
+    assert normalize(run(async_db.get_open_group_orders)) == normalize(db.get_open_group_orders())
+    assert normalize(run(async_db.get_group_order_by_id, gid)) == normalize(db.get_group_order_by_id(gid))
+    assert run(async_db.get_group_order_by_id, gid + 1000) is None
+    assert by_id(run(async_db.get_items_by_group_order, gid)) == by_id(db.get_items_by_group_order(gid))
+    assert by_id(run(async_db.get_group_order_summary, gid)) == by_id(db.get_group_order_summary(gid))
+
+
+def test_customer_order_reads_match(group_order):
+    gid = group_order["id"]
+    assert by_id(run(async_db.get_customer_orders_by_group, gid)) == by_id(db.get_customer_orders_by_group(gid))
+    for name in ("AMY", "Bob", "nobody"):
+        assert by_id(run(async_db.get_customer_orders_by_name, gid, name)) == by_id(
+            db.get_customer_orders_by_name(gid, name)
+        )
+    for customer_order_id in group_order["orders"] + [group_order["deleted_order"]]:
+        assert normalize(run(async_db.get_customer_order_by_id, customer_order_id)) == normalize(
+            db.get_customer_order_by_id(customer_order_id)
+        )
+        assert by_id(run(async_db.get_order_details, customer_order_id)) == by_id(
+            db.get_order_details(customer_order_id)
+        )
+
+
+def test_fan_out_reads_match(group_order):
+    gid = group_order["id"]
+    overview = run(async_db.get_group_order_overview, gid)
+    assert normalize(overview["group_order"]) == normalize(db.get_group_order_by_id(gid))
+    assert by_id(overview["summary"]) == by_id(db.get_group_order_summary(gid))
+    assert by_id(overview["customer_orders"]) == by_id(db.get_customer_orders_by_group(gid))
+    assert run(async_db.get_group_order_overview, gid + 1000) is None
+
+    ids = group_order["orders"] + [group_order["deleted_order"]]
+    results = run(async_db.get_customer_orders_with_details, ids)
+    assert [r["order"]["id"] for r in results] == group_order["orders"]
+    for result in results:
+        assert by_id(result["details"]) == by_id(db.get_order_details(result["order"]["id"]))
+
+
+def test_writes_match_sync(group_order):
+    gid = group_order["id"]
+    pork, beef = group_order["items"]
+    key = uuid.uuid4().hex
+
+    async def create_twice():
+        first = await async_db.create_customer_order(gid, "Dave", {pork: 1}, "n", idempotency_key=key)
+        again = await async_db.create_customer_order(gid, "Dave", {pork: 1}, "n", idempotency_key=key)
+        return first, again
+
+    created, again = run(create_twice)
+    assert created == again
+    order = db.get_customer_order_by_id(created)
+    assert (order['total_amount'], order['item_count'], order['version']) == (120, 1, 0)
+
+    # 版本不符時與同步版相同，不寫入並回傳 False
+    assert run(async_db.update_customer_order, created, {beef: 2}, 5) is False
+    assert run(async_db.update_customer_order, created, {pork: 1, beef: 2}, 0) is True
+    assert db.get_customer_order_by_id(created)['total_amount'] == 620
+
+    run(async_db.update_customer_order_paid_status, created, 1)
+    assert db.get_customer_order_by_id(created)['is_paid'] == 1
+    run(async_db.delete_customer_order, created)
+    assert db.get_customer_order_by_id(created) is None
+    assert db.check_order_totals() == []
+
+
+def test_concurrent_writes_keep_totals(group_order):
+    gid = group_order["id"]
+    pork, beef = group_order["items"]
+
+    async def place_orders():
+        return await asyncio.gather(*(
+            async_db.create_customer_order(gid, f"顧客{n}", {pork: 1, beef: n % 3 + 1}) for n in range(20)
+        ))
+
+    created = run(place_orders)
+    assert len(set(created)) == 20
+    assert db.check_order_totals() == []
+    summary = {row['id']: row for row in db.get_group_order_summary(gid)}
+    assert summary[pork]['total_qty'] == 2 + 1 + 20
+
+
+@requires_postgres
+def test_asyncpg_queries_used_on_postgres(group_order):
+    """PostgreSQL 的讀取經由 asyncpg 執行與同步版相同的 SQL，結果需一致"""
+    gid = group_order["id"]
+    amy = group_order["orders"][0]
+
+    async def reads():
+        summary = await async_db.get_group_order_summary(gid)
+        orders = await async_db.get_customer_orders_by_name(gid, "ＡＭＹ")
+        details = await async_db.get_order_details(amy)
+        # 讀取確實經由連線池 (非執行緒池)
+        assert db.get_tenant() in async_db._pools
+        return summary, orders, details
+
+    summary, orders, details = run(reads)
+    assert by_id(summary) == by_id(db.get_group_order_summary(gid))
+    assert by_id(orders) == by_id(db.get_customer_orders_by_name(gid, "amy"))
+    assert len(orders) == 2
+    assert by_id(details) == by_id(db.get_order_details(amy))
+    # 明細為下單時的單價，已刪除的品項不列出
+    assert [(d['quantity'], d['price']) for d in details] == [(2, 100)]
+
+
+def test_missing_asyncpg_reports_install_hint(monkeypatch):
+    """未安裝 asyncpg 時建立連線池需提示安裝選用套件"""
+    monkeypatch.setitem(sys.modules, "asyncpg", None)
+    backend = backends.PostgresBackend(lambda tenant: "public")
+    with pytest.raises(RuntimeError, match="requirements-async.txt"):
+        asyncio.run(backend.create_async_pool("default", 1, 1))
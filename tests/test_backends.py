@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+import backends
+import bench_orders
+import database as db
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="DB_BACKEND"):
+        backends.create_backend("mysql", db.tenant_db_path, db.tenant_schema)
+
+
+def test_memory_backend_reset_clears_data():
+    backend = backends.MemoryBackend(db.tenant_db_path)
+    conn = backend.connect("t")
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+    conn.close()
+    # 已關閉的連線放回連線池，資料仍在
+    conn = backend.connect("t")
+    assert [tuple(row) for row in conn.execute("SELECT x FROM t")] == [(1,)]
+    conn.close()
+
+    backend.reset()
+    conn = backend.connect("t")
+    assert conn.execute("SELECT name FROM sqlite_master").fetchall() == []
+    conn.close()
+    backend.reset()
+
+
+def test_memory_backend_double_close_returns_connection_once():
+    backend = backends.MemoryBackend(db.tenant_db_path)
+    conn = backend.connect("t")
+    conn.close()
+    conn.close()
+    # 連線只放回一次，兩次取用不會拿到同一條連線
+    first, second = backend.connect("t"), backend.connect("t")
+    assert first is conn and second is not conn
+    first.close()
+    second.close()
+    backend.reset()
+
+
+def test_random_scenarios_keep_totals_and_rollups(tenant):
+    """以量測用的隨機情境檢查金額與銷售彙總 (記憶體資料庫可在數秒內執行數百個情境)"""
+    rng = random.Random(0)
+    for index in range(200):
+        bench_orders.run_scenario(db, rng, index)
+    trend = db.get_sales_trend("day")
+    top_items = db.get_top_sales("item", "day")
+    db.rebuild_rollups()
+    assert [dict(row) for row in trend] == [dict(row) for row in db.get_sales_trend("day")]
+    assert [dict(row) for row in top_items] == [dict(row) for row in db.get_top_sales("item", "day")]
+    assert db.check_order_totals() == []
+
+
+def test_dialect_follows_current_backend(tmp_path, monkeypatch):
+    """方言運算式在執行時向目前的後端取得 (切換後端，例如轉移資料時開啟 SQLite，不會沿用啟動時的後端)"""
+    monkeypatch.setattr(db, "backend", backends.SQLiteBackend(lambda tenant: str(tmp_path / f"{tenant}.db")))
+    with db.using_tenant("switched"):
+        db.init_db()
+        group_order_id = db.create_group_order("測試團")
+        pork = db.add_item(group_order_id, "豬肉", 100)
+        order = db.create_customer_order(group_order_id, "Amy", {pork: 2})
+        assert [r['amount'] for r in db.get_sales_trend("month")] == [200]
+        db.delete_customer_order(order)
+        assert db.purge_deleted() == 2
@@ -0,0 +1,56 @@
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+import backends
+import backup
+import database as db
+
+
+@pytest.mark.skipif(db.DB_BACKEND == "postgres", reason="PostgreSQL 的備份需要 pg_dump / pg_restore")
+def test_backup_round_trip(tenant, tmp_path):
+    group_order_id = db.create_group_order("備份前")
+    path = backup.create_backup(str(tmp_path))
+    assert backup.list_backups(str(tmp_path)) == [path]
+    assert os.path.basename(path).startswith(tenant)
+
+    db.delete_group_order(group_order_id)
+    db.create_group_order("備份後")
+    backup.restore_backup(path)
+    assert [g['title'] for g in db.get_all_group_orders()] == ["備份前"]
+
+    assert backup.prune_backups(str(tmp_path), keep=0) == [path]
+    assert backup.list_backups(str(tmp_path)) == []
+
+
+def test_online_backup_stops_restarting_under_writes(tmp_path, monkeypatch):
+    """每一步之間都有寫入 (持續下單) 時，重來超過上限後改為一次複製完成"""
+    source = str(tmp_path / "source.db")
+    conn = sqlite3.connect(source)
+    conn.execute("CREATE TABLE t (x TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,)] * 200)
+    conn.commit()
+    writes = []
+
+    def write_between_steps(seconds):
+        # 上限保護：修正前會無限重來
+        if len(writes) < 50:
+            conn.execute("INSERT INTO t VALUES ('new')")
+            conn.commit()
+            writes.append(seconds)
+
+    monkeypatch.setattr(backends.time, "sleep", write_between_steps)
+    backend = backends.SQLiteBackend(lambda tenant: source)
+    path = str(tmp_path / "source.db.gz")
+    backend.backup("default", path, 1, 0, 2)
+    conn.close()
+
+    assert len(writes) == 3
+    restored = str(tmp_path / "restored.db")
+    with gzip.open(path, "rb") as src, open(restored, "wb") as dst:
+        dst.write(src.read())
+    check = sqlite3.connect(restored)
+    assert check.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 200 + len(writes)
+    check.close()
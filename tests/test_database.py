@@ -0,0 +1,207 @@
+import database as db
+
+
+def details_by_item(customer_order_id: int) -> dict:
+    return {d['item_id']: (d['quantity'], d['price']) for d in db.get_order_details(customer_order_id)}
+
+
+def test_update_keeps_unit_price_of_unchanged_lines(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    fish = db.add_item(group_order_id, "魚", 80)
+    order = db.create_customer_order(group_order_id, "Amy", {pork: 2, beef: 1})
+    for item_id, price in ((pork, 120), (beef, 300), (fish, 90)):
+        db.update_item_price(item_id, price)
+
+    # 豬肉數量不變、牛肉改數量、新增魚
+    assert db.update_customer_order(order, {pork: 2, beef: 3, fish: 1})
+    assert details_by_item(order) == {pork: (2, 100), beef: (3, 300), fish: (1, 90)}
+    assert db.get_customer_order_by_id(order)['total_amount'] == 2 * 100 + 3 * 300 + 90
+
+    # 移除牛肉 (數量 0) 及魚 (未列出)
+    assert db.update_customer_order(order, {pork: 2, beef: 0})
+    assert details_by_item(order) == {pork: (2, 100)}
+    assert db.check_order_totals() == []
+
+
+def test_edit_form_total_matches_saved_total(app_test):
+    """編輯表單的總計：數量未變的品項以下單時的單價計算，與儲存後的金額一致"""
+    group_order_id = db.create_group_order("測試團", "", "2000-01-01", "2999-12-31")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    order = db.create_customer_order(group_order_id, "Amy", {pork: 2, beef: 1})
+    db.update_item_price(pork, 120)
+    db.update_item_price(beef, 300)
+
+    at = app_test.run()
+    select = at.selectbox(key="edit_order_select")
+    select.set_value(select.options[0]).run()
+    at.text_input(key="search_name").input("Amy").run()
+    [b for b in at.button if b.label == "修改此訂單"][0].click().run()
+    # 最後一個總計為編輯表單 (前一個為下單表單)
+    assert at.metric[-1].value == "$450"
+
+    # 牛肉改數量後以目前價格計算，豬肉仍為下單時的單價
+    at.number_input(key=f"cust_edit_qty_{order}_{beef}").set_value(2).run()
+    assert at.metric[-1].value == "$800"
+    [b for b in at.button if b.label == "儲存修改"][0].click().run()
+    assert not at.exception
+    assert db.get_customer_order_by_id(order)['total_amount'] == 800
+
+
+def test_clone_copies_live_items_with_adjusted_prices(tenant):
+    source = db.create_group_order("上週團", "說明", "2000-01-01", "2000-01-07")
+    db.add_item(source, "豬肉", 100)
+    removed = db.add_item(source, "停售", 30)
+    db.add_item(source, "牛肉", 99.99)
+    db.delete_item(removed)
+
+    clone = db.clone_group_order(source, "2000-01-08", "2999-12-31", price_adjust_pct=10)
+    order = db.get_group_order_by_id(clone)
+    assert (order['title'], order['description'], order['status']) == ("上週團", "說明", "open")
+    assert (str(order['start_time'])[:10], str(order['end_time'])[:10]) == ("2000-01-08", "2999-12-31")
+    # 價格四捨五入到小數第二位，已刪除的品項不複製
+    assert [(i['name'], round(i['price'], 2)) for i in db.get_items_by_group_order(clone)] == [
+        ("豬肉", 110.0), ("牛肉", 109.99)
+    ]
+    assert [o['id'] for o in db.get_open_group_orders()] == [clone]
+
+    discounted = db.clone_group_order(source, "2000-01-08", "2000-01-14", title="特價團", price_adjust_pct=-15)
+    assert db.get_group_order_by_id(discounted)['title'] == "特價團"
+    assert [round(i['price'], 2) for i in db.get_items_by_group_order(discounted)] == [85.0, 84.99]
+    # 原團購單不受影響
+    assert [round(i['price'], 2) for i in db.get_items_by_group_order(source)] == [100, 99.99]
+
+
+def test_clone_missing_source_returns_none(tenant):
+    assert db.clone_group_order(12345, "2000-01-01", "2000-01-07") is None
+    deleted = db.create_group_order("已刪除")
+    db.delete_group_order(deleted)
+    assert db.clone_group_order(deleted, "2000-01-01", "2000-01-07") is None
+    assert db.get_all_group_orders() == []
+
+
+def test_version_conflict_does_not_write(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    order = db.create_customer_order(group_order_id, "Amy", {pork: 1})
+    assert db.update_customer_order(order, {pork: 2}, expected_version=0)
+    assert not db.update_customer_order(order, {pork: 5}, expected_version=0)
+    assert db.get_order_details_as_dict(order) == {pork: 2}
+    order_row, details = db.get_customer_order_for_edit(order)
+    assert order_row['version'] == 1 and [(d['item_id'], d['quantity']) for d in details] == [(pork, 2)]
+    assert db.get_customer_order_for_edit(order + 1000) is None
+
+
+def test_edit_button_loads_order_of_current_tenant(app_test):
+    """修改按鈕的回呼在頁面程式之前執行，仍需讀取網址指定的主辦者"""
+    group_order_id = db.create_group_order("測試團", "", "2000-01-01", "2999-12-31")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    order = db.create_customer_order(group_order_id, "Amy", {pork: 3})
+
+    at = app_test.run()
+    select = at.selectbox(key="edit_order_select")
+    select.set_value(select.options[0]).run()
+    at.text_input(key="search_name").input("Amy").run()
+    [b for b in at.button if b.label == "修改此訂單"][0].click().run()
+    assert not at.exception
+    assert at.number_input(key=f"cust_edit_qty_{order}_{pork}").value == 3
+
+
+def test_soft_delete_hides_rows_until_purged(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    order = db.create_customer_order(group_order_id, "Amy", {pork: 1})
+    db.delete_group_order(group_order_id)
+    assert db.get_group_order_by_id(group_order_id) is None
+    assert db.get_sales_trend("day") == []
+
+    assert db.purge_deleted(batch_size=1) == 4
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    for table in ("group_orders", "items", "customer_orders", "order_details"):
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        assert cursor.fetchone()[0] == 0, table
+    conn.close()
+    assert db.get_customer_order_by_id(order) is None
+
+
+def test_revision_changes_on_every_write(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    amy = db.create_customer_order(group_order_id, "Amy", {pork: 1})
+    bob = db.create_customer_order(group_order_id, "Bob", {pork: 1})
+    revisions = [db.get_group_order_revision(group_order_id)]
+
+    # 付款狀態對調、價格對調：摘要值相同，版本仍需不同
+    db.update_customer_order_paid_status(amy, 1)
+    revisions.append(db.get_group_order_revision(group_order_id))
+    db.update_customer_order_paid_status(amy, 0)
+    db.update_customer_order_paid_status(bob, 1)
+    revisions.append(db.get_group_order_revision(group_order_id))
+    db.update_item_price(pork, 250)
+    db.update_item_price(beef, 100)
+    revisions.append(db.get_group_order_revision(group_order_id))
+    db.delete_customer_order(amy)
+    db.create_customer_order(group_order_id, "Carol", {pork: 1})
+    revisions.append(db.get_group_order_revision(group_order_id))
+    assert len(set(revisions)) == len(revisions)
+
+
+def test_order_totals_follow_writes(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    first = db.create_customer_order(group_order_id, "Amy", {pork: 2, beef: 1})
+    second = db.create_customer_order(group_order_id, "Bob", {beef: 2})
+    assert db.get_customer_order_by_id(first)['total_amount'] == 450
+    assert db.get_customer_order_by_id(first)['item_count'] == 3
+
+    summary = {row['id']: (row['total_qty'], row['total_amount']) for row in db.get_group_order_summary(group_order_id)}
+    assert summary == {pork: (2, 200), beef: (3, 750)}
+
+    db.delete_item(beef)
+    assert db.get_customer_order_by_id(first)['total_amount'] == 200
+    assert db.get_customer_order_by_id(second)['total_amount'] == 0
+    assert db.check_order_totals() == []
+
+
+def test_idempotency_key_after_delete_creates_new_order(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    first = db.create_customer_order(group_order_id, "Amy", {pork: 1}, idempotency_key="k1")
+    assert db.create_customer_order(group_order_id, "Amy", {pork: 1}, idempotency_key="k1") == first
+    assert len(db.get_customer_orders_by_group(group_order_id)) == 1
+
+    db.delete_customer_order(first)
+    again = db.create_customer_order(group_order_id, "Amy", {pork: 1}, idempotency_key="k1")
+    assert again != first
+    assert db.get_customer_order_by_id(again) is not None
+
+    # 刪除整張團購單後也釋放冪等鍵
+    other = db.create_group_order("另一團")
+    beef = db.add_item(other, "牛肉", 250)
+    kept = db.create_customer_order(other, "Bob", {beef: 1}, idempotency_key="k2")
+    db.delete_group_order(other)
+    assert db.create_customer_order(group_order_id, "Bob", {pork: 1}, idempotency_key="k2") != kept
+
+
+def test_customer_name_variants_are_one_customer(tenant):
+    first = db.create_group_order("第一團")
+    second = db.create_group_order("第二團")
+    item_first = db.add_item(first, "豬肉", 100)
+    item_second = db.add_item(second, "牛肉", 250)
+    db.create_customer_order(first, "Amy Chen", {item_first: 1})
+    db.create_customer_order(second, "  ａｍｙ   chen ", {item_second: 2})
+    db.create_customer_order(second, "Bob", {item_second: 1})
+
+    customer = db.get_customer_by_name("AMY CHEN")
+    assert customer['name'] == "Amy Chen"
+    history = db.get_customer_order_history(customer['id'])
+    assert sorted(h['group_order_title'] for h in history) == ["第一團", "第二團"]
+    repeat = db.get_repeat_customers()
+    assert [(c['name'], c['group_orders'], c['amount']) for c in repeat] == [("Amy Chen", 2, 600)]
+    assert len(db.get_customer_orders_by_name(second, "amy chen")) == 1
+    assert db.get_customer_by_name("nobody") is None
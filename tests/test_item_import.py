@@ -0,0 +1,70 @@
+import io
+
+import openpyxl
+
+import item_import
+
+
+def xlsx(rows: list) -> bytes:
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    data = io.BytesIO()
+    workbook.save(data)
+    return data.getvalue()
+
+
+def test_csv_with_bom_and_blank_rows():
+    data = "品項,價格\n豬肉,100\n\n ,50\n牛肉,250.5\n".encode("utf-8-sig")
+    items, errors = item_import.parse_item_file("items.csv", data)
+    assert items == [{"name": "豬肉", "price": 100.0}, {"name": "牛肉", "price": 250.5}]
+    assert errors == []
+
+
+def test_xlsx_with_blank_rows():
+    data = xlsx([["品項", "價格"], ["豬肉", 100], [None, None], ["牛肉", 250]])
+    items, errors = item_import.parse_item_file("items.XLSX", data)
+    assert items == [{"name": "豬肉", "price": 100.0}, {"name": "牛肉", "price": 250.0}]
+    assert errors == []
+
+
+def test_renamed_columns_are_accepted():
+    data = "備註, Name ,PRICE\nx,豬肉,100\n".encode()
+    assert item_import.parse_item_file("items.csv", data) == ([{"name": "豬肉", "price": 100.0}], [])
+    data = xlsx([["品項名稱", "單價"], ["豬肉", 100]])
+    assert item_import.parse_item_file("items.xlsx", data) == ([{"name": "豬肉", "price": 100.0}], [])
+
+
+def test_missing_columns():
+    assert item_import.parse_item_file("items.csv", "品項,數量\n豬肉,1\n".encode()) == (
+        [], ["找不到「品項」及「價格」欄位"]
+    )
+    items, errors = item_import.parse_item_file("items.xlsx", b"not a workbook")
+    assert items == [] and errors[0].startswith("無法讀取檔案")
+
+
+def test_invalid_prices_report_file_rows():
+    data = "品項,價格\n豬肉,abc\n\n牛肉,-5\n雞肉,0\n魚,\n蝦,80\n".encode()
+    items, errors = item_import.parse_item_file("items.csv", data)
+    assert items == [{"name": "蝦", "price": 80.0}]
+    assert errors == [f"第 {row} 列：價格無效" for row in (2, 4, 5, 6)]
+
+
+def test_duplicate_and_existing_names():
+    data = "品項,價格\n豬肉,100\n 豬肉 ,120\n牛肉,250\n雞肉,90\n".encode()
+    items, errors = item_import.parse_item_file("items.csv", data, existing_names=["雞肉 "])
+    assert items == [{"name": "豬肉", "price": 100.0}, {"name": "牛肉", "price": 250.0}]
+    assert errors == ["第 5 列：品項「雞肉」已存在", "第 3 列：品項「豬肉」重複"]
+
+
+def test_parsed_items_are_written_in_one_batch(tenant):
+    import database as db
+
+    group_order_id = db.create_group_order("測試團")
+    data = "品項,價格\n" + "".join(f"品項{n},{n + 1}\n" for n in range(2000))
+    items, errors = item_import.parse_item_file("items.csv", data.encode())
+    assert errors == []
+    assert db.add_items_bulk(group_order_id, items) == 2000
+    assert db.add_items_bulk(group_order_id, []) == 0
+    rows = db.get_items_by_group_order(group_order_id)
+    assert len(rows) == 2000 and sum(row['price'] for row in rows) == sum(range(1, 2001))
@@ -0,0 +1,68 @@
+import database as db
+import live_stats
+
+
+def totals(summary: dict) -> dict:
+    """比對用：統計中會隨訂單變動的欄位"""
+    return {
+        "orders": {cid: (o["customer_name"], o["is_paid"], o["lines"]) for cid, o in summary["orders"].items()},
+        "item_qty": summary["item_qty"],
+        "item_amount": {k: round(v, 2) for k, v in summary["item_amount"].items()},
+        "amount": {k: round(v, 2) for k, v in summary["amount"].items()},
+        "count": summary["count"],
+    }
+
+
+def test_incremental_updates_match_reload(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    amy = db.create_customer_order(group_order_id, "Amy", {pork: 2})
+    summary = live_stats.load_live_summary(group_order_id)
+
+    bob = db.create_customer_order(group_order_id, "Bob", {beef: 1})
+    db.update_customer_order(amy, {pork: 1, beef: 2})
+    db.update_customer_order_paid_status(bob, 1)
+    summary = live_stats.apply_changes(summary)
+    assert totals(summary) == totals(live_stats.load_live_summary(group_order_id))
+    assert [r["event"] for r in summary["recent"]] == ["付款狀態變更", "修改訂單", "新增訂單"]
+
+    db.delete_customer_order(amy)
+    summary = live_stats.apply_changes(summary)
+    assert totals(summary) == totals(live_stats.load_live_summary(group_order_id))
+    assert summary["recent"][0] == {**summary["recent"][0], "event": "刪除訂單", "customer_name": "Amy"}
+
+    # 品項變更時重新讀取整張團購單
+    db.update_item_price(beef, 300)
+    db.create_customer_order(group_order_id, "Carol", {beef: 1})
+    summary = live_stats.apply_changes(summary)
+    assert totals(summary) == totals(live_stats.load_live_summary(group_order_id))
+    assert summary["item_amount"][beef] == 250 + 300
+
+
+def test_late_committed_event_is_applied(tenant):
+    """編號較小但較晚提交的變更 (PostgreSQL 同時寫入時) 仍會套用"""
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    amy = db.create_customer_order(group_order_id, "Amy", {pork: 1})
+    # 預留編號空隙，模擬先取得編號、尚未提交的交易
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(db._sql("INSERT INTO order_events (id, group_order_id, event) VALUES (?, ?, 'items')"),
+                   (db.get_latest_order_event_id() + 10, group_order_id + 1000))
+    conn.commit()
+    late_id = db.get_latest_order_event_id() - 5
+    summary = live_stats.load_live_summary(group_order_id)
+    db.create_customer_order(group_order_id, "Bob", {pork: 2})
+    summary = live_stats.apply_changes(summary)
+
+    cursor.execute(db._sql("UPDATE order_details SET quantity = 3 WHERE customer_order_id = ?"), (amy,))
+    cursor.execute(db._sql("INSERT INTO order_events (id, group_order_id, customer_order_id, event) VALUES (?, ?, ?, 'updated')"),
+                   (late_id, group_order_id, amy))
+    conn.commit()
+    conn.close()
+    assert late_id < summary["cursor"]
+    summary = live_stats.apply_changes(summary)
+    assert summary["item_qty"][pork] == 5
+    # 已套用的變更不重複列出
+    assert live_stats.apply_changes(summary)["recent"] == summary["recent"]
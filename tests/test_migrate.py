@@ -0,0 +1,66 @@
+import backends
+import database as db
+import migrate
+from conftest import requires_postgres
+
+
+def totals(result: dict, key: str) -> int:
+    return sum(counts[key] for counts in result.values())
+
+
+@requires_postgres
+def test_incremental_migration_from_sqlite(tenant, tmp_path, monkeypatch):
+    source = str(tmp_path / "source.db")
+    postgres = db.backend
+    sqlite = backends.SQLiteBackend(lambda tenant: source)
+
+    def migrate_and_verify() -> dict:
+        monkeypatch.setattr(db, "backend", postgres)
+        result = migrate.migrate_from_sqlite(source, batch_size=2, progress=lambda _: None)
+        checks = migrate.verify_migration(source, batch_size=2)
+        assert [c["table"] for c in checks if not c["match"]] == []
+        return result
+
+    # 來源 SQLite 資料
+    monkeypatch.setattr(db, "backend", sqlite)
+    db.init_db()
+    group_order_id = db.create_group_order("測試團", "說明\t含\\特殊字元\n", "2000-01-01", "2999-12-31")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 99.9)
+    amy = db.create_customer_order(group_order_id, "Amy", {pork: 2, beef: 1}, "備註")
+    bob = db.create_customer_order(group_order_id, "Bob", {beef: 3})
+    db.create_customer_order(group_order_id, " ａｍｙ ", {pork: 1})
+
+    first = migrate_and_verify()
+    assert totals(first, "copied") > 0 and totals(first, "deleted") == 0
+    assert round(db.get_customer_order_by_id(amy)['total_amount'], 2) == 299.9
+
+    # 只寫入 PostgreSQL 的資料 (新顧客及其訂單)，重新轉移時需刪除；
+    # 顧客沒有串聯刪除，需先刪除參照的訂單
+    zed = db.create_customer_order(group_order_id, "Zed", {pork: 1})
+
+    # 來源有修改、刪除及新增
+    monkeypatch.setattr(db, "backend", sqlite)
+    db.update_customer_order(amy, {pork: 5})
+    db.delete_customer_order(bob)
+    db.delete_item(beef)
+    assert db.purge_deleted() > 0
+    other = db.create_group_order("第二團", "", "2000-01-01", "2999-12-31")
+    chicken = db.add_item(other, "雞肉", 80)
+
+    second = migrate_and_verify()
+    assert second["customers"]["deleted"] == 1
+    assert second["customer_orders"]["deleted"] >= 1 and second["order_details"]["deleted"] >= 1
+    assert db.get_customer_order_by_id(zed) is None and db.get_customer_order_by_id(bob) is None
+    assert db.get_customer_by_name("zed") is None
+    assert db.get_order_details_as_dict(amy) == {pork: 5}
+    assert [i['id'] for i in db.get_items_by_group_order(other)] == [chicken]
+    assert db.check_order_totals() == []
+    # 序號已重設：新資料接在轉移的編號之後
+    assert db.create_group_order("轉移後") > other
+
+    # 來源沒有變動時只比對 checksum，只刪除 PostgreSQL 多出的資料
+    third = migrate_and_verify()
+    assert totals(third, "copied") == totals(third, "synced") == 0
+    assert third["group_orders"]["deleted"] == 1
+    assert totals(migrate_and_verify(), "deleted") == 0
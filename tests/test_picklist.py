@@ -0,0 +1,35 @@
+import csv
+import io
+
+import database as db
+import picklist
+
+
+def test_pick_lines_stream_in_batches(tenant):
+    group_order_id = db.create_group_order("測試團")
+    items = [db.add_item(group_order_id, f"品項{n}", 10 + n) for n in range(3)]
+    for n in range(7):
+        db.create_customer_order(group_order_id, f"顧客{n}", {item_id: n % 2 + 1 for item_id in items})
+    lines = list(db.iter_pick_lines(group_order_id, by="item", batch_size=2))
+    assert len(lines) == 21
+    assert [line['item_id'] for line in lines] == sorted(line['item_id'] for line in lines)
+
+
+def test_pick_list_sheets(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    removed = db.add_item(group_order_id, "停售", 30)
+    db.create_customer_order(group_order_id, "Bob", {beef: 1}, "<請先打電話>")
+    db.create_customer_order(group_order_id, "Amy", {pork: 2, beef: 1, removed: 1})
+    db.delete_item(removed)
+
+    rows = list(csv.reader(io.StringIO("".join(picklist.iter_pick_list_csv(group_order_id, "customer")))))
+    assert rows[0][0] == "\ufeff顧客姓名"
+    assert [(r[0], r[2], r[4]) for r in rows[1:]] == [("Amy", "豬肉", "2"), ("Amy", "牛肉", "1"), ("Bob", "牛肉", "1")]
+
+    sheets = "".join(picklist.iter_pick_list_html(group_order_id, "測試團", "item"))
+    assert sheets.count("<section class='sheet'>") == 2
+    assert "停售" not in sheets
+    customer_sheets = "".join(picklist.iter_pick_list_html(group_order_id, "測試團", "customer"))
+    assert "&lt;請先打電話&gt;" in customer_sheets
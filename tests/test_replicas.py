@@ -0,0 +1,90 @@
+import itertools
+import os
+import shutil
+
+import pytest
+
+import backends
+import database as db
+
+
+def titles() -> set:
+    return {order['title'] for order in db.get_all_group_orders()}
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """主資料庫及唯讀副本為兩個 SQLite 檔案；副本停留在複製當時的內容"""
+    primary = str(tmp_path / "primary.db")
+    replica = str(tmp_path / "replica.db")
+    monkeypatch.setattr(db, "backend", backends.SQLiteBackend(lambda tenant: primary))
+    monkeypatch.setattr(db, "_replica_cycle", itertools.cycle([replica]))
+    db.set_session(None)
+    with db.using_tenant(db.DEFAULT_TENANT):
+        db.init_db()
+        db.create_group_order("複製前")
+        shutil.copy(primary, replica)
+        db.create_group_order("只在主資料庫")
+        yield replica
+    db.set_session(None)
+
+
+def test_reads_use_replica(replica):
+    assert titles() == {"複製前"}
+    # 寫入及寫入後的讀取使用主資料庫
+    conn = db.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM group_orders").fetchone()[0] == 2
+    conn.close()
+
+
+def test_writes_pin_session_to_primary(replica, monkeypatch):
+    db.set_session("writer")
+    db.create_group_order("剛寫入")
+    assert titles() == {"複製前", "只在主資料庫", "剛寫入"}
+
+    # 其他 session 仍讀取副本
+    db.set_session("other")
+    assert titles() == {"複製前"}
+
+    # 超過 READ_YOUR_WRITES_SECONDS 後回到副本
+    db.set_session("writer")
+    monkeypatch.setattr(db, "READ_YOUR_WRITES_SECONDS", 0)
+    assert titles() == {"複製前"}
+
+
+def test_edit_version_is_read_from_primary(replica):
+    conn = db.get_connection()
+    group_order_id = conn.execute("SELECT id FROM group_orders WHERE title = '只在主資料庫'").fetchone()[0]
+    conn.close()
+    item = db.add_item(group_order_id, "豬肉", 100)
+    order = db.create_customer_order(group_order_id, "Amy", {item: 1})
+    db.update_customer_order(order, {item: 2})
+    shutil.copy(db.backend.path_for(db.DEFAULT_TENANT), replica)
+    # 他人剛修改：副本仍是舊版本
+    db.update_customer_order(order, {item: 3})
+    assert db.get_customer_order_by_id(order)['version'] == 1
+
+    edited, details = db.get_customer_order_for_edit(order)
+    assert edited['version'] == 2 and details[0]['quantity'] == 3
+    assert db.update_customer_order(order, {item: 4}, expected_version=edited['version'])
+
+
+def test_other_tenants_skip_sqlite_replica(replica, tmp_path, monkeypatch):
+    monkeypatch.setattr(db.backend, "path_for", lambda tenant: str(tmp_path / f"{tenant}.db"))
+    with db.using_tenant("alice"):
+        db.init_db()
+        db.create_group_order("alice")
+        assert titles() == {"alice"}
+
+
+def test_backends_without_replicas_ignore_configuration(tmp_path, monkeypatch):
+    missing = str(tmp_path / "missing.db")
+    monkeypatch.setattr(db, "backend", backends.MemoryBackend(db.tenant_db_path))
+    monkeypatch.setattr(db, "_replica_cycle", itertools.cycle([missing]))
+    assert not db.backend.supports_replicas
+    with db.using_tenant(db.DEFAULT_TENANT):
+        db.init_db()
+        db.create_group_order("記憶體")
+        assert titles() == {"記憶體"}
+    assert not os.path.exists(missing)
+    db.backend.reset()
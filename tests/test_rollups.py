@@ -0,0 +1,30 @@
+import database as db
+
+
+def login(at):
+    at.sidebar.radio[0].set_value("管理後台").run()
+    at.text_input[0].input("test")
+    at.button[0].click().run()
+    return at
+
+
+def test_ranking_with_only_deleted_items(tenant):
+    group_order_id = db.create_group_order("測試團")
+    removed = db.add_item(group_order_id, "停售", 30)
+    db.create_customer_order(group_order_id, "Amy", {removed: 2})
+    db.delete_item(removed)
+
+    assert [(r['orders'], r['amount']) for r in db.get_sales_trend("day")] == [(1, 0)]
+    assert db.get_top_sales("item", "day") == []
+    assert [r['amount'] for r in db.get_top_sales("customer", "day")] == [0]
+
+
+def test_analytics_tab_with_only_deleted_items(app_test):
+    group_order_id = db.create_group_order("測試團")
+    removed = db.add_item(group_order_id, "停售", 30)
+    db.create_customer_order(group_order_id, "Amy", {removed: 2})
+    db.delete_item(removed)
+
+    at = login(app_test.run())
+    assert not at.exception
+    assert "此期間沒有可排行的資料" in [i.value for i in at.info]
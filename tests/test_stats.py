@@ -0,0 +1,44 @@
+import database as db
+import live_stats
+import stats
+
+
+def test_statistics_follow_order_lines(tenant):
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    beef = db.add_item(group_order_id, "牛肉", 250)
+    db.add_item(group_order_id, "沒人買", 10)
+    amy = db.create_customer_order(group_order_id, "Amy", {pork: 2, beef: 1})
+    db.create_customer_order(group_order_id, "Bob", {beef: 2})
+    db.update_customer_order_paid_status(amy, 1)
+    db.update_item_price(pork, 120)
+
+    statistics = stats.group_order_statistics(group_order_id)
+    summary = statistics["summary"].set_index("item_name")
+    # 金額以下單時的單價計算，沒人買的品項數量為 0
+    assert summary.loc["豬肉", ["price", "total_qty", "total_amount"]].tolist() == [120, 2, 200]
+    assert summary.loc["沒人買", "total_qty"] == 0
+    assert statistics["customers"]["customer_name"].tolist() == ["Bob", "Amy"]
+    assert statistics["paid"].loc["已付款"].tolist() == [1, 450]
+    assert statistics["pivot"].loc["Amy"].tolist() == [2, 1]
+
+
+def test_paid_breakdown_counts_orders_without_live_lines(tenant):
+    """只買了已刪除品項的訂單仍計入訂單數 (金額 0)，與即時儀表板一致"""
+    group_order_id = db.create_group_order("測試團")
+    pork = db.add_item(group_order_id, "豬肉", 100)
+    removed = db.add_item(group_order_id, "停售", 30)
+    db.create_customer_order(group_order_id, "Amy", {pork: 1})
+    only_removed = db.create_customer_order(group_order_id, "Bob", {removed: 2})
+    db.update_customer_order_paid_status(only_removed, 1)
+    db.delete_item(removed)
+
+    statistics = stats.group_order_statistics(group_order_id)
+    live = live_stats.load_live_summary(group_order_id)
+    paid = statistics["paid"]
+    assert paid.loc["已付款"].tolist() == [1, 0]
+    assert paid.loc["未付款"].tolist() == [1, 100]
+    assert (paid.loc["已付款", "orders"], paid.loc["未付款", "orders"]) == (live["count"][True], live["count"][False])
+    assert (paid.loc["已付款", "total_amount"], paid.loc["未付款", "total_amount"]) == (
+        live["amount"][True], live["amount"][False]
+    )
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+import database as db
+import tenants
+from conftest import drop_tenant
+
+
+def test_tenants_are_isolated(tenant):
+    db.create_group_order("主辦者 A")
+    other = f"{tenant}_b"
+    try:
+        with db.using_tenant(other):
+            db.init_db()
+            assert db.get_all_group_orders() == []
+        assert len(db.get_all_group_orders()) == 1
+    finally:
+        drop_tenant(other)
+
+
+@pytest.mark.parametrize("tenant_id", ["Alice", "a-b", "../x", "", "x" * 33, None])
+def test_invalid_tenant_ids_are_rejected(tenant_id):
+    with pytest.raises(ValueError):
+        db.validate_tenant(tenant_id)
+
+
+def test_load_tenants(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenants, "TENANTS_FILE", str(tmp_path / "tenants.json"))
+    assert list(tenants.load_tenants()) == [db.DEFAULT_TENANT]
+
+    (tmp_path / "tenants.json").write_text(json.dumps({"alice": {"password": "pw"}}), encoding="utf-8")
+    assert tenants.load_tenants() == {"alice": {"name": "alice", "password": "pw"}}
+
+    (tmp_path / "tenants.json").write_text(json.dumps({"bob": {"name": "Bob"}}), encoding="utf-8")
+    with pytest.raises(ValueError, match="密碼"):
+        tenants.load_tenants()